@@ -91,6 +91,20 @@ class History(object):
         # Check that the current element is what was provided to the function.
         assert id(self.current_item) == id(item)
 
+    def pop_first(self):
+        """Remove and return the oldest item after the base item.
+
+        Only items that have been done (before the current position) can
+        be removed.
+
+        """
+        if self._index <= 1:
+            return None
+        item = self._history.pop(1)
+        self._index -= 1
+        self._check_index()
+        return item
+
     def back(self):
         """Go back in history if possible.
 
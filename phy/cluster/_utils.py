@@ -6,9 +6,16 @@
 # Imports
 #------------------------------------------------------------------------------
 
+from bisect import bisect_right
 from copy import deepcopy
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from functools import wraps
+from heapq import nlargest
 import logging
+from operator import itemgetter
+from threading import Event, Lock
+
+import numpy as np
 
 from ._history import History
 from phy.utils import Bunch, _as_list, _is_list, EventEmitter
@@ -235,3 +242,297 @@ class ClusterMeta(EventEmitter):
 
         self.emit('cluster', up)
         return up
+
+
+#------------------------------------------------------------------------------
+# Selection cache
+#------------------------------------------------------------------------------
+
+def _hashable(obj):
+    """Convert an argument to a hashable object."""
+    if isinstance(obj, np.ndarray):
+        return (obj.dtype.str, obj.shape, obj.tobytes())
+    elif isinstance(obj, (list, tuple)):
+        return tuple(_hashable(o) for o in obj)
+    elif isinstance(obj, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in obj.items()))
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _nbytes(obj):
+    """Number of bytes of all arrays in an object."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    return 0
+
+
+def _cluster_set(obj):
+    """Set of clusters in a function's first argument."""
+    if obj is None:
+        return frozenset()
+    elif isinstance(obj, (int, np.integer)):
+        return frozenset([int(obj)])
+    return frozenset(int(c) for c in obj)
+
+
+class SelectionCache(object):
+    """Cache of the data loaded for the selected clusters.
+
+    The data functions used by several views (spike selection, waveforms,
+    masks, features, etc.) can be memoized with `memoize()`. The first
+    argument of these functions (or their `cluster_id` or `cluster_ids`
+    keyword argument) must be a cluster id, a list of cluster ids, or None
+    for data that does not depend on the clusters.
+
+    When clusters are selected, the cached data of the clusters that are no
+    longer selected are discarded. The cached data of the clusters that are
+    deleted by a clustering action are discarded too. The least recently
+    used items are discarded when the cache contains more than `max_size`
+    bytes.
+
+    The cache is thread-safe: when several views request the same data
+    concurrently from their worker threads, the data is loaded only once.
+    The data loaded during a clustering action is not cached.
+
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size or 256 * 1024 ** 2
+        # Dictionary `{key: (clusters, nbytes, value)}`.
+        self._cache = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        # Dictionary `{key: event}` of the items being loaded.
+        self._loading = {}
+        # Incremented at every clustering change.
+        self._generation = 0
+        self.n_hits = self.n_misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def size(self):
+        """Total number of bytes in the cache."""
+        return self._size
+
+    def _discard(self, key):
+        _, nbytes, _ = self._cache.pop(key)
+        self._size -= nbytes
+
+    def _discard_if(self, cond):
+        with self._lock:
+            for key in [key for key, (clusters, _, _) in self._cache.items()
+                        if cond(clusters)]:
+                self._discard(key)
+
+    def get(self, name, f, *args, **kwargs):
+        """Return `f(*args, **kwargs)`, from the cache if possible."""
+        key = (name, _hashable(args), _hashable(kwargs))
+        while True:
+            with self._lock:
+                if key in self._cache:
+                    self.n_hits += 1
+                    # Move the item to the end of the LRU list.
+                    item = self._cache.pop(key)
+                    self._cache[key] = item
+                    return item[2]
+                event = self._loading.get(key, None)
+                if event is None:
+                    self.n_misses += 1
+                    event = self._loading[key] = Event()
+                    generation = self._generation
+                    break
+            # The item is being loaded in another thread: wait for it.
+            event.wait()
+        try:
+            value = f(*args, **kwargs)
+            clusters = _cluster_set(args[0] if args else
+                                    kwargs.get('cluster_ids',
+                                               kwargs.get('cluster_id',
+                                                          None)))
+            nbytes = _nbytes(value)
+            with self._lock:
+                # The data loaded while the clustering was changing may be
+                # inconsistent: it is not cached.
+                if generation != self._generation:
+                    return value
+                self._cache[key] = (clusters, nbytes, value)
+                self._size += nbytes
+                while self._size > self.max_size and len(self._cache) > 1:
+                    self._discard(next(iter(self._cache)))
+        finally:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+        return value
+
+    def memoize(self, f, name=None):
+        """Return a memoized version of a data function."""
+        name = name or getattr(f, '__name__', repr(f))
+
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            return self.get(name, f, *args, **kwargs)
+        return wrapped
+
+    def _log_stats(self):
+        n = self.n_hits + self.n_misses
+        if not n:
+            return
+        logger.debug("Selection cache: %d hits, %d misses (%.1f%%), "
+                     "%d items, %.1f MB.",
+                     self.n_hits, self.n_misses, 100. * self.n_hits / n,
+                     len(self._cache), self._size / 1024. ** 2)
+
+    def on_select(self, cluster_ids, **kwargs):
+        """Discard the data of the clusters that are no longer selected."""
+        self._log_stats()
+        self.n_hits = self.n_misses = 0
+        selected = _cluster_set(cluster_ids)
+        self._discard_if(lambda clusters: not clusters <= selected)
+
+    def on_cluster(self, up):
+        """Discard the data of the deleted clusters."""
+        deleted = _cluster_set(up.deleted)
+        if deleted:
+            with self._lock:
+                self._generation += 1
+            self._discard_if(lambda clusters: clusters & deleted)
+
+    def clear(self):
+        """Empty the cache."""
+        with self._lock:
+            self._cache.clear()
+            self._size = 0
+
+
+#------------------------------------------------------------------------------
+# Similarity index
+#------------------------------------------------------------------------------
+
+class SimilarityIndex(object):
+    """Most similar clusters of every cluster.
+
+    The index wraps a function `cluster_id => [(cluster, similarity), ...]`.
+    The similar clusters of a cluster are computed the first time they are
+    requested, and cached. If `k` is None, all clusters are stored, in the
+    order returned by the similarity function. Otherwise, only the `k` most
+    similar clusters are stored, in decreasing order of similarity.
+
+    The index must be notified of the clustering changes with
+    `on_cluster()`. The rows of the deleted clusters, and the entries that
+    point to them, are removed. A full row that loses entries is recomputed
+    lazily, since its next most similar clusters are unknown.
+
+    If the similarity is symmetric and `k` is set, the rows of the added
+    clusters are computed right away, and the added clusters are inserted
+    in all cached rows where they belong. Otherwise, the position of an
+    added cluster in the other rows is unknown, and all rows are
+    recomputed lazily after clusters are added.
+
+    Parameters
+    ----------
+
+    similarity : function
+        Function `cluster_id => [(cluster, similarity), ...]`.
+    cluster_ids : array-like
+        The existing clusters.
+    k : int or None
+        Number of similar clusters stored per cluster. If None (default),
+        all clusters are stored in the order of the similarity function.
+    symmetric : bool
+        Whether the similarity is symmetric.
+
+    """
+    def __init__(self, similarity, cluster_ids=(), k=None, symmetric=False):
+        self.similarity = similarity
+        self.k = k
+        self.symmetric = symmetric
+        self._cluster_ids = set(int(c) for c in cluster_ids)
+        # Dictionary `{cluster: [(cluster, similarity), ...]}`.
+        self._rows = {}
+        self.n_hits = self.n_misses = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _similarities(self, cluster_id):
+        """Return the similarities of a cluster with all existing
+        clusters."""
+        return [(int(c), s) for (c, s) in self.similarity(cluster_id)
+                if c != cluster_id and int(c) in self._cluster_ids]
+
+    def _top(self, sims):
+        if self.k is None:
+            return list(sims)
+        # NOTE: nlargest() is stable, so the order of the function output
+        # is kept for equal similarities.
+        return nlargest(self.k, sims, key=itemgetter(1))
+
+    def _compute(self, cluster_id):
+        row = self._top(self._similarities(cluster_id))
+        self._rows[cluster_id] = row
+        return row
+
+    def get(self, cluster_id):
+        """Return the list of the most similar clusters as pairs
+        `(cluster, similarity)`."""
+        cluster_id = int(cluster_id)
+        row = self._rows.get(cluster_id, None)
+        if row is None:
+            self.n_misses += 1
+            row = self._compute(cluster_id)
+        else:
+            self.n_hits += 1
+        return [(c, s) for (c, s) in row if c in self._cluster_ids]
+
+    def _insert(self, cluster_id, other, sim):
+        """Insert a cluster in the row of another cluster."""
+        row = self._rows.get(other, None)
+        if row is None or any(c == cluster_id for (c, _) in row):
+            return
+        if len(row) >= self.k and sim <= row[-1][1]:
+            return
+        # The row is sorted by decreasing similarity.
+        i = bisect_right([-s for (_, s) in row], -sim)
+        row.insert(i, (cluster_id, sim))
+        del row[self.k:]
+
+    def on_cluster(self, up):
+        """Update the index after a clustering action."""
+        if not up.added and not up.deleted:
+            return
+        deleted = set(int(c) for c in up.deleted)
+        added = [int(c) for c in up.added]
+        self._cluster_ids -= deleted
+        self._cluster_ids.update(added)
+        if added and (self.k is None or not self.symmetric):
+            # The position of a new cluster in the rows is unknown.
+            self._rows.clear()
+            return
+        for cluster_id in list(self._rows):
+            if cluster_id in deleted:
+                del self._rows[cluster_id]
+                continue
+            row = self._rows[cluster_id]
+            new_row = [(c, s) for (c, s) in row if c not in deleted]
+            full = self.k is not None and len(row) >= self.k
+            if len(new_row) < len(row) and full:
+                # The next most similar clusters of a full row are
+                # unknown: the row will be recomputed.
+                del self._rows[cluster_id]
+            else:
+                self._rows[cluster_id] = new_row
+        for cluster_id in added:
+            sims = self._similarities(cluster_id)
+            self._rows[cluster_id] = self._top(sims)
+            # The new cluster may belong to any cached row, not only to
+            # the rows of its own most similar clusters.
+            for other, sim in sims:
+                self._insert(cluster_id, other, sim)
@@ -14,6 +14,7 @@ from phy.utils._types import _as_array, _is_array_like
 from phy.io.array import (_unique,
                           _spikes_in_clusters,
                           _spikes_per_cluster,
+                          SpikesPerCluster,
                           )
 from ._utils import UpdateInfo
 from ._history import History
@@ -26,7 +27,7 @@ logger = logging.getLogger(__name__)
 # Clustering class
 #------------------------------------------------------------------------------
 
-def _extend_spikes(spike_ids, spike_clusters):
+def _extend_spikes(spike_ids, spike_clusters, spikes_per_cluster=None):
     """Return all spikes belonging to the clusters containing the specified
     spikes."""
     # We find the spikes belonging to modified clusters.
@@ -34,7 +35,8 @@ def _extend_spikes(spike_ids, spike_clusters):
     old_spike_clusters = spike_clusters[spike_ids]
     unique_clusters = _unique(old_spike_clusters)
     # Now we take all spikes from these clusters.
-    changed_spike_ids = _spikes_in_clusters(spike_clusters, unique_clusters)
+    changed_spike_ids = _spikes_in_clusters(spike_clusters, unique_clusters,
+                                            spikes_per_cluster)
     # These are the new spikes that need to be reassigned.
     extended_spike_ids = np.setdiff1d(changed_spike_ids, spike_ids,
                                       assume_unique=True)
@@ -55,6 +57,7 @@ def _extend_assignment(spike_ids,
                        old_spike_clusters,
                        spike_clusters_rel,
                        new_cluster_id,
+                       spikes_per_cluster=None,
                        ):
     # 1. Add spikes that belong to modified clusters.
     # 2. Find new cluster ids for all changed clusters.
@@ -71,7 +74,8 @@ def _extend_assignment(spike_ids,
                           (new_cluster_id - spike_clusters_rel.min()))
 
     # We find the spikes belonging to modified clusters.
-    extended_spike_ids = _extend_spikes(spike_ids, old_spike_clusters)
+    extended_spike_ids = _extend_spikes(spike_ids, old_spike_clusters,
+                                        spikes_per_cluster)
     if len(extended_spike_ids) == 0:
         return spike_ids, new_spike_clusters
 
@@ -91,6 +95,22 @@ def _extend_assignment(spike_ids,
                                         extended_spike_clusters))
 
 
+def _old_spike_clusters(spike_ids, old_clusters):
+    """Return the cluster ids of spikes before an action, from the inverse
+    delta stored in the undo stack.
+
+    This is either an array with the old cluster of every spike, or, for
+    merges, a dictionary `{cluster: spike_ids}` with the merged clusters.
+
+    """
+    if not isinstance(old_clusters, dict):
+        return old_clusters
+    out = np.empty(len(spike_ids), dtype=np.int64)
+    for clu, spikes in old_clusters.items():
+        out[np.searchsorted(spike_ids, spikes)] = clu
+    return out
+
+
 def _assign_update_info(spike_ids, old_spike_clusters, new_spike_clusters):
     old_clusters = _unique(old_spike_clusters)
     new_clusters = _unique(new_spike_clusters)
@@ -116,14 +136,22 @@ class Clustering(EventEmitter):
     * Dictionary of spikes per cluster
     * Merge
     * Split and assign
-    * Undo/redo stack
+    * Undo/redo stack, with optional checkpoints
+    * Index of the sorted spike times of every cluster (optional)
 
     Notes
     -----
 
-    The undo stack works by keeping the list of all spike cluster changes
-    made successively. Undoing consists of reapplying all changes from the
-    original `spike_clusters` array, except the last one.
+    The undo stack keeps the delta of every action: the affected spikes,
+    their new clusters, and their old clusters (or, for merges, just the
+    spikes of the merged clusters). Undoing and redoing consist of applying
+    the last delta backward or forward, so that their cost only depends on
+    the size of the change, not on the length of the history.
+
+    With `checkpoint_size`, the memory used by the undo stack is bounded:
+    the oldest actions are folded into the base clustering as soon as the
+    undo stack contains more than `checkpoint_size` spikes, and they can no
+    longer be undone.
 
     UpdateInfo
     ----------
@@ -156,17 +184,34 @@ class Clustering(EventEmitter):
     """
 
     def __init__(self, spike_clusters, new_cluster_id=None,
-                 spikes_per_cluster=None):
+                 spikes_per_cluster=None, spike_times=None,
+                 checkpoint_size=None):
         super(Clustering, self).__init__()
-        self._undo_stack = History(base_item=(None, None, None))
+        # Every item of the undo stack contains the delta of an action:
+        # `(spike_ids, new_clusters, old_clusters, undo_state)`.
+        self._undo_stack = History(base_item=(None, None, None, None))
+        # Number of spikes in the done actions of the undo stack.
+        self._undo_size = 0
+        # Maximum number of spikes stored in the undo stack. Older actions
+        # are folded into the base clustering beyond that size.
+        self._checkpoint_size = checkpoint_size
         # Spike -> cluster mapping.
         self._spike_clusters = _as_array(spike_clusters)
         self._spikes_per_cluster = {}
+        # Optional sorted spike times, and lazy index of the spike times
+        # of every cluster.
+        self._spike_times = spike_times
+        self._spike_times_per_cluster = {}
         self._n_spikes = len(self._spike_clusters)
         self._spike_ids = np.arange(self._n_spikes).astype(np.int64)
         # We can pass the precomputed spikes_per_cluster dictionary for
-        # performance reasons.
-        self._update_cluster_ids(to_add=spikes_per_cluster)
+        # performance reasons. A `SpikesPerCluster` store is used directly,
+        # so that the spikes of a cluster are only loaded when needed.
+        if isinstance(spikes_per_cluster, SpikesPerCluster):
+            self._spikes_per_cluster = spikes_per_cluster
+        elif spikes_per_cluster:
+            self._spikes_per_cluster.update(spikes_per_cluster)
+        self._update_all_cluster_ids()
         self._new_cluster_id_0 = int(new_cluster_id or
                                      self._spike_clusters.max() + 1)
         self._new_cluster_id = self._new_cluster_id_0
@@ -181,13 +226,21 @@ class Clustering(EventEmitter):
         All changes are lost.
 
         """
-        self._undo_stack.clear()
-        self._spike_clusters = self._spike_clusters_base
+        self._undo_stack.clear(base_item=(None, None, None, None))
+        self._undo_size = 0
+        self._spike_clusters = self._spike_clusters_base.copy()
         self._new_cluster_id = self._new_cluster_id_0
+        self._update_cluster_ids()
 
     @property
     def spike_clusters(self):
-        """A n_spikes-long vector containing the cluster ids of all spikes."""
+        """A n_spikes-long vector containing the cluster ids of all spikes.
+
+        The cluster ids and spikes_per_cluster are updated incrementally by
+        the clustering actions. If this array is modified in place,
+        `_update_cluster_ids()` must be called before the next action.
+
+        """
         return self._spike_clusters
 
     @property
@@ -228,22 +281,73 @@ class Clustering(EventEmitter):
 
     def spikes_in_clusters(self, clusters):
         """Return the array of spike ids belonging to a list of clusters."""
-        return _spikes_in_clusters(self.spike_clusters, clusters)
+        return _spikes_in_clusters(self._spike_clusters, clusters)
+
+    def spike_times_per_cluster(self, cluster_id):
+        """Return the sorted spike times of a cluster.
+
+        This requires the `spike_times` argument. The spike times of every
+        cluster are kept in an index that is updated after every clustering
+        action, so that only the spikes of the requested clusters are
+        accessed.
+
+        """
+        if self._spike_times is None:
+            raise ValueError("The spike times were not specified.")
+        times = self._spike_times_per_cluster.get(cluster_id, None)
+        if times is None:
+            spike_ids = self._spikes_per_cluster[cluster_id]
+            times = np.asarray(self._spike_times[spike_ids])
+            self._spike_times_per_cluster[cluster_id] = times
+        return times
 
     # Actions
     #--------------------------------------------------------------------------
 
     def _update_cluster_ids(self, to_remove=None, to_add=None):
-        # Update the list of non-empty cluster ids.
-        self._cluster_ids = _unique(self._spike_clusters)
+        """Update the cluster ids and spikes_per_cluster.
+
+        Without arguments, the cluster ids and spikes_per_cluster are
+        recomputed from the spike_clusters array. Otherwise, they are
+        updated from the removed and added clusters, so that the cost does
+        not depend on the total number of spikes.
+
+        """
+        if to_remove is None and to_add is None:
+            self._spike_times_per_cluster = {}
+            self._spikes_per_cluster.clear()
+            self._update_all_cluster_ids()
+            return
         # Clusters to remove.
         if to_remove is not None:
             for clu in to_remove:
                 self._spikes_per_cluster.pop(clu, None)
+                self._spike_times_per_cluster.pop(clu, None)
         # Clusters to add.
         if to_add:
             for clu, spk in to_add.items():
                 self._spikes_per_cluster[clu] = spk
+        # Update the sorted list of non-empty cluster ids.
+        cluster_ids = self._cluster_ids
+        if to_remove is not None and len(to_remove):
+            cluster_ids = cluster_ids[~np.in1d(cluster_ids, to_remove)]
+        if to_add:
+            cluster_ids = np.union1d(cluster_ids, list(to_add))
+        self._cluster_ids = cluster_ids.astype(np.int64)
+        # Costly consistency check, only in debug mode.
+        if logger.isEnabledFor(5):
+            self._check_cluster_ids()
+
+    def _check_cluster_ids(self):
+        assert np.array_equal(self._cluster_ids,
+                              _unique(self._spike_clusters))
+        for clu in self._cluster_ids:
+            spikes = self._spikes_per_cluster[clu]
+            assert np.all(self._spike_clusters[spikes] == clu)
+
+    def _update_all_cluster_ids(self):
+        # Update the list of non-empty cluster ids.
+        self._cluster_ids = _unique(self._spike_clusters)
         # If spikes_per_cluster is invalid, recompute the entire
         # spikes_per_cluster array.
         coherent = np.all(np.in1d(self._cluster_ids,
@@ -253,7 +357,8 @@ class Clustering(EventEmitter):
             logger.debug("Recompute spikes_per_cluster manually: "
                          "this is long.")
             sc = self._spike_clusters
-            self._spikes_per_cluster = _spikes_per_cluster(sc)
+            self._spikes_per_cluster.clear()
+            self._spikes_per_cluster.update(_spikes_per_cluster(sc))
 
     def _do_assign(self, spike_ids, new_spike_clusters):
         """Make spike-cluster assignments after the spike selection has
@@ -309,14 +414,62 @@ class Clustering(EventEmitter):
         # We update the new cluster id (strictly increasing during a session).
         self._new_cluster_id = max(max(up.added) + 1, self._new_cluster_id)
 
+        # Merge the spike times of the merged clusters, if they are in the
+        # index. The spike times are sorted so that they match the sorted
+        # spike ids.
+        times = [self._spike_times_per_cluster.get(clu, None)
+                 for clu in cluster_ids]
+        if times and all(t is not None for t in times):
+            self._spike_times_per_cluster[to] = np.sort(np.concatenate(times),
+                                                        kind='mergesort')
+
         # Assign the clusters.
-        self.spike_clusters[spike_ids] = to
+        self._spike_clusters[spike_ids] = to
         # Update the list of non-empty cluster ids.
         # OPTIM: we update spikes_per_cluster manually.
         self._update_cluster_ids(to_remove=cluster_ids,
                                  to_add={to: spike_ids})
         return up
 
+    def _add_to_stack(self, spike_ids, new_clusters, old_clusters,
+                      undo_state):
+        """Add the delta of an action to the undo stack, and fold the
+        oldest actions into the base clustering if the undo stack is
+        too large."""
+        self._undo_stack.add((spike_ids, new_clusters, old_clusters,
+                              undo_state))
+        self._undo_size += len(spike_ids)
+        if self._checkpoint_size is None:
+            return
+        while self._undo_size > self._checkpoint_size:
+            item = self._undo_stack.pop_first()
+            if item is None:
+                break
+            spike_ids, new_clusters, _, _ = item
+            self._undo_size -= len(spike_ids)
+            self._spike_clusters_base[spike_ids] = new_clusters
+            # The base clustering may now contain new cluster ids, which
+            # must not be reused after a reset.
+            self._new_cluster_id_0 = self._new_cluster_id
+
+    @property
+    def undo_size(self):
+        """Number of spikes stored in the done actions of the undo
+        stack."""
+        return self._undo_size
+
+    def checkpoint(self):
+        """Make the current clustering the base clustering.
+
+        The undo stack is cleared, and `reset()` returns to this
+        clustering from now on.
+
+        """
+        self._undo_stack.clear(base_item=(None, None, None, None))
+        self._undo_size = 0
+        self._spike_clusters_base = self._spike_clusters.copy()
+        self._new_cluster_id_0 = self._new_cluster_id
+
     def merge(self, cluster_ids, to=None):
         """Merge several clusters to a new cluster.
 
@@ -356,13 +509,18 @@ class Clustering(EventEmitter):
         # cheaper operation.
 
         # Find all spikes in the specified clusters.
-        spike_ids = _spikes_in_clusters(self.spike_clusters, cluster_ids)
+        spike_ids = _spikes_in_clusters(self._spike_clusters, cluster_ids,
+                                        self._spikes_per_cluster)
+        # The inverse of a merge only requires the spikes of the merged
+        # clusters, which are kept by reference.
+        old_clusters = {clu: self._spikes_per_cluster[clu]
+                        for clu in cluster_ids}
 
         up = self._do_merge(spike_ids, cluster_ids, to)
         undo_state = self.emit('request_undo_state', up)
 
         # Add to stack.
-        self._undo_stack.add((spike_ids, [to], undo_state))
+        self._add_to_stack(spike_ids, [to], old_clusters, undo_state)
 
         self.emit('cluster', up)
         return up
@@ -434,13 +592,15 @@ class Clustering(EventEmitter):
                                                     self._spike_clusters,
                                                     spike_clusters_rel,
                                                     self.new_cluster_id(),
+                                                    self._spikes_per_cluster,
                                                     )
 
+        old_clusters = self._spike_clusters[spike_ids]
         up = self._do_assign(spike_ids, cluster_ids)
         undo_state = self.emit('request_undo_state', up)
 
         # Add the assignment to the undo stack.
-        self._undo_stack.add((spike_ids, cluster_ids, undo_state))
+        self._add_to_stack(spike_ids, cluster_ids, old_clusters, undo_state)
 
         self.emit('cluster', up)
         return up
@@ -483,23 +643,16 @@ class Clustering(EventEmitter):
         up : UpdateInfo instance of the changes done by this operation.
 
         """
-        _, _, undo_state = self._undo_stack.back()
-
-        # Retrieve the initial spike_cluster structure.
-        spike_clusters_new = self._spike_clusters_base.copy()
-
-        # Loop over the history (except the last item because we undo).
-        for spike_ids, cluster_ids, _ in self._undo_stack:
-            # We update the spike clusters accordingly.
-            if spike_ids is not None:
-                spike_clusters_new[spike_ids] = cluster_ids
-
-        # What are the spikes affected by the last changes?
-        changed = np.nonzero(self._spike_clusters !=
-                             spike_clusters_new)[0]
-        clusters_changed = spike_clusters_new[changed]
+        item = self._undo_stack.back()
+        if item is None:
+            # No undo has been performed: abort.
+            return
+        spike_ids, _, old_clusters, undo_state = item
+        self._undo_size -= len(spike_ids)
 
-        up = self._do_assign(changed, clusters_changed)
+        # We apply the inverse delta of the last action.
+        up = self._do_assign(spike_ids,
+                             _old_spike_clusters(spike_ids, old_clusters))
         up.history = 'undo'
         # Add the undo_state object from the undone object.
         up.undo_state = undo_state
@@ -526,8 +679,9 @@ class Clustering(EventEmitter):
         # It represents data associated to the state
         # *before* the action. What might be more useful would be the
         # undo_state object of the next item in the list (if it exists).
-        spike_ids, cluster_ids, undo_state = item
+        spike_ids, cluster_ids, _, undo_state = item
         assert spike_ids is not None
+        self._undo_size += len(spike_ids)
 
         # We apply the new assignment.
         up = self._do_assign(spike_ids, cluster_ids)
@@ -10,13 +10,15 @@
 from collections import OrderedDict
 from functools import partial
 import logging
+import os.path as op
 
 import numpy as np
 from six import string_types
 
 from ._history import GlobalHistory
-from ._utils import create_cluster_meta
+from ._utils import create_cluster_meta, SelectionCache, SimilarityIndex
 from .clustering import Clustering
+from phy.io.array import Selector, SpikesPerCluster
 from phy.utils import EventEmitter
 from phy.gui.actions import Actions
 from phy.gui.widgets import Table
@@ -80,9 +82,26 @@ class Supervisor(EventEmitter):
 
     spike_clusters : ndarray
     cluster_groups : dictionary
+    spike_times : ndarray (optional, used for the spike times index)
     shortcuts : dict
     quality: func
     similarity: func
+    n_similar : int or None
+        If None (default), all clusters are shown in the similarity view,
+        in the order returned by the similarity function, and the
+        similarity index is recomputed after every clustering action that
+        adds clusters. Otherwise, number of similar clusters stored per
+        cluster in the similarity index, and shown in the similarity view,
+        in decreasing order of similarity.
+    symmetric_similarity : bool
+        Whether the similarity function is symmetric. If True and
+        `n_similar` is set, the added clusters are inserted in the cached
+        rows of the similarity index after clustering actions, instead of
+        recomputing these rows.
+    selection_cache_size : int
+        Maximum number of bytes of the selection cache, which contains the
+        data shared by the views for the selected clusters (see
+        `memoize()`).
 
     GUI events
     ----------
@@ -141,6 +160,10 @@ class Supervisor(EventEmitter):
                  similarity=None,
                  new_cluster_id=None,
                  context=None,
+                 spike_times=None,
+                 selection_cache_size=None,
+                 n_similar=None,
+                 symmetric_similarity=False,
                  ):
         super(Supervisor, self).__init__()
         self.context = context
@@ -155,11 +178,14 @@ class Supervisor(EventEmitter):
         self.shortcuts.update(shortcuts or {})
 
         # Create Clustering and ClusterMeta.
-        # Load the cached spikes_per_cluster array.
-        spc = context.load('spikes_per_cluster') if context else None
+        # Open the cached spikes_per_cluster store.
+        spc = (SpikesPerCluster(op.join(context.cache_dir,
+                                        'spikes_per_cluster'))
+               if context else None)
         self.clustering = Clustering(spike_clusters,
                                      spikes_per_cluster=spc,
-                                     new_cluster_id=new_cluster_id)
+                                     new_cluster_id=new_cluster_id,
+                                     spike_times=spike_times)
         # Cache the spikes_per_cluster array.
         self._save_spikes_per_cluster()
 
@@ -169,6 +195,15 @@ class Supervisor(EventEmitter):
 
         self.cluster_meta.add_field('next_cluster')
 
+        # Index of the most similar clusters, updated before the cluster
+        # views after clustering actions.
+        self.similarity_index = (SimilarityIndex(
+            similarity, self.clustering.cluster_ids, k=n_similar,
+            symmetric=symmetric_similarity)
+            if similarity else None)
+        if self.similarity_index is not None:
+            self.clustering.connect(self.similarity_index.on_cluster)
+
         @self.clustering.connect
         def on_cluster(up):
             """Register the next cluster in the list before the cluster
@@ -185,15 +220,25 @@ class Supervisor(EventEmitter):
         # NOTE: global on_cluster() occurs here.
         self._register_logging()
 
+        # Cache of the data shared by the views for the selected clusters.
+        # It is updated before the GUI receives the events.
+        self.selection_cache = SelectionCache(max_size=selection_cache_size)
+        self.connect(self.selection_cache.on_select)
+        self.connect(self.selection_cache.on_cluster)
+
+        # Selection of spikes in the selected clusters, shared by the views.
+        self.selector = Selector(
+            lambda cluster_id: self.clustering.spikes_per_cluster[cluster_id])
+        self.selector.select_spikes = self.selection_cache.memoize(
+            self.selector.select_spikes, name='select_spikes')
+
     # Internal methods
     # -------------------------------------------------------------------------
 
     def _save_spikes_per_cluster(self):
+        # Only the clusters changed since the last save are written.
         if self.context:
-            self.context.save('spikes_per_cluster',
-                              self.clustering.spikes_per_cluster,
-                              kind='pickle',
-                              )
+            self.clustering.spikes_per_cluster.save()
 
     def _register_logging(self):
         # Log the actions.
@@ -376,9 +421,16 @@ class Supervisor(EventEmitter):
 
         self._update_cluster_view()
 
-    def _update_cluster_view(self):
-        """Initialize the cluster view with cluster data."""
+    def _update_cluster_view(self, up=None):
+        """Initialize the cluster view with cluster data, or only update
+        the rows affected by a clustering action."""
         logger.log(5, "Update the cluster view.")
+        if up is not None:
+            self.cluster_view.update_rows(added=up.added,
+                                          deleted=up.deleted,
+                                          changed=up.metadata_changed,
+                                          )
+            return
         cluster_ids = [int(c) for c in self.clustering.cluster_ids]
         self.cluster_view.set_rows(cluster_ids)
 
@@ -391,37 +443,40 @@ class Supervisor(EventEmitter):
         if not len(selection):
             return
         cluster_id = selection[0]
-        cluster_ids = self.clustering.cluster_ids
         self._best = cluster_id
         logger.log(5, "Update the similarity view.")
-        # This is a list of pairs (closest_cluster, similarity).
-        similarities = self.similarity(cluster_id)
+        # This is a list of pairs (closest_cluster, similarity), restricted
+        # to the existing clusters.
+        similarities = self.similarity_index.get(cluster_id)
         # We save the similarity values wrt the currently-selected clusters.
-        # Note that we keep the order of the output of the self.similary()
-        # function.
-        clusters_sim = OrderedDict([(int(cl), s) for (cl, s) in similarities])
-        # List of similar clusters, remove non-existing ones.
-        clusters = [c for c in clusters_sim.keys()
-                    if c in cluster_ids]
+        # Note that the order of the output of the self.similarity()
+        # function is only kept if n_similar is None.
+        clusters_sim = OrderedDict(similarities)
+        clusters = list(clusters_sim.keys())
         # The similarity view will use these values.
         self._current_similarity_values = clusters_sim
         # Set the rows of the similarity view.
         # TODO: instead of the self._current_similarity_values hack,
         # give the possibility to specify the values here (?).
+        selection = set(selection)
         self.similarity_view.set_rows([c for c in clusters
                                        if c not in selection])
 
     # Public methods
     # -------------------------------------------------------------------------
 
-    def add_column(self, func=None, name=None, show=True, default=False):
+    def add_column(self, func=None, name=None, show=True, default=False,
+                   vectorized=False):
         if func is None:
             return lambda f: self.add_column(f, name=name, show=show,
-                                             default=default)
+                                             default=default,
+                                             vectorized=vectorized)
         name = name or func.__name__
         assert name
-        self.cluster_view.add_column(func, name=name, show=show)
-        self.similarity_view.add_column(func, name=name, show=show)
+        self.cluster_view.add_column(func, name=name, show=show,
+                                     vectorized=vectorized)
+        self.similarity_view.add_column(func, name=name, show=show,
+                                        vectorized=vectorized)
         if default:
             self.set_default_sort(name)
 
@@ -440,9 +495,9 @@ class Supervisor(EventEmitter):
 
         similar = self.similarity_view.selected
 
-        # Reinitialize the cluster view if clusters have changed.
+        # Update the cluster view if clusters have changed.
         if up.added:
-            self._update_cluster_view()
+            self._update_cluster_view(up)
 
         # Select all new clusters in view 1.
         if up.history == 'undo':
@@ -473,7 +528,7 @@ class Supervisor(EventEmitter):
                     self.similarity_view.select([next_cluster])
             # Otherwise, select next in cluster view.
             else:
-                self._update_cluster_view()
+                self._update_cluster_view(up)
                 # Determine if there is a next cluster set from a
                 # previous clustering action.
                 cluster = up.metadata_changed[0]
@@ -535,6 +590,12 @@ class Supervisor(EventEmitter):
         def on_request_split():
             return gui.emit('request_split', single=True)
 
+        # The GUI emits the cluster event too, so that the views can update
+        # their caches before the selection changes.
+        def _forward_cluster(up):
+            gui.emit('cluster', up)
+        self.connect(_forward_cluster, event='cluster')
+
         # Save the view state in the GUI state.
         @gui.connect_
         def on_close():
@@ -550,6 +611,23 @@ class Supervisor(EventEmitter):
 
         return self
 
+    # Data loading
+    # -------------------------------------------------------------------------
+
+    def memoize(self, f, name=None):
+        """Share a data function between the views through the selection
+        cache.
+
+        The first argument of the function (or its `cluster_id` or
+        `cluster_ids` keyword argument) must be a cluster id, a list of
+        cluster ids, or None. The data is loaded once per selection for
+        the same arguments, even when several views request it at the same
+        time from their worker threads (for example, the masks used by
+        both the waveform view and the feature view).
+
+        """
+        return self.selection_cache.memoize(f, name=name)
+
     # Selection actions
     # -------------------------------------------------------------------------
 
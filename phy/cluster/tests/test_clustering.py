@@ -6,12 +6,15 @@
 # Imports
 #------------------------------------------------------------------------------
 
+import logging
+import os.path as op
+
 import numpy as np
 from numpy.testing import assert_array_equal as ae
 from pytest import raises
 
 from phy.io.mock import artificial_spike_clusters
-from phy.io.array import (_spikes_in_clusters,)
+from phy.io.array import (_spikes_in_clusters, SpikesPerCluster)
 from ..clustering import (_extend_spikes,
                           _concatenate_spike_clusters,
                           _extend_assignment,
@@ -213,6 +216,79 @@ def test_clustering_descendants_split():
     ae(clustering.spike_clusters, [8, 5, 3, 9, 7, 5, 9])
 
 
+def test_clustering_spike_times():
+    n_spikes = 1000
+    spike_clusters = artificial_spike_clusters(n_spikes, 10)
+    spike_times = np.cumsum(np.random.randint(1, 10, n_spikes))
+
+    accessed = []
+
+    class _Times(object):
+        def __getitem__(self, item):
+            accessed.append(len(np.atleast_1d(item)))
+            return spike_times[item]
+
+    clustering = Clustering(spike_clusters, spike_times=_Times())
+
+    def _check(cluster_ids=None):
+        for c in (clustering.cluster_ids if cluster_ids is None
+                  else cluster_ids):
+            spikes = clustering.spikes_per_cluster[c]
+            ae(clustering.spike_times_per_cluster(c), spike_times[spikes])
+
+    # The index is built lazily and only for the requested clusters.
+    _check([2, 3])
+    assert sum(accessed) == len(clustering.spikes_per_cluster[2]) + \
+        len(clustering.spikes_per_cluster[3])
+
+    # The merged cluster's times are derived from the parents' times.
+    del accessed[:]
+    up = clustering.merge([2, 3])
+    _check(up.added)
+    assert not accessed
+
+    clustering.split(np.arange(0, n_spikes, 3))
+    _check()
+    clustering.undo()
+    _check()
+    clustering.undo()
+    _check()
+    clustering.redo()
+    _check()
+
+    # Without spike times, there is no index.
+    with raises(ValueError):
+        Clustering(spike_clusters).spike_times_per_cluster(2)
+
+
+def test_clustering_store(tempdir):
+    path = op.join(tempdir, 'spc')
+    spike_clusters = artificial_spike_clusters(1000, 20)
+
+    # The store is filled on the first run.
+    clustering = Clustering(spike_clusters,
+                            spikes_per_cluster=SpikesPerCluster(path))
+    _check_spikes_per_cluster(clustering)
+    clustering.spikes_per_cluster.save()
+
+    # Then it is used directly.
+    clustering = Clustering(spike_clusters,
+                            spikes_per_cluster=SpikesPerCluster(path))
+    assert not clustering.spikes_per_cluster._added
+    _check_spikes_per_cluster(clustering)
+
+    _random_actions(clustering, 10)
+    _check_spikes_per_cluster(clustering)
+    clustering.spikes_per_cluster.save()
+    spike_clusters = clustering.spike_clusters.copy()
+    clustering.undo()
+
+    clustering = Clustering(spike_clusters,
+                            spikes_per_cluster=SpikesPerCluster(path))
+    assert not clustering.spikes_per_cluster._added
+    _check_spikes_per_cluster(clustering)
+
+
 def test_clustering_merge():
     n_spikes = 1000
     n_clusters = 10
@@ -475,6 +551,7 @@ def test_clustering_long():
     # Merge to a given cluster.
     clustering.spike_clusters[:] = spike_clusters_base[:]
     clustering._new_cluster_id = 11
+    clustering._update_cluster_ids()
 
     my_spikes_0 = np.nonzero(np.in1d(clustering.spike_clusters, [4, 6]))[0]
     info = clustering.merge([4, 6], 11)
@@ -493,3 +570,133 @@ def test_clustering_long():
     clustering.assign(my_spikes, clusters)
     clu = clustering.spike_clusters[my_spikes]
     ae(clu - clu[0], clusters)
+
+
+def _random_actions(clustering, n_actions):
+    """Perform random merges and splits, and return the successive
+    spike_clusters arrays."""
+    states = [clustering.spike_clusters.copy()]
+    n_spikes = len(clustering.spike_clusters)
+    for i in range(n_actions):
+        if i % 2 == 0 and clustering.n_clusters >= 2:
+            clusters = np.random.choice(clustering.cluster_ids, 2,
+                                        replace=False)
+            clustering.merge(clusters)
+        else:
+            spikes = np.unique(np.random.randint(0, n_spikes, 20))
+            clustering.split(spikes)
+        states.append(clustering.spike_clusters.copy())
+    return states
+
+
+def _check_spikes_per_cluster(clustering):
+    sc = clustering.spike_clusters
+    for c in clustering.cluster_ids:
+        ae(clustering.spikes_per_cluster[c], np.nonzero(sc == c)[0])
+
+
+def test_clustering_undo_delta():
+    n_spikes = 1000
+    spike_clusters = artificial_spike_clusters(n_spikes, 20)
+    clustering = Clustering(spike_clusters)
+
+    states = _random_actions(clustering, 20)
+
+    # Undo everything.
+    for state in states[-2::-1]:
+        up = clustering.undo()
+        assert up.history == 'undo'
+        ae(clustering.spike_clusters, state)
+        _check_spikes_per_cluster(clustering)
+    # Nothing left to undo.
+    assert clustering.undo() is None
+
+    # Redo everything.
+    for state in states[1:]:
+        up = clustering.redo()
+        assert up.history == 'redo'
+        ae(clustering.spike_clusters, state)
+        _check_spikes_per_cluster(clustering)
+    assert clustering.redo() is None
+
+
+def _undo_size(clustering):
+    """Number of spikes in the done actions, from the undo stack."""
+    return sum(len(item[0]) for item in clustering._undo_stack
+               if item[0] is not None)
+
+
+def test_clustering_checkpoint():
+    n_spikes = 1000
+    spike_clusters = artificial_spike_clusters(n_spikes, 20)
+    clustering = Clustering(spike_clusters, checkpoint_size=500)
+
+    states = _random_actions(clustering, 20)
+    # The last action is always kept.
+    assert (clustering.undo_size <= 500 or
+            len(clustering._undo_stack) == 2)
+
+    # We can only undo the most recent actions.
+    n_undo = 0
+    while clustering.undo() is not None:
+        n_undo += 1
+        assert clustering.undo_size == _undo_size(clustering)
+    assert 0 < n_undo < 20
+    ae(clustering.spike_clusters, states[-1 - n_undo])
+    _check_spikes_per_cluster(clustering)
+
+    # Resetting goes back to the last checkpoint.
+    clustering.redo()
+    assert clustering.undo_size == _undo_size(clustering)
+    clustering.reset()
+    ae(clustering.spike_clusters, states[-1 - n_undo])
+
+    # Explicit checkpoint.
+    clustering = Clustering(spike_clusters)
+    states = _random_actions(clustering, 4)
+    clustering.checkpoint()
+    assert clustering.undo_size == 0
+    assert clustering.undo() is None
+    clustering.reset()
+    ae(clustering.spike_clusters, states[-1])
+
+
+def test_clustering_checkpoint_reset():
+    # Checkpoint then reset: the new cluster ids are not reused.
+    clustering = Clustering([0, 0, 1, 1, 2, 2])
+    assert clustering.merge([0, 1]).added == [3]
+    clustering.checkpoint()
+    clustering.reset()
+    assert clustering.new_cluster_id() == 4
+    up = clustering.merge([2])
+    assert up.added == [4]
+    ae(clustering.spike_clusters, [3, 3, 3, 3, 4, 4])
+
+    # Same thing with the automatic checkpoints.
+    clustering = Clustering([0, 0, 1, 1, 2, 2], checkpoint_size=1)
+    clustering.merge([0, 1])
+    clustering.merge([2, 3])
+    clustering.reset()
+    assert clustering.undo_size == 0
+    assert clustering.new_cluster_id() == 5
+    up = clustering.merge([2])
+    assert up.added == [5]
+    assert 5 in clustering.cluster_ids
+    _check_spikes_per_cluster(clustering)
+
+
+def test_clustering_cluster_ids_check():
+    logger = logging.getLogger('phy.cluster.clustering')
+    level = logger.level
+    # The consistency check is only done at the lowest debug level.
+    logger.setLevel(5)
+    try:
+        clustering = Clustering(artificial_spike_clusters(1000, 20))
+        _random_actions(clustering, 10)
+        while clustering.undo():
+            pass
+        clustering._spike_clusters[0] = 1000
+        with raises(AssertionError):
+            clustering.merge([2, 3])
+    finally:
+        logger.setLevel(level)
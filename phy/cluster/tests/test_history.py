@@ -58,6 +58,25 @@ def test_history():
     assert history.back() is None
 
 
+def test_history_pop_first():
+    history = History()
+    assert history.pop_first() is None
+
+    history.add(0)
+    history.add(1)
+    history.add(2)
+    history.back()
+
+    # Only done items can be removed, and the current item is kept.
+    assert history.pop_first() == 0
+    assert history.pop_first() is None
+    assert history.current_item == 1
+    assert history.forward() == 2
+    assert history.back() == 2
+    assert history.back() == 1
+    assert history.back() is None
+
+
 def test_iter_history():
     history = History()
 
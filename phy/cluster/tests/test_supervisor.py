@@ -13,8 +13,12 @@ from numpy.testing import assert_array_equal as ae
 from .. import supervisor as _supervisor
 from ..supervisor import (Supervisor,
                           )
+from phy.electrode.mea import staggered_positions
 from phy.io import Context
+from phy.io.mock import artificial_features, artificial_waveforms
 from phy.gui import GUI
+from phy.utils import Bunch
+from ..views import FeatureView, WaveformView
 
 
 #------------------------------------------------------------------------------
@@ -126,6 +130,68 @@ def test_supervisor_merge(supervisor):
     assert mc.selected == [31, 11]
 
 
+def test_supervisor_selection_cache(supervisor):
+    mc = supervisor
+    cache = mc.selection_cache
+
+    mc.select([30, 20])
+    spikes = mc.selector.select_spikes([30, 20])
+    assert mc.selector.select_spikes([30, 20]) is spikes
+    assert cache.n_hits == 1
+
+    # The cache is invalidated after a merge.
+    mc.merge()
+    assert mc.selected == [31, 11]
+    assert len(cache) == 0
+    assert mc.selector.select_spikes([31]) is not spikes
+
+
+def test_supervisor_shared_loader(qtbot, gui, supervisor):
+    mc = supervisor
+    nc = 4
+    _loads = []
+
+    # Loader shared by the waveform view and the feature view.
+    @mc.memoize
+    def get_masks(cluster_id):
+        _loads.append(cluster_id)
+        n = len(mc.selector.select_spikes([cluster_id]))
+        return np.random.uniform(size=(n, nc))
+
+    def get_waveforms(cluster_id):
+        masks = get_masks(cluster_id)
+        return Bunch(data=artificial_waveforms(len(masks), 20, nc),
+                     masks=masks,
+                     channel_ids=np.arange(nc),
+                     channel_positions=staggered_positions(nc),
+                     )
+
+    def get_features(cluster_id=None, channel_ids=None, load_all=None):
+        if cluster_id is None:
+            masks = np.ones((len(mc.clustering.spike_clusters), nc))
+        else:
+            masks = get_masks(cluster_id)
+        return Bunch(data=artificial_features(len(masks), nc, 3),
+                     spike_ids=np.arange(len(masks)),
+                     masks=masks,
+                     channel_ids=np.arange(nc),
+                     )
+
+    for view in (WaveformView(waveforms=get_waveforms),
+                 FeatureView(features=get_features)):
+        view.attach(gui)
+
+    # The masks are loaded once per selected cluster for both views.
+    mc.select([30, 20])
+    qtbot.wait(200)
+    assert sorted(_loads) == [20, 30]
+
+    # The cached masks of the clusters still selected are reused.
+    mc.select([20, 10])
+    qtbot.wait(200)
+    assert sorted(_loads) == [10, 20, 30]
+
+
 def test_supervisor_merge_move(supervisor):
     """Check that merge then move selects the next cluster in the original
     cluster view, not the updated cluster view."""
@@ -7,10 +7,14 @@
 #------------------------------------------------------------------------------
 
 import logging
+from threading import Thread
+import time
 
+import numpy as np
 from pytest import raises
 
-from .._utils import (ClusterMeta, UpdateInfo,
+from .._utils import (ClusterMeta, UpdateInfo, SelectionCache,
+                      SimilarityIndex,
                       _update_cluster_selection, create_cluster_meta)
 
 logger = logging.getLogger(__name__)
@@ -193,3 +197,193 @@ def test_update_info():
     logger.debug(UpdateInfo(deleted=range(5), added=[5],
                             description='assign', history='undo'))
     logger.debug(UpdateInfo(metadata_changed=[2, 3], description='metadata'))
+
+
+def test_selection_cache():
+    cache = SelectionCache(max_size=1000)
+    _calls = []
+
+    @cache.memoize
+    def waveforms(cluster_id, channel_ids=None):
+        _calls.append(cluster_id)
+        return np.zeros((10, 4))
+
+    @cache.memoize
+    def features(cluster_ids=None, channel_ids=None):
+        _calls.append(cluster_ids)
+        return np.zeros(5)
+
+    cache.on_select([0, 1])
+    waveforms(0)
+    waveforms(0)
+    waveforms(1, channel_ids=np.arange(3))
+    waveforms(1, channel_ids=np.arange(3))
+    features(channel_ids=[0, 1])
+    features(cluster_ids=[0, 1])
+    features(cluster_ids=[0, 1])
+    assert _calls == [0, 1, None, [0, 1]]
+    assert (cache.n_hits, cache.n_misses) == (3, 4)
+    assert len(cache) == 4
+    assert cache.size == 2 * 320 + 2 * 40
+
+    # The data of the clusters that are no longer selected are discarded,
+    # but not the data that does not depend on the clusters.
+    cache.on_select([1, 2])
+    assert (cache.n_hits, cache.n_misses) == (0, 0)
+    assert len(cache) == 2
+    waveforms(1, channel_ids=np.arange(3))
+    features(channel_ids=[0, 1])
+    assert cache.n_hits == 2
+
+    # Clustering actions invalidate the deleted clusters.
+    cache.on_cluster(UpdateInfo(deleted=[1, 2], added=[3]))
+    assert len(cache) == 1
+    cache.on_cluster(UpdateInfo(metadata_changed=[1]))
+    assert len(cache) == 1
+
+    # The memory is bounded.
+    cache.on_select([2, 3])
+    for i in range(5):
+        waveforms(2, channel_ids=[i])
+    assert cache.size <= 1000
+    assert len(cache) == 3
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_selection_cache_threads():
+    cache = SelectionCache()
+    _calls = []
+
+    @cache.memoize
+    def masks(cluster_id):
+        _calls.append(cluster_id)
+        time.sleep(.05)
+        return np.ones(10)
+
+    # The views request the same data concurrently: it is loaded once.
+    threads = [Thread(target=masks, args=(0,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _calls == [0]
+    assert (cache.n_hits, cache.n_misses) == (3, 1)
+
+    # The failed loads are not cached.
+    @cache.memoize
+    def fail(cluster_id):
+        _calls.append(cluster_id)
+        raise RuntimeError()
+
+    for _ in range(2):
+        with raises(RuntimeError):
+            fail(1)
+    assert _calls == [0, 1, 1]
+    assert len(cache) == 1
+
+    # The data loaded during a clustering change is not cached.
+    @cache.memoize
+    def features(cluster_id):
+        _calls.append(cluster_id)
+        cache.on_cluster(UpdateInfo(deleted=[3], added=[4]))
+        return np.ones(10)
+
+    features(2)
+    features(2)
+    assert _calls == [0, 1, 1, 2, 2]
+    assert len(cache) == 1
+
+
+def test_similarity_index():
+    # Symmetric similarity between clusters on a line.
+    positions = {c: float(c) for c in range(10)}
+    _calls = []
+
+    def similarity(cluster_id):
+        _calls.append(cluster_id)
+        x = positions[cluster_id]
+        return [(c, -abs(x - y)) for c, y in positions.items()]
+
+    index = SimilarityIndex(similarity, range(10), k=3, symmetric=True)
+    assert index.get(5) == [(4, -1.), (6, -1.), (3, -2.)]
+    assert index.get(5) == [(4, -1.), (6, -1.), (3, -2.)]
+    assert _calls == [5]
+    assert (index.n_hits, index.n_misses) == (1, 1)
+    index.get(0)
+    index.get(8)
+    assert len(index) == 3
+
+    # Merge 3 and 4 into 10 at 8.5.
+    del positions[3], positions[4]
+    positions[10] = 8.5
+    index.on_cluster(UpdateInfo(deleted=[3, 4], added=[10]))
+    assert _calls[-1] == 10
+    n_calls = len(_calls)
+    # The row of 8 is updated in place.
+    assert index.get(8) == [(10, -.5), (7, -1.), (9, -1.)]
+    assert len(_calls) == n_calls
+    # The rows that lost neighbors are recomputed.
+    assert 5 not in index._rows
+    assert index.get(5) == [(6, -1.), (7, -2.), (2, -3.)]
+    assert index.get(0) == [(1, -1.), (2, -2.), (5, -5.)]
+    assert index.get(10) == [(8, -.5), (9, -.5), (7, -1.5)]
+
+    # Asymmetric similarity: all rows are recomputed after clusters
+    # are added.
+    index = SimilarityIndex(similarity, positions, k=3, symmetric=False)
+    index.get(0)
+    index.get(8)
+    del positions[10]
+    positions[11] = 8.2
+    index.on_cluster(UpdateInfo(deleted=[10], added=[11]))
+    assert len(index) == 0
+    assert index.get(0) == [(1, -1.), (2, -2.), (5, -5.)]
+    assert _calls[-1] == 0
+    row = index.get(8)
+    assert [c for (c, _) in row] == [11, 7, 9]
+    assert np.allclose([sim for (_, sim) in row], [-.2, -1., -1.])
+    assert _calls[-1] == 8
+    index.on_cluster(UpdateInfo(metadata_changed=[0]))
+    assert len(index) == 2
+
+
+def test_similarity_index_insert():
+    positions = {0: 0., 1: 1., 2: 10., 3: 11., 4: 20.}
+
+    def similarity(cluster_id):
+        x = positions[cluster_id]
+        return [(c, -abs(x - y)) for c, y in positions.items()]
+
+    index = SimilarityIndex(similarity, positions, k=2, symmetric=True)
+    for cluster_id in positions:
+        index.get(cluster_id)
+    assert index.get(0) == [(1, -1.), (2, -10.)]
+
+    # The new cluster is not among the neighbors of 5, but 0 and 1 are
+    # closer to 5 than to 2.
+    positions[5] = 5.5
+    index.on_cluster(UpdateInfo(added=[5]))
+    fresh = SimilarityIndex(similarity, positions, k=2, symmetric=True)
+    for cluster_id in positions:
+        assert index.get(cluster_id) == fresh.get(cluster_id)
+    assert index.get(0) == [(1, -1.), (5, -5.5)]
+
+
+def test_similarity_index_order():
+    # The order of the similarity function is kept when k is None.
+    def similarity(cluster_id):
+        return [(c, float(c)) for c in (3, 1, 2, 0) if c != cluster_id]
+
+    index = SimilarityIndex(similarity, range(4), k=None, symmetric=True)
+    assert index.get(0) == [(3, 3.), (1, 1.), (2, 2.)]
+
+    index.on_cluster(UpdateInfo(deleted=[1]))
+    assert index.get(0) == [(3, 3.), (2, 2.)]
+    assert index.n_hits == 1
+
+    index.on_cluster(UpdateInfo(added=[1]))
+    assert len(index) == 0
+    assert index.get(0) == [(3, 3.), (1, 1.), (2, 2.)]
@@ -8,11 +8,12 @@
 # -----------------------------------------------------------------------------
 
 import logging
+from timeit import default_timer
 
 from vispy.util.event import Event
 
 from phy.gui import Actions
-from phy.gui.qt import AsyncCaller, busy_cursor
+from phy.gui.qt import AsyncCaller, ThreadedCaller, busy_cursor
 from phy.plot import View
 from phy.utils import Bunch
 
@@ -34,6 +35,20 @@ class ManualClusteringView(View):
 
     The views take their data with functions `cluster_ids: spike_ids, data`.
 
+    When the view is attached to a GUI, a cluster selection updates the view
+    in two phases. First, `get_data()` gathers the data in a worker thread.
+    Then, `on_select()` plots this data in the GUI thread. A new selection
+    cancels the pending update.
+
+    The data functions are therefore called in a worker thread while the
+    GUI thread may change the clustering. They may read the raw data, the
+    clustering state (`spike_clusters`, `spikes_per_cluster`), and the
+    thread-safe caches (selection cache, correlogram cache), but they must
+    not modify any of them nor the view. The data gathered while the
+    clustering changes may be inconsistent: it is discarded after every
+    clustering action, and gathered again if the selected clusters still
+    exist.
+
     """
     default_shortcuts = {
     }
@@ -54,16 +69,65 @@ class ManualClusteringView(View):
         # Keep track of the selected clusters and spikes.
         self.cluster_ids = None
 
+        # Arguments of the update being gathered in the worker thread.
+        self._pending_update = None
+
+        # Duration of the last update, in milliseconds.
+        self.timings = Bunch(get_data=0., on_select=0.)
+
         super(ManualClusteringView, self).__init__(**kwargs)
         self.panzoom._default_zoom = .9
         self.panzoom.reset()
         self.events.add(status=StatusEvent)
 
-    def on_select(self, cluster_ids=None, **kwargs):
+    def _cluster_ids(self, cluster_ids=None):
         cluster_ids = (cluster_ids if cluster_ids is not None
                        else self.cluster_ids)
-        self.cluster_ids = list(cluster_ids) if cluster_ids is not None else []
-        self.cluster_ids = [int(c) for c in self.cluster_ids]
+        cluster_ids = list(cluster_ids) if cluster_ids is not None else []
+        return [int(c) for c in cluster_ids]
+
+    def get_data(self, cluster_ids, **kwargs):
+        """Return the data needed to display the selected clusters.
+
+        This method is called in a worker thread and must not make any
+        OpenGL or Qt call. The returned object is passed as `data` to
+        `on_select()`.
+
+        May be overriden. By default, all the work is done in `on_select()`.
+
+        """
+        return None
+
+    def on_select(self, cluster_ids=None, **kwargs):
+        self.cluster_ids = self._cluster_ids(cluster_ids)
+
+    def _update_view(self, cluster_ids, **kwargs):
+        """Update the view asynchronously after a cluster selection."""
+        cluster_ids = self._cluster_ids(cluster_ids)
+        if not cluster_ids:
+            self.on_select(cluster_ids, **kwargs)
+            return
+        timings = Bunch(get_data=0., on_select=0.)
+
+        def get_data():
+            t0 = default_timer()
+            data = self.get_data(cluster_ids, **kwargs)
+            timings.get_data = (default_timer() - t0) * 1000.
+            return data
+
+        def on_select(data):
+            t0 = default_timer()
+            with busy_cursor():
+                self.on_select(cluster_ids, data=data, **kwargs)
+            timings.on_select = (default_timer() - t0) * 1000.
+            self.timings = timings
+            logger.debug("Update %s in %.1f ms (get data: %.1f ms).",
+                         self.__class__.__name__,
+                         timings.get_data + timings.on_select,
+                         timings.get_data)
+
+        self._pending_update = (cluster_ids, kwargs)
+        self.threaded_caller.set(get_data, on_select)
 
     def attach(self, gui, name=None):
         """Attach the view to the GUI."""
@@ -78,18 +142,36 @@ class ManualClusteringView(View):
         # Set the view state.
         self.set_state(gui.state.get_view_state(self))
 
-        # Call on_select() asynchronously after a delay, and set a busy
-        # cursor.
+        # Update the view asynchronously after a delay: the data is
+        # gathered in a worker thread, and plotted in the GUI thread.
         self.async_caller = AsyncCaller(delay=self._callback_delay)
+        self.threaded_caller = ThreadedCaller()
 
         @gui.connect_
         def on_select(cluster_ids, **kwargs):
+            # Cancel the pending update.
+            self.threaded_caller.cancel()
+
             # Call this function after a delay unless there is another
             # cluster selection in the meantime.
             @self.async_caller.set
             def update_view():
-                with busy_cursor():
-                    self.on_select(cluster_ids, **kwargs)
+                self._update_view(cluster_ids, **kwargs)
+
+        @gui.connect_
+        def on_cluster(up):
+            # The data of the pending update may have been gathered while
+            # the clustering was changing: discard it, and gather it again
+            # unless the selected clusters were deleted, in which case a
+            # new selection follows.
+            if not (up.added or up.deleted):
+                return
+            if not self.threaded_caller.is_pending:
+                return
+            self.threaded_caller.cancel()
+            cluster_ids, kwargs = self._pending_update
+            if not set(cluster_ids) & set(up.deleted):
+                self._update_view(cluster_ids, **kwargs)
 
         self.actions = Actions(gui,
                                name=name or self.__class__.__name__,
@@ -106,6 +188,7 @@ class ManualClusteringView(View):
         # Save the view state in the GUI state.
         @gui.connect_
         def on_close():
+            self.threaded_caller.cancel()
             gui.state.update_view_state(self, self.state)
             # NOTE: create_gui() already saves the state, but the event
             # is registered *before* we add all views.
@@ -11,6 +11,7 @@ import logging
 
 import numpy as np
 
+from phy.stats.ccg import CorrelogramCache, correlograms_per_cluster
 from phy.utils import Bunch
 from phy.utils._color import _spike_colors
 from .base import ManualClusteringView
@@ -35,12 +36,22 @@ class CorrelogramView(ManualClusteringView):
     }
 
     def __init__(self, correlograms=None,
+                 spikes_per_cluster=None,
+                 spike_times_per_cluster=None,
                  sample_rate=None,
                  **kwargs):
 
         assert sample_rate > 0
         self.sample_rate = float(sample_rate)
 
+        # Functions cluster => sorted spike ids and spike times, used to
+        # compute the CCGs when no correlograms function is given.
+        self.spikes_per_cluster = spikes_per_cluster
+        self.spike_times_per_cluster = spike_times_per_cluster
+        if correlograms is None:
+            assert spikes_per_cluster and spike_times_per_cluster
+            correlograms = self._correlograms_per_cluster
+
         # Initialize the view.
         super(CorrelogramView, self).__init__(layout='grid',
                                               shape=(1, 1),
@@ -48,6 +59,8 @@ class CorrelogramView(ManualClusteringView):
 
         # Function clusters => CCGs.
         self.correlograms = correlograms
+        # Cache of the pairwise CCGs, updated after clustering changes.
+        self.correlograms_cache = CorrelogramCache(correlograms)
 
         # Set the default bin and window size.
         self.set_bin_window(bin_size=self.bin_size,
@@ -66,22 +79,40 @@ class CorrelogramView(ManualClusteringView):
         b, w = self.bin_size * 1000, self.window_size * 1000
         self.set_status('Bin: {:.1f} ms. Window: {:.1f} ms.'.format(b, w))
 
+    def _correlograms_per_cluster(self, cluster_ids, bin_size, window_size):
+        """Compute the CCGs from the spikes of the selected clusters
+        only."""
+        return correlograms_per_cluster(
+            cluster_ids,
+            spikes_per_cluster=self.spikes_per_cluster,
+            spike_times_per_cluster=self.spike_times_per_cluster,
+            sample_rate=self.sample_rate,
+            bin_size=bin_size,
+            window_size=window_size,
+        )
+
     def _iter_subplots(self, n_clusters):
         for i in range(n_clusters):
             for j in range(n_clusters):
                 yield i, j
 
     def _plot_correlograms(self, ccg):
-        n_clusters = ccg.shape[0]
-        ylim = [ccg.max()] if not self.uniform_normalization else None
+        n_clusters, _, n_bins = ccg.shape
+        # NOTE: all correlograms are added as a single item, the subplot
+        # of every vertex being given by the box index.
+        hist = ccg.reshape((n_clusters * n_clusters, n_bins))
+        ylim = (ccg.max() if not self.uniform_normalization
+                else hist.max(axis=1))
         colors = _spike_colors(np.arange(n_clusters), alpha=1.)
-        for i, j in self._iter_subplots(n_clusters):
-            hist = ccg[i, j, :]
-            color = colors[i] if i == j else np.ones(4)
-            self[i, j].hist(hist,
-                            color=color,
-                            ylim=ylim,
-                            )
+        box = np.array(list(self._iter_subplots(n_clusters)))
+        color = np.ones((len(hist), 4))
+        diag = box[:, 0] == box[:, 1]
+        color[diag] = colors[box[diag, 0]]
+        self.hist(hist,
+                  color=color,
+                  ylim=ylim,
+                  box_index=np.repeat(box, 6 * n_bins, axis=0),
+                  )
 
     def _plot_labels(self, cluster_ids):
         n = len(cluster_ids)
@@ -97,17 +128,20 @@ class CorrelogramView(ManualClusteringView):
                                 data_bounds=None,
                                 )
 
-    def on_select(self, cluster_ids=None, **kwargs):
+    def get_data(self, cluster_ids, **kwargs):
+        return self.correlograms_cache.get(cluster_ids,
+                                           self.bin_size,
+                                           self.window_size,
+                                           )
+
+    def on_select(self, cluster_ids=None, data=None, **kwargs):
         super(CorrelogramView, self).on_select(cluster_ids, **kwargs)
         cluster_ids = self.cluster_ids
         n_clusters = len(cluster_ids)
         if n_clusters == 0:
             return
 
-        ccg = self.correlograms(cluster_ids,
-                                self.bin_size,
-                                self.window_size,
-                                )
+        ccg = data if data is not None else self.get_data(cluster_ids)
 
         self.grid.shape = (n_clusters, n_clusters)
         with self.building():
@@ -122,6 +156,11 @@ class CorrelogramView(ManualClusteringView):
     def attach(self, gui):
         """Attach the view to the GUI."""
         super(CorrelogramView, self).attach(gui)
+
+        @gui.connect_
+        def on_cluster(up):
+            self.correlograms_cache.on_cluster(up)
+
         self.actions.add(self.toggle_normalization, shortcut='n')
         self.actions.separator()
         self.actions.add(self.set_bin, alias='cb')
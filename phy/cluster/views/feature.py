@@ -7,6 +7,7 @@
 # Imports
 # -----------------------------------------------------------------------------
 
+from collections import OrderedDict
 import logging
 import re
 
@@ -52,6 +53,20 @@ def _get_point_size(clu_idx=None):
     return FeatureView._default_marker_size if clu_idx is not None else 1.
 
 
+def _get_point_group(clu_idx=None):
+    """Group index of the points in the batched scatter visual."""
+    return clu_idx + 1 if clu_idx is not None else 0
+
+
+def _get_point_tables(n_clusters):
+    """Colors and sizes of the background and the clusters, indexed by the
+    group index."""
+    clu_idxs = [None] + list(range(n_clusters))
+    colors = np.array([_get_point_color(c) for c in clu_idxs])
+    sizes = np.array([_get_point_size(c) for c in clu_idxs])
+    return colors, sizes
+
+
 def _get_point_masks(masks=None, clu_idx=None):
     masks = masks if masks is not None else 1.
     # NOTE: we add the cluster relative index for the computation
@@ -67,6 +82,26 @@ def _get_masks_max(px, py):
     return np.maximum(mx, my)
 
 
+def _density_image(x, y, n_bins):
+    """Return the 2D histogram of points as an image with values between 0
+    and 1 (log scale), and the rectangle `(xmin, ymin, xmax, ymax)` of the
+    image. The rows of the image correspond to the y axis."""
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if not len(x):
+        return None
+    xmin, xmax = x.min(), x.max()
+    ymin, ymax = y.min(), y.max()
+    if xmin == xmax:
+        xmin, xmax = xmin - 1, xmax + 1
+    if ymin == ymax:
+        ymin, ymax = ymin - 1, ymax + 1
+    image, _, _ = np.histogram2d(y, x, bins=n_bins,
+                                 range=[[ymin, ymax], [xmin, xmax]])
+    image = np.log1p(image)
+    image /= image.max()
+    return Bunch(image=image, pos=(xmin, ymin, xmax, ymax))
+
+
 def _uniq(seq):
     seen = set()
     seen_add = seen.add
@@ -77,6 +112,13 @@ class FeatureView(ManualClusteringView):
     _callback_delay = 20
 
     _default_marker_size = 5.
+
+    # Either 'points' or 'density': in the latter case, the background
+    # spikes are displayed as 2D histograms cached for every channel set.
+    background_mode = 'points'
+    n_density_bins = 100
+    _density_cache_size = 8
+
     default_shortcuts = {
         'increase': 'ctrl++',
         'decrease': 'ctrl+-',
@@ -86,9 +128,15 @@ class FeatureView(ManualClusteringView):
     def __init__(self,
                  features=None,
                  attributes=None,
+                 background_mode=None,
                  **kwargs):
         self._scaling = None
 
+        self.background_mode = background_mode or self.background_mode
+        assert self.background_mode in ('points', 'density')
+        # Dictionary `{channel_ids: {(dim_x, dim_y): density}}`.
+        self._density_cache = OrderedDict()
+
         assert features
         self.features = features
 
@@ -177,7 +225,8 @@ class FeatureView(ManualClusteringView):
         # PC dimensions: use the common scaling.
         return (-1. / self.scaling, +1. / self.scaling)
 
-    def _plot_points(self, i, j, dim_x, dim_y, bunch, clu_idx=None):
+    def _plot_points(self, i, j, dim_x, dim_y, bunch, clu_idx=None,
+                     colors=None, sizes=None):
         cluster_id = self.cluster_ids[clu_idx] if clu_idx is not None else None
         px = self._get_axis_data(bunch, dim_x, cluster_id=cluster_id)
         py = self._get_axis_data(bunch, dim_y, cluster_id=cluster_id)
@@ -188,13 +237,56 @@ class FeatureView(ManualClusteringView):
         xmin, xmax = self._get_axis_bounds(dim_x, px)
         ymin, ymax = self._get_axis_bounds(dim_y, py)
         masks = _get_masks_max(px, py)
-        self[i, j].uscatter(x=px.data, y=py.data,
-                            color=_get_point_color(clu_idx),
-                            size=_get_point_size(clu_idx),
-                            masks=_get_point_masks(clu_idx=clu_idx,
-                                                   masks=masks),
-                            data_bounds=(xmin, ymin, xmax, ymax),
-                            )
+        # NOTE: all points are drawn by a single visual. The background
+        # has the group index 0, and the clusters the next indices.
+        self[i, j].batch_scatter(x=px.data, y=py.data,
+                                 cluster=_get_point_group(clu_idx),
+                                 colors=colors,
+                                 sizes=sizes,
+                                 masks=_get_point_masks(clu_idx=clu_idx,
+                                                        masks=masks),
+                                 data_bounds=(xmin, ymin, xmax, ymax),
+                                 )
+
+    def _get_densities(self, background=None):
+        """Return the density images of the background for the current
+        channels, computing them if they are not cached."""
+        key = tuple(self.channel_ids)
+        if key in self._density_cache:
+            self._density_cache[key] = self._density_cache.pop(key)
+            return self._density_cache[key]
+        if background is None:
+            background = self.features(channel_ids=self.channel_ids)
+        densities = {}
+        for i, j, dim_x, dim_y in self._iter_subplots():
+            px = self._get_axis_data(background, dim_x)
+            py = self._get_axis_data(background, dim_y)
+            if px is None or py is None:  # pragma: no cover
+                continue
+            density = _density_image(px.data, py.data, self.n_density_bins)
+            if density is None:  # pragma: no cover
+                continue
+            # Keep the limits of the attributes.
+            density.x = Bunch(lim=px.get('lim', None))
+            density.y = Bunch(lim=py.get('lim', None))
+            densities[dim_x, dim_y] = density
+        logger.log(5, "Compute the background densities of channels %s.",
+                   key)
+        self._density_cache[key] = densities
+        while len(self._density_cache) > self._density_cache_size:
+            self._density_cache.popitem(last=False)
+        return densities
+
+    def _plot_density(self, i, j, dim_x, dim_y, densities):
+        density = densities.get((dim_x, dim_y), None)
+        if density is None:  # pragma: no cover
+            return
+        xmin, xmax = self._get_axis_bounds(dim_x, density.x)
+        ymin, ymax = self._get_axis_bounds(dim_y, density.y)
+        self[i, j].density(image=density.image,
+                           pos=density.pos,
+                           data_bounds=(xmin, ymin, xmax, ymax),
+                           )
 
     def _plot_labels(self):
         """Plot feature labels along left and bottom edge of subplots"""
@@ -238,13 +330,7 @@ class FeatureView(ManualClusteringView):
         self.channel_ids = None
         self.on_select()
 
-    def on_select(self, cluster_ids=None, **kwargs):
-        super(FeatureView, self).on_select(cluster_ids, **kwargs)
-        cluster_ids = self.cluster_ids
-        n_clusters = len(cluster_ids)
-        if n_clusters == 0:
-            return
-
+    def get_data(self, cluster_ids, **kwargs):
         # Determine whether the channels should be fixed or not.
         added = kwargs.get('up', {}).get('added', None)
         # Fix the channels if the view updates after a cluster event
@@ -265,12 +351,34 @@ class FeatureView(ManualClusteringView):
         assert len(channel_ids)
 
         # Choose the channels automatically unless fixed_channels is set.
-        if (not fixed_channels or self.channel_ids is None):
-            self.channel_ids = channel_ids
-        assert len(self.channel_ids)
+        if fixed_channels and self.channel_ids is not None:
+            channel_ids = self.channel_ids
+        assert len(channel_ids)
+
+        # Get the background data, unless its density images are cached
+        # for these channels.
+        background = None
+        if (self.background_mode == 'points' or
+                tuple(channel_ids) not in self._density_cache):
+            background = self.features(channel_ids=channel_ids)
+
+        return Bunch(bunchs=bunchs,
+                     channel_ids=channel_ids,
+                     background=background,
+                     )
 
-        # Get the background data.
-        background = self.features(channel_ids=self.channel_ids)
+    def on_select(self, cluster_ids=None, data=None, **kwargs):
+        super(FeatureView, self).on_select(cluster_ids, **kwargs)
+        cluster_ids = self.cluster_ids
+        n_clusters = len(cluster_ids)
+        if n_clusters == 0:
+            return
+
+        # Get the feature data.
+        if data is None:
+            data = self.get_data(cluster_ids, **kwargs)
+        bunchs, background = data.bunchs, data.background
+        self.channel_ids = data.channel_ids
 
         # Plot all features.
         with self.building():
@@ -281,19 +389,27 @@ class FeatureView(ManualClusteringView):
             # column are given in bunch.channel_ids in the same order.
 
             # Find the initial scaling.
-            if self._scaling in (None, np.inf):
+            if self._scaling in (None, np.inf) and background is not None:
                 m = np.median(np.abs(background.data))
                 m = m if m > 1e-9 else 1.
                 self._scaling = .1 / m
 
+            densities = (self._get_densities(background)
+                         if self.background_mode == 'density' else None)
+            colors, sizes = _get_point_tables(n_clusters)
             for i, j, dim_x, dim_y in self._iter_subplots():
-                # Plot the background points.
-                self._plot_points(i, j, dim_x, dim_y, background)
+                # Plot the background points or densities.
+                if densities is not None:
+                    self._plot_density(i, j, dim_x, dim_y, densities)
+                else:
+                    self._plot_points(i, j, dim_x, dim_y, background,
+                                      colors=colors, sizes=sizes)
 
                 # Plot each cluster's data.
                 for clu_idx, bunch in enumerate(bunchs):
                     self._plot_points(i, j, dim_x, dim_y, bunch,
-                                      clu_idx=clu_idx)
+                                      clu_idx=clu_idx,
+                                      colors=colors, sizes=sizes)
 
             self._plot_labels()
             self.grid.add_boxes(self, self.shape)
@@ -310,6 +426,14 @@ class FeatureView(ManualClusteringView):
         gui.connect_(self.on_channel_click)
         gui.connect_(self.on_request_split)
 
+        @gui.connect_
+        def on_cluster(up):
+            # The cached background densities are computed from a spike
+            # selection that may depend on the clustering. Metadata
+            # changes leave the clusters unchanged.
+            if up.added or up.deleted:
+                self._density_cache.clear()
+
     @property
     def state(self):
         return Bunch(scaling=self.scaling)
@@ -35,7 +35,7 @@ class ScatterView(ManualClusteringView):
         # Initialize the view.
         super(ScatterView, self).__init__(**kwargs)
 
-    def _get_data(self, cluster_ids):
+    def get_data(self, cluster_ids, **kwargs):
         return [self.coords(cluster_id) for cluster_id in cluster_ids]
 
     def _get_data_bounds(self, bunchs):
@@ -62,7 +62,7 @@ class ScatterView(ManualClusteringView):
                          data_bounds=data_bounds,
                          )
 
-    def on_select(self, cluster_ids=None, **kwargs):
+    def on_select(self, cluster_ids=None, data=None, **kwargs):
         super(ScatterView, self).on_select(cluster_ids, **kwargs)
         cluster_ids = self.cluster_ids
         n_clusters = len(cluster_ids)
@@ -70,7 +70,7 @@ class ScatterView(ManualClusteringView):
             return
 
         # Retrieve the data.
-        bunchs = self._get_data(cluster_ids)
+        bunchs = data if data is not None else self.get_data(cluster_ids)
 
         # Compute the data bounds.
         data_bounds = self._get_data_bounds(bunchs)
@@ -6,9 +6,15 @@
 # Imports
 #------------------------------------------------------------------------------
 
+import numpy as np
+from numpy.testing import assert_array_equal as ae
+
 from phy.gui import GUI
 from phy.io.mock import (artificial_correlograms,
+                         artificial_spike_clusters,
                          )
+from phy.stats.ccg import correlograms
+from phy.cluster.clustering import Clustering
 
 from ..correlogram import CorrelogramView
 
@@ -35,6 +41,12 @@ def test_correlogram_view(qtbot, tempdir):
     v.on_select([])
     v.on_select([0])
     v.on_select([0, 2, 3])
+    # All correlograms are added as a single histogram item.
+    items = [data for cls, data in v._items.items()
+             if cls.__name__ == 'HistogramVisual']
+    assert len(items) == 1
+    assert len(items[0]) == 1
+    assert items[0][0]['hist'].shape == (9, ns)
     v.on_select([0, 2])
 
     v.toggle_normalization()
@@ -44,3 +56,42 @@ def test_correlogram_view(qtbot, tempdir):
 
     # qtbot.stop()
     gui.close()
+
+
+def test_correlogram_view_per_cluster(qtbot, tempdir):
+    n_spikes = 1000
+    sr = 1000.
+    spike_times = np.cumsum(np.random.exponential(scale=.01, size=n_spikes))
+    spike_times = np.round(spike_times * sr) / sr
+    clustering = Clustering(artificial_spike_clusters(n_spikes, 10),
+                            spike_times=spike_times)
+
+    def spikes_per_cluster(cluster_id):
+        return clustering.spikes_per_cluster[cluster_id]
+
+    def spike_times_per_cluster(cluster_id):
+        return clustering.spike_times_per_cluster(cluster_id)
+
+    # The CCGs are computed from the spikes of the selected clusters.
+    v = CorrelogramView(spikes_per_cluster=spikes_per_cluster,
+                        spike_times_per_cluster=spike_times_per_cluster,
+                        sample_rate=sr,
+                        )
+    gui = GUI(config_dir=tempdir)
+    gui.show()
+    v.attach(gui)
+    qtbot.addWidget(gui)
+
+    cluster_ids = [1, 3, 4]
+    ccg = v.get_data(cluster_ids)
+    sc = clustering.spike_clusters
+    m = np.in1d(sc, cluster_ids)
+    ae(ccg, correlograms(spike_times[m], sc[m],
+                         cluster_ids=cluster_ids,
+                         sample_rate=sr,
+                         bin_size=v.bin_size,
+                         window_size=v.window_size,
+                         ))
+    v.on_select(cluster_ids)
+
+    gui.close()
@@ -70,6 +70,9 @@ def test_feature_view(qtbot, tempdir, n_channels):
     v.on_select([0])
     v.on_select([0, 2, 3])
     v.on_select([0, 2])
+    # The background and all clusters are drawn by a single scatter visual.
+    assert len([cls for cls in v._items
+                if cls.__name__.startswith('BatchScatterVisual')]) == 1
 
     gui.emit('select', [0, 2])
     qtbot.wait(10)
@@ -101,3 +104,65 @@ def test_feature_view(qtbot, tempdir, n_channels):
 
     # qtbot.stop()
     gui.close()
+
+
+def test_feature_view_density(qtbot, tempdir):
+    nc = 5
+    ns = 500
+    features = artificial_features(ns, nc, 4)
+    spike_clusters = artificial_spike_clusters(ns, 4)
+    spike_times = np.linspace(0., 1., ns)
+    spc = _spikes_per_cluster(spike_clusters)
+    background_calls = []
+
+    def get_spike_ids(cluster_id):
+        return (spc[cluster_id] if cluster_id is not None else np.arange(ns))
+
+    def get_features(cluster_id=None, channel_ids=None, load_all=None):
+        if cluster_id is None:
+            background_calls.append(channel_ids)
+        spike_ids = get_spike_ids(cluster_id)
+        return Bunch(data=features[spike_ids],
+                     spike_ids=spike_ids,
+                     masks=np.random.rand(len(spike_ids), nc),
+                     channel_ids=(channel_ids
+                                  if channel_ids is not None
+                                  else np.arange(nc)[::-1]),
+                     )
+
+    def get_time(cluster_id=None, load_all=None):
+        return Bunch(data=spike_times[get_spike_ids(cluster_id)],
+                     lim=(0., 1.),
+                     )
+
+    v = FeatureView(features=get_features,
+                    attributes={'time': get_time},
+                    background_mode='density',
+                    )
+
+    gui = GUI(config_dir=tempdir)
+    gui.show()
+    v.attach(gui)
+    qtbot.addWidget(gui)
+
+    # The background is loaded only once for the same channels.
+    v.on_select([0])
+    v.on_select([0, 2])
+    v.increase()
+    assert len(background_calls) == 1
+    assert len(v._density_cache) == 1
+    assert not [cls for cls in v._items
+                if cls.__name__.startswith('BatchScatterVisual') and
+                any(np.any(d['cluster'] == 0) for d in v._items[cls])]
+
+    # The cache is kept after a metadata change.
+    gui.emit('cluster', Bunch(added=[], deleted=[]))
+    assert len(v._density_cache) == 1
+
+    # The cache is cleared after a clustering change.
+    gui.emit('cluster', Bunch(added=[10], deleted=[0, 2]))
+    assert len(v._density_cache) == 0
+    v.on_select([0])
+    assert len(background_calls) == 2
+
+    gui.close()
@@ -34,5 +34,12 @@ def test_scatter_view(qtbot, tempdir):
     v.on_select([0, 2, 3])
     v.on_select([0, 2])
 
+    # Asynchronous update after a cluster selection.
+    gui.emit('select', [1, 3])
+    qtbot.wait(100)
+    assert v.cluster_ids == [1, 3]
+    assert v.timings.get_data >= 0
+    assert v.timings.on_select > 0
+
     # qtbot.stop()
     gui.close()
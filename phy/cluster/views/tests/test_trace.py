@@ -15,8 +15,10 @@ from phy.io.mock import (artificial_traces,
                          )
 from phy.utils import Bunch
 from phy.utils._color import ColorSelector
+from phy.traces import MinMaxPyramid
 
-from ..trace import TraceView, select_traces, _iter_spike_waveforms
+from ..trace import (TraceView, TracePrefetcher, select_traces,
+                     _iter_spike_waveforms)
 
 
 #------------------------------------------------------------------------------
@@ -128,3 +130,129 @@ def test_trace_view(tempdir, qtbot):
 
     # qtbot.stop()
     gui.close()
+
+
+def test_trace_view_pyramid(tempdir, qtbot):
+    nc = 5
+    sr = 2000.
+    duration = 20.
+    traces = artificial_traces(int(round(duration * sr)), nc)
+    _loaded = []
+
+    def get_traces(interval):
+        _loaded.append(interval)
+        data = select_traces(traces, interval, sample_rate=sr)
+        return Bunch(data=10 * data, waveforms=[])
+
+    # The pyramid applies the same scaling as the traces function.
+    v = TraceView(traces=get_traces,
+                  n_channels=nc,
+                  sample_rate=sr,
+                  duration=duration,
+                  pyramid=MinMaxPyramid(traces, transform=lambda x: 10 * x),
+                  )
+    gui = GUI(config_dir=tempdir)
+    gui.show()
+    v.attach(gui)
+    qtbot.addWidget(gui)
+
+    # Short interval: the raw traces are loaded.
+    v.set_interval((1., 1.1))
+    assert _loaded
+
+    # Long interval: the traces are decimated.
+    del _loaded[:]
+    v.set_interval((0., duration))
+    assert not _loaded
+    b = v._decimated_traces((0., duration))
+    assert b.data.shape[0] <= 2 * (v.size[0] + 2)
+    ac(b.data.max(), 10 * traces.max(), rtol=1e-6)
+
+    gui.close()
+
+
+def test_trace_view_prefetch(tempdir, qtbot):
+    nc = 5
+    sr = 1000.
+    duration = 10.
+    traces = 10 * artificial_traces(int(round(duration * sr)), nc)
+    _loaded = []
+
+    def get_traces(interval):
+        _loaded.append(tuple(interval))
+        return Bunch(data=select_traces(traces, interval, sample_rate=sr),
+                     waveforms=[])
+
+    # The view goes to the middle of the recording before any cluster
+    # is selected.
+    v = TraceView(traces=get_traces,
+                  n_channels=nc,
+                  sample_rate=sr,
+                  duration=duration,
+                  prefetch=2,
+                  )
+    assert v.prefetcher is not None
+    gui = GUI(config_dir=tempdir)
+    gui.show()
+    v.attach(gui)
+    qtbot.addWidget(gui)
+
+    v.on_select([])
+    v.on_select([0])
+    v.go_right()
+    qtbot.wait(100)
+    n = len(_loaded)
+    v.go_right()
+    qtbot.wait(100)
+    assert v.prefetcher.n_hits >= 1
+    assert len(_loaded) >= n
+
+    # Closing the GUI stops the prefetching thread.
+    gui.close()
+    assert v.prefetcher._thread is None
+
+
+def test_trace_prefetcher():
+    sr = 1000.
+    traces = artificial_traces(10000, 4)
+    _loaded = []
+
+    def get_traces(interval):
+        _loaded.append(tuple(interval))
+        return Bunch(data=select_traces(traces, interval, sample_rate=sr))
+
+    p = TracePrefetcher(get_traces, sample_rate=sr, cache_size=2)
+
+    # Synchronous load.
+    b = p.get((0., 1.), [0])
+    assert b.data.shape == (1000, 4)
+    assert (p.n_hits, p.n_misses) == (0, 1)
+    assert p.get((0., 1.), [0]) is b
+    assert (p.n_hits, p.n_misses) == (1, 1)
+
+    # The clusters are part of the key.
+    p.get((0., 1.), [1])
+    assert p.n_misses == 2
+
+    # Background load.
+    p.prefetch([(1., 2.), (2., 3.)], [0])
+    p.get((1., 2.), [0])
+    p.get((2., 3.), [0])
+    assert (p.n_hits, p.n_misses) == (3, 2)
+    assert len(p._cache) == 2
+    assert not p._pending
+
+    # Cancellation clears the cache.
+    p.cancel()
+    assert not p._cache
+    p.get((2., 3.), [0])
+    assert p.n_misses == 3
+    n = len(_loaded)
+    p.get((2., 3.), [0])
+    assert len(_loaded) == n
+
+    # No selected clusters.
+    assert p.get((0., 1.), None) is p.get((0., 1.), ())
+
+    p.close()
+    assert p._thread is None
@@ -6,6 +6,8 @@
 # Imports
 #------------------------------------------------------------------------------
 
+import time
+
 import numpy as np
 from numpy.testing import assert_allclose as ac
 from vispy.util import keys
@@ -15,6 +17,7 @@ from phy.gui import GUI
 from phy.io.mock import artificial_waveforms
 from phy.utils import Bunch
 
+from ..._utils import UpdateInfo
 from ..waveform import WaveformView
 
 
@@ -94,3 +97,41 @@ def test_waveform_view(qtbot, tempdir):
 
     # qtbot.stop()
     gui.close()
+
+
+def test_waveform_view_cluster_change(qtbot, tempdir):
+    nc = 5
+    _calls = []
+
+    def get_waveforms(cluster_id):
+        _calls.append(cluster_id)
+        time.sleep(.05)
+        return Bunch(data=artificial_waveforms(10, 20, nc),
+                     channel_ids=np.arange(nc),
+                     channel_positions=staggered_positions(nc),
+                     )
+
+    v = WaveformView(waveforms=get_waveforms,
+                     )
+    gui = GUI(config_dir=tempdir)
+    gui.show()
+    v.attach(gui)
+    qtbot.addWidget(gui)
+
+    # The data gathered during a clustering change is gathered again.
+    gui.emit('select', [0, 2])
+    qtbot.wait(30)
+    gui.emit('cluster', UpdateInfo(added=[4], deleted=[1, 3]))
+    qtbot.wait(500)
+    assert _calls.count(0) == 2
+    assert v.cluster_ids == [0, 2]
+
+    # The update is discarded when the selected clusters are deleted.
+    gui.emit('select', [4])
+    qtbot.wait(30)
+    gui.emit('cluster', UpdateInfo(added=[5], deleted=[4]))
+    qtbot.wait(500)
+    assert _calls.count(4) == 1
+    assert v.cluster_ids == [0, 2]
+
+    gui.close()
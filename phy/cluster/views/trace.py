@@ -7,9 +7,12 @@
 # Imports
 # -----------------------------------------------------------------------------
 
+from collections import OrderedDict
 import logging
+from threading import Event, Lock, Thread
 
 import numpy as np
+from six.moves.queue import Queue, Empty
 
 from phy.utils import Bunch
 from .base import ManualClusteringView
@@ -75,6 +78,135 @@ def _iter_spike_waveforms(interval=None,
         yield wave
 
 
+class TracePrefetcher(object):
+    """Load trace intervals in a background thread.
+
+    The loaded intervals are kept in a bounded cache keyed by
+    `(start, end, clusters)`. Pending prefetches are cancelled, and the cache
+    is cleared, when `cancel()` is called, typically when the cluster
+    selection changes.
+
+    Parameters
+    ----------
+
+    traces : function
+        Function `interval => Bunch(data, waveforms, ...)`. It is called
+        from the worker thread and must be thread-safe.
+    sample_rate : float
+    cache_size : int
+        Maximum number of intervals in the cache.
+
+    """
+    def __init__(self, traces, sample_rate=None, cache_size=8):
+        self.traces = traces
+        self.sample_rate = sample_rate
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # Dictionary `{key: Event}` of the intervals being loaded.
+        self._pending = {}
+        self._lock = Lock()
+        self._queue = Queue()
+        # Incremented at every cancellation.
+        self._generation = 0
+        self._thread = None
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def _key(self, interval, clusters):
+        start, end = (int(round(t * self.sample_rate)) for t in interval)
+        return start, end, tuple(clusters or ())
+
+    def _store(self, key, value):
+        self._cache[key] = value
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            generation, interval, key, event = item
+            try:
+                if generation != self._generation:
+                    continue
+                logger.log(5, "Prefetch interval %s.", interval)
+                value = self.traces(interval)
+                with self._lock:
+                    # Discard the interval if the prefetch was cancelled in
+                    # the meantime.
+                    if generation == self._generation:
+                        self._store(key, value)
+            finally:
+                with self._lock:
+                    if self._pending.get(key, None) is event:
+                        del self._pending[key]
+                event.set()
+
+    def get(self, interval, clusters=()):
+        """Return the traces in an interval, from the cache if possible."""
+        key = self._key(interval, clusters)
+        with self._lock:
+            event = self._pending.get(key, None)
+        # Wait for the interval if it is being prefetched.
+        if event is not None:
+            event.wait()
+        with self._lock:
+            if key in self._cache:
+                self.n_hits += 1
+                # Most recently used.
+                self._cache[key] = self._cache.pop(key)
+                return self._cache[key]
+            self.n_misses += 1
+            generation = self._generation
+        value = self.traces(interval)
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+        return value
+
+    def prefetch(self, intervals, clusters=()):
+        """Load some intervals in the background."""
+        if self._thread is None:
+            self._thread = Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        with self._lock:
+            for interval in intervals:
+                key = self._key(interval, clusters)
+                if key in self._cache or key in self._pending:
+                    continue
+                event = Event()
+                self._pending[key] = event
+                self._queue.put((self._generation, interval, key, event))
+
+    def cancel(self):
+        """Cancel all pending prefetches and clear the cache."""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+        # Remove the pending items from the queue.
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                _, _, key, event = item
+                with self._lock:
+                    if self._pending.get(key, None) is event:
+                        del self._pending[key]
+                event.set()
+
+    def close(self):
+        """Stop the worker thread."""
+        self.cancel()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
 class TraceView(ManualClusteringView):
     interval_duration = .25  # default duration of the interval
     shift_amount = .1
@@ -97,6 +229,8 @@ class TraceView(ManualClusteringView):
                  duration=None,
                  n_channels=None,
                  channel_labels=None,
+                 pyramid=None,
+                 prefetch=0,
                  **kwargs):
 
         self.do_show_labels = None
@@ -104,6 +238,12 @@ class TraceView(ManualClusteringView):
         # traces is a function interval => [traces]
         # spikes is a function interval => [Bunch(...)]
 
+        # Optional min/max decimation of the traces, used for long intervals.
+        # The decimated traces bypass the traces function: the pyramid must
+        # be created with the same filtering and scaling (its `transform`
+        # argument), otherwise long intervals would show other traces.
+        self.pyramid = pyramid
+
         # Sample rate.
         assert sample_rate > 0
         self.sample_rate = float(sample_rate)
@@ -113,6 +253,14 @@ class TraceView(ManualClusteringView):
         assert hasattr(traces, '__call__')
         self.traces = traces
 
+        # Number of intervals to prefetch in the navigation direction.
+        self.n_prefetch = prefetch
+        self.prefetcher = (TracePrefetcher(traces,
+                                           sample_rate=self.sample_rate,
+                                           cache_size=2 * prefetch + 2)
+                           if prefetch else None)
+        self._direction = 1
+
         assert duration >= 0
         self.duration = duration
 
@@ -146,15 +294,17 @@ class TraceView(ManualClusteringView):
     # Internal methods
     # -------------------------------------------------------------------------
 
-    def _plot_traces(self, traces, color=None, data_bounds=None):
+    def _plot_traces(self, traces, color=None, data_bounds=None,
+                     times=None):
         traces = traces.T
         n_samples = traces.shape[1]
         n_ch = self.n_channels
         assert traces.shape == (n_ch, n_samples)
         color = color or self.default_trace_color
 
-        t = self._interval[0] + np.arange(n_samples) * self.dt
-        t = np.tile(t, (n_ch, 1))
+        if times is None:
+            times = self._interval[0] + np.arange(n_samples) * self.dt
+        t = np.tile(times, (n_ch, 1))
         box_index = np.repeat(np.arange(n_ch)[:, np.newaxis],
                               n_samples,
                               axis=1)
@@ -216,6 +366,50 @@ class TraceView(ManualClusteringView):
         assert 0 <= start < end <= self.duration
         return start, end
 
+    def _decimated_traces(self, interval):
+        """Return the min/max decimation of the traces in an interval, or
+        None if the interval is short enough to show all samples."""
+        if self.pyramid is None:
+            return
+        # At most one bin per pixel.
+        n_bins = max(1, self.size[0])
+        start, end = (int(round(t * self.sample_rate)) for t in interval)
+        if self.pyramid.level_for(end - start, n_bins) == 0:
+            return
+        b = self.pyramid.get(start, end, n_bins)
+        logger.log(5, "Decimate the traces with bins of %d samples.",
+                   b.bin_size)
+        # NOTE: spikes are not shown when the traces are decimated, since
+        # the waveforms would be narrower than a pixel.
+        return Bunch(data=b.data, times=b.samples * self.dt, waveforms=[])
+
+    def _load_traces(self, interval):
+        if self.prefetcher is None:
+            return self.traces(interval)
+        return self.prefetcher.get(interval, self.cluster_ids or ())
+
+    def _next_intervals(self, interval):
+        """Predict the next intervals from the navigation direction."""
+        start, end = interval
+        h = (end - start) * .5
+        delay = self._direction * (end - start) * .2
+        t = start + h
+        out = []
+        for _ in range(self.n_prefetch):
+            t += delay
+            next_interval = self._restrict_interval((t - h, t + h))
+            if next_interval == interval:
+                break
+            out.append(next_interval)
+            interval = next_interval
+        return out
+
+    def _prefetch(self, interval):
+        if self.prefetcher is None:
+            return
+        self.prefetcher.prefetch(self._next_intervals(interval),
+                                 self.cluster_ids or ())
+
     # Public methods
     # -------------------------------------------------------------------------
 
@@ -227,6 +421,8 @@ class TraceView(ManualClusteringView):
         interval = self._restrict_interval(interval)
         if not force_update and interval == self._interval:
             return
+        if self._interval is not None and interval[0] != self._interval[0]:
+            self._direction = 1 if interval[0] > self._interval[0] else -1
         self._interval = interval
         start, end = interval
         self.clear()
@@ -235,8 +431,11 @@ class TraceView(ManualClusteringView):
         if change_status:
             self.set_status('Interval: {:.3f} s - {:.3f} s'.format(start, end))
 
-        # Load the traces.
-        traces = self.traces(interval)
+        # Load the traces, decimated if the interval is long.
+        traces = self._decimated_traces(interval)
+        prefetch = traces is None
+        if traces is None:
+            traces = self._load_traces(interval)
 
         # Find the data bounds.
         ymin, ymax = traces.data.min(), traces.data.max()
@@ -246,6 +445,7 @@ class TraceView(ManualClusteringView):
         self._plot_traces(traces.data,
                           color=traces.get('color', None),
                           data_bounds=data_bounds,
+                          times=traces.get('times', None),
                           )
 
         # Plot the spikes.
@@ -266,8 +466,15 @@ class TraceView(ManualClusteringView):
         self.build()
         self.update()
 
+        # Load the next intervals in the background.
+        if prefetch:
+            self._prefetch(interval)
+
     def on_select(self, cluster_ids=None, **kwargs):
         super(TraceView, self).on_select(cluster_ids, **kwargs)
+        # The prefetched intervals depend on the selected clusters.
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
         self.set_interval(self._interval, change_status=False)
 
     def attach(self, gui):
@@ -287,6 +494,12 @@ class TraceView(ManualClusteringView):
         self.actions.separator()
         self.actions.add(self.toggle_show_labels)
 
+        @gui.connect_
+        def on_close():
+            # Stop the prefetching thread.
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+
     @property
     def state(self):
         return Bunch(scaling=self.scaling,
@@ -200,7 +200,10 @@ class WaveformView(ManualClusteringView):
                        data_bounds=None,
                        )
 
-    def on_select(self, cluster_ids=None, **kwargs):
+    def get_data(self, cluster_ids, **kwargs):
+        return [self.waveforms(cluster_id) for cluster_id in cluster_ids]
+
+    def on_select(self, cluster_ids=None, data=None, **kwargs):
         super(WaveformView, self).on_select(cluster_ids, **kwargs)
         cluster_ids = self.cluster_ids
         n_clusters = len(cluster_ids)
@@ -208,8 +211,7 @@ class WaveformView(ManualClusteringView):
             return
 
         # Retrieve the waveform data.
-        bunchs = [self.waveforms(cluster_id)
-                  for cluster_id in cluster_ids]
+        bunchs = data if data is not None else self.get_data(cluster_ids)
 
         # All channel ids appearing in all selected clusters.
         channel_ids = sorted(set(_flatten([d.channel_ids for d in bunchs])))
@@ -9,7 +9,9 @@
 from contextlib import contextmanager
 from functools import wraps
 import logging
+from multiprocessing.pool import ThreadPool
 import sys
+from threading import Lock
 
 logger = logging.getLogger(__name__)
 
@@ -166,6 +168,98 @@ class AsyncCaller(object):
             self._timer.deleteLater()
 
 
+class _GUIThreadCaller(QObject):
+    """Call functions in the thread of the object, typically the GUI
+    thread."""
+    _called = pyqtSignal(object)
+
+    def __init__(self):
+        super(_GUIThreadCaller, self).__init__()
+        # Signals emitted from another thread are queued in the event loop
+        # of the receiver's thread.
+        self._called.connect(self._call)
+
+    def _call(self, f):
+        f()
+
+    def call(self, f):
+        self._called.emit(f)
+
+
+_WORKER_POOL = None
+_WORKER_POOL_LOCK = Lock()
+
+
+def _worker_pool(n_threads=2):
+    """Return the thread pool shared by all threaded callers."""
+    global _WORKER_POOL
+    with _WORKER_POOL_LOCK:
+        if _WORKER_POOL is None:
+            _WORKER_POOL = ThreadPool(n_threads)
+    return _WORKER_POOL
+
+
+class ThreadedCaller(object):
+    """Call a function in a worker thread and pass its result to a callback
+    in the GUI thread.
+
+    A new call cancels the pending one: its function is not called if it
+    has not started yet, and its callback is never called. The instance
+    must be created in the GUI thread.
+
+    """
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._gui_caller = _GUIThreadCaller()
+        # Incremented at every call or cancellation.
+        self._generation = 0
+        self._pending = False
+
+    @property
+    def is_pending(self):
+        """Whether the last call has not completed yet."""
+        return self._pending
+
+    def _run(self, generation, f, callback):
+        if generation != self._generation:
+            logger.log(5, "Skip the cancelled call to %s.", f)
+            return
+        try:
+            result = f()
+        except Exception:
+            if generation != self._generation:
+                # The call was cancelled while running, for example because
+                # its inputs changed: its error is not relevant anymore.
+                logger.debug("Error in a cancelled call to %s.", f,
+                             exc_info=True)
+            else:
+                logger.exception("Error in the worker thread.")
+            self._gui_caller.call(lambda: self._done(generation))
+            return
+        self._gui_caller.call(lambda: self._done(generation, callback,
+                                                 result))
+
+    def _done(self, generation, callback=None, result=None):
+        if generation != self._generation:
+            return
+        self._pending = False
+        if callback is not None:
+            callback(result)
+
+    def set(self, f, callback):
+        """Call `f()` in a worker thread, and then `callback(result)` in the
+        GUI thread, unless another call is set in the meantime."""
+        self._generation += 1
+        self._pending = True
+        pool = self._pool or _worker_pool()
+        pool.apply_async(self._run, (self._generation, f, callback))
+
+    def cancel(self):
+        """Cancel the pending call."""
+        self._generation += 1
+        self._pending = False
+
+
 # -----------------------------------------------------------------------------
 # Testing utilities
 # -----------------------------------------------------------------------------
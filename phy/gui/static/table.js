@@ -68,8 +68,7 @@ Table.prototype.setData = function(data) {
     // Reinitialize the state.
     this.selected = [];
     this.rows = {};
-    var keys = data.cols;
-    var that = this;
+    this.cols = data.cols || this.cols;
 
     // Clear the table body.
     var tbody = this.el.getElementsByTagName("tbody")[0];
@@ -78,62 +77,112 @@ Table.prototype.setData = function(data) {
 
     // Data rows.
     for (var i = 0; i < data.items.length; i++) {
-        tr = document.createElement("tr");
-        var row = data.items[i];
-        for (var j = 0; j < keys.length; j++) {
-            var key = keys[j];
-            var value = row[key];
-            // Format numbers.
-            if (isFloat(value))
-                value = value.toPrecision(3);
-            var td = document.createElement("td");
-            td.appendChild(document.createTextNode(value));
-            tr.appendChild(td);
-        }
+        var tr = this.createRow(data.items[i]);
+        tbody.appendChild(tr);
+        this.rows[data.items[i].id] = tr;
+    }
+};
 
-        // Set the data values on the row.
-        for (var key in row) {
-            tr.dataset[key] = row[key];
-        }
+Table.prototype.createRow = function(row) {
+    /*
+    row: object {col: value}
+     */
+    var that = this;
+    var keys = this.cols;
+    var tr = document.createElement("tr");
+    for (var j = 0; j < keys.length; j++) {
+        var key = keys[j];
+        var value = row[key];
+        // Format numbers.
+        if (isFloat(value))
+            value = value.toPrecision(3);
+        var td = document.createElement("td");
+        td.appendChild(document.createTextNode(value));
+        tr.appendChild(td);
+    }
 
-        tr.onclick = function(e) {
-            var id = parseInt(String(this.dataset.id));
-            var evt = e ? e:window.event;
-            // Control pressed: toggle selected.
-            if (evt.ctrlKey || evt.metaKey) {
-                var index = that.selected.indexOf(id);
-                // If this item is already selected, deselect it.
-                if (index != -1) {
-                    var selected = that.selected.slice();
-                    selected.splice(index, 1);
-                    that.select(selected);
-                }
-                // Otherwise, select it.
-                else {
-                    that.select(that.selected.concat([id]));
-                }
-            }
-            else if (evt.shiftKey && that.selected.length > 0) {
-                var clicked_idx = that.rows[id].rowIndex;
-                var sel_idx = that.rows[that.selected[0]].rowIndex;
-                if (sel_idx == undefined) return;
-                var i0 = Math.min(clicked_idx, sel_idx);
-                var i1 = Math.max(clicked_idx, sel_idx);
-                var sel = [];
-                for (var i = i0; i <= i1; i++) {
-                    sel.push(that.el.rows[i].dataset.id);
-                }
-                that.select(sel);
+    // Set the data values on the row.
+    for (var key in row) {
+        tr.dataset[key] = row[key];
+    }
+
+    tr.onclick = function(e) {
+        var id = parseInt(String(this.dataset.id));
+        var evt = e ? e:window.event;
+        // Control pressed: toggle selected.
+        if (evt.ctrlKey || evt.metaKey) {
+            var index = that.selected.indexOf(id);
+            // If this item is already selected, deselect it.
+            if (index != -1) {
+                var selected = that.selected.slice();
+                selected.splice(index, 1);
+                that.select(selected);
             }
-            // Otherwise, select just that item.
+            // Otherwise, select it.
             else {
-                that.select([id]);
+                that.select(that.selected.concat([id]));
+            }
+        }
+        else if (evt.shiftKey && that.selected.length > 0) {
+            var clicked_idx = that.rows[id].rowIndex;
+            var sel_idx = that.rows[that.selected[0]].rowIndex;
+            if (sel_idx == undefined) return;
+            var i0 = Math.min(clicked_idx, sel_idx);
+            var i1 = Math.max(clicked_idx, sel_idx);
+            var sel = [];
+            for (var i = i0; i <= i1; i++) {
+                sel.push(that.el.rows[i].dataset.id);
             }
+            that.select(sel);
+        }
+        // Otherwise, select just that item.
+        else {
+            that.select([id]);
         }
+    }
 
-        tbody.appendChild(tr);
-        this.rows[data.items[i].id] = tr;
+    return tr;
+};
+
+Table.prototype.updateRows = function(data) {
+    /*
+    data.added: list of new rows (each row is an object {col: value})
+    data.deleted: list of ids of the rows to remove
+    data.changed: list of rows to replace
+     */
+    var tbody = this.el.getElementsByTagName("tbody")[0];
+
+    // Remove the deleted rows.
+    var deleted = data.deleted || [];
+    for (var i = 0; i < deleted.length; i++) {
+        var id = deleted[i];
+        var tr = this.rows[id];
+        if (tr) {
+            tbody.removeChild(tr);
+            delete this.rows[id];
+        }
+        var index = this.selected.indexOf(id);
+        if (index != -1)
+            this.selected.splice(index, 1);
+    }
+
+    // Add the new rows, and replace the changed rows.
+    var items = (data.added || []).concat(data.changed || []);
+    for (var i = 0; i < items.length; i++) {
+        var id = items[i].id;
+        var tr = this.createRow(items[i]);
+        var old = this.rows[id];
+        if (old) {
+            if (old.classList.contains('selected'))
+                tr.classList.add('selected');
+            tbody.replaceChild(tr, old);
+        }
+        else {
+            tbody.appendChild(tr);
+        }
+        this.rows[id] = tr;
     }
+    this.nrows = tbody.rows.length;
 };
 
 Table.prototype.rowId = function(i) {
@@ -18,6 +18,7 @@ from ..qt import (QMessageBox, Qt, QWebView, QTimer,
                   QApplication,
                   busy_cursor,
                   AsyncCaller,
+                  ThreadedCaller,
                   )
 
 
@@ -140,3 +141,28 @@ def test_async_caller(qtbot):
     qtbot.wait(20)
 
     assert _l == [0, 0]
+
+
+def test_threaded_caller(qtbot):
+    tc = ThreadedCaller()
+
+    _l = []
+
+    tc.set(lambda: 1 + 1, _l.append)
+    assert tc.is_pending
+    qtbot.wait(100)
+    assert not tc.is_pending
+    assert _l == [2]
+
+    # A new call cancels the pending one.
+    tc.set(lambda: 3, _l.append)
+    tc.set(lambda: 4, _l.append)
+    qtbot.wait(100)
+    assert _l == [2, 4]
+
+    # Cancellation.
+    tc.set(lambda: 5, _l.append)
+    tc.cancel()
+    assert not tc.is_pending
+    qtbot.wait(20)
+    assert _l == [2, 4]
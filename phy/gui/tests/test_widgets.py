@@ -6,6 +6,7 @@
 # Imports
 #------------------------------------------------------------------------------
 
+import numpy as np
 from pytest import yield_fixture, raises
 
 from ..widgets import HTMLWidget, Table
@@ -189,3 +190,60 @@ def test_table_sort(qtbot, table):
     assert table.current_sort == ('count', 'desc')
 
     # qtbot.stop()
+
+
+def test_table_vectorized(qtbot):
+    table = Table()
+    table.show()
+
+    _calls = []
+
+    def count(ids):
+        _calls.append(ids)
+        return np.array(ids) * 10
+    table.add_column(count, vectorized=True)
+    table.set_rows(range(10))
+    assert len(_calls) == 1
+
+    table.sort_by('count', 'desc')
+    table.next()
+    assert table.selected == [9]
+
+    table.close()
+
+
+def test_table_update_rows(qtbot):
+    table = Table()
+    table.show()
+
+    _skipped = set([4])
+    table.add_column(lambda id: id in _skipped, name='skip')
+    table.set_rows(range(10))
+    table.select([3])
+
+    # Remove and add rows.
+    table.update_rows(added=[10, 11], deleted=[3, 5])
+    assert table.selected == []
+    assert table.eval_js('table.nrows') == 10
+    table.select([2])
+    table.next()
+    assert table.selected == [6]
+    table.select([9])
+    table.next()
+    assert table.selected == [10]
+
+    # Update a row: 10 is now skipped.
+    _skipped.add(10)
+    table.update_rows(changed=[10])
+    table.select([9])
+    table.next()
+    assert table.selected == [11]
+
+    # The current sort is kept.
+    table.sort_by('id', 'desc')
+    table.update_rows(added=[12])
+    table.select([12])
+    table.next()
+    assert table.selected == [11]
+
+    table.close()
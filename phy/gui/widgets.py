@@ -247,17 +247,25 @@ class Table(HTMLWidget):
                       </script>'''.format(self._table_id))
         self._columns = OrderedDict()
         self._default_sort = (None, None)
-        self.add_column(lambda _: _, name='id')
+        # Ids of the rows currently in the table.
+        self._row_ids = []
+        self.add_column(lambda ids: ids, name='id', vectorized=True)
 
-    def add_column(self, func, name=None, show=True):
+    def add_column(self, func, name=None, show=True, vectorized=False):
         """Add a column function which takes an id as argument and
-        returns a value."""
+        returns a value.
+
+        If `vectorized` is True, the function takes a list of ids and
+        returns the list or array of the corresponding values.
+
+        """
         assert func
         name = name or func.__name__
         if name == '<lambda>':
             raise ValueError("Please provide a valid name for " + name)
         d = {'func': func,
              'show': show,
+             'vectorized': vectorized,
              }
         self._columns[name] = d
 
@@ -274,25 +282,48 @@ class Table(HTMLWidget):
         return [name for (name, d) in self._columns.items()
                 if d.get('show', True)]
 
-    def _get_row(self, id):
-        """Create a row dictionary for a given object id."""
-        return {name: d['func'](id) for (name, d) in self._columns.items()}
+    def _get_column(self, name, ids):
+        """Return the list of the values of a column for some ids."""
+        d = self._columns[name]
+        if d.get('vectorized', False):
+            values = d['func'](ids)
+            assert len(values) == len(ids)
+        else:
+            values = [d['func'](id) for id in ids]
+        # NOTE: tolist() converts NumPy scalars to Python objects, which are
+        # much faster to serialize.
+        return values.tolist() if hasattr(values, 'tolist') else values
+
+    def _get_rows(self, ids):
+        """Create the row dictionaries for some object ids, column by
+        column."""
+        columns = [(name, self._get_column(name, ids))
+                   for name in self._columns]
+        return [{name: values[i] for name, values in columns}
+                for i in range(len(ids))]
+
+    def _get_sort(self):
+        """Return the current sort, or the default sort."""
+        sort_col, sort_dir = self.current_sort
+        default_sort_col, default_sort_dir = self.default_sort
+
+        sort_col = sort_col or default_sort_col
+        sort_dir = sort_dir or default_sort_dir or 'desc'
+        return sort_col, sort_dir
 
     def set_rows(self, ids):
         """Set the rows of the table."""
         # NOTE: make sure we have integers and not np.generic objects.
         assert all(isinstance(i, int) for i in ids)
+        ids = list(ids)
 
         # Determine the sort column and dir to set after the rows.
-        sort_col, sort_dir = self.current_sort
-        default_sort_col, default_sort_dir = self.default_sort
-
-        sort_col = sort_col or default_sort_col
-        sort_dir = sort_dir or default_sort_dir or 'desc'
+        sort_col, sort_dir = self._get_sort()
 
         # Set the rows.
         logger.log(5, "Set %d rows in the table.", len(ids))
-        items = [self._get_row(id) for id in ids]
+        items = self._get_rows(ids)
+        self._row_ids = ids
         # Sort the rows before passing them to the widget.
         # if sort_col:
         #     items = sorted(items, key=itemgetter(sort_col),
@@ -306,6 +337,36 @@ class Table(HTMLWidget):
         if sort_col:
             self.sort_by(sort_col, sort_dir)
 
+    def update_rows(self, added=(), deleted=(), changed=()):
+        """Add, remove, and update some rows of the table.
+
+        Only the specified rows are sent to the widget. This is typically
+        called with the `added` and `deleted` clusters of an `UpdateInfo`
+        instance.
+
+        """
+        existing = set(self._row_ids)
+        added = [int(i) for i in added]
+        deleted = set(int(i) for i in deleted)
+        changed = [int(i) for i in changed
+                   if i not in deleted and i in existing]
+        if not added and not deleted and not changed:
+            return
+        logger.log(5, "Add %d, remove %d, and update %d rows in the table.",
+                   len(added), len(deleted), len(changed))
+        sort_col, sort_dir = self._get_sort()
+        self._row_ids = ([id for id in self._row_ids if id not in deleted] +
+                         [id for id in added if id not in existing])
+        data = _create_json_dict(added=self._get_rows(added),
+                                 deleted=sorted(deleted),
+                                 changed=self._get_rows(changed),
+                                 )
+        self.eval_js('table.updateRows({});'.format(data))
+
+        # Sort.
+        if sort_col:
+            self.sort_by(sort_col, sort_dir)
+
     def sort_by(self, name, sort_dir='asc'):
         """Sort by a given variable."""
         logger.log(5, "Sort by `%s` %s.", name, sort_dir)
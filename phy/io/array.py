@@ -11,11 +11,12 @@ import logging
 import math
 from math import floor, exp
 from operator import itemgetter
+import os
 import os.path as op
 
 import numpy as np
 
-from phy.utils import _as_scalar, _as_scalars
+from phy.utils import Bunch, _as_scalar, _as_scalars, _save_json, _load_json
 from phy.utils._types import _as_array, _is_array_like
 
 logger = logging.getLogger(__name__)
@@ -180,17 +181,54 @@ def _get_padded(data, start, end):
         return data[start:end]
 
 
-def _in_polygon(points, polygon):
-    """Return the points that are inside a polygon."""
-    from matplotlib.path import Path
+def _crossing_number(points, polygon):
+    """Return whether points are inside a polygon, with the even-odd rule.
+
+    For every edge, the points whose horizontal ray crosses the edge are
+    toggled.
+
+    """
+    x, y = points[:, 0], points[:, 1]
+    inside = np.zeros(len(points), dtype=np.bool_)
+    # Edges (x0, y0) -> (x1, y1), including the closing edge.
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, 1), np.roll(y0, 1)
+    for k in range(len(polygon)):
+        # Horizontal edges are never crossed.
+        if y0[k] == y1[k]:
+            continue
+        crosses = (y0[k] > y) != (y1[k] > y)
+        slope = (x1[k] - x0[k]) / (y1[k] - y0[k])
+        crosses &= x < x0[k] + (y - y0[k]) * slope
+        inside ^= crosses
+    return inside
+
+
+def _in_polygon(points, polygon, chunk_size=None):
+    """Return the points that are inside a polygon.
+
+    Only the points in the bounding box of the polygon are tested, with a
+    vectorized crossing number test. The points are processed by chunks of
+    `chunk_size` points, so that they may be memory-mapped.
+
+    """
     points = _as_array(points)
-    polygon = _as_array(polygon)
+    polygon = _as_array(polygon).astype(np.float64)
     assert points.ndim == 2
     assert polygon.ndim == 2
-    if len(polygon):
-        polygon = np.vstack((polygon, polygon[0]))
-    path = Path(polygon, closed=True)
-    return path.contains_points(points)
+    n = len(points)
+    out = np.zeros(n, dtype=np.bool_)
+    if len(polygon) < 3:
+        return out
+    (xmin, ymin), (xmax, ymax) = polygon.min(axis=0), polygon.max(axis=0)
+    chunk_size = chunk_size or 1 << 20
+    for i in range(0, n, chunk_size):
+        p = np.asarray(points[i:i + chunk_size])
+        # Bounding box prefilter.
+        idx = np.nonzero((p[:, 0] >= xmin) & (p[:, 0] <= xmax) &
+                         (p[:, 1] >= ymin) & (p[:, 1] <= ymax))[0]
+        out[i + idx] = _crossing_number(p[idx].astype(np.float64), polygon)
+    return out
 
 
 def _get_data_lim(arr, n_spikes=None):
@@ -238,32 +276,6 @@ def write_array(path, arr):
 # Virtual concatenation
 # -----------------------------------------------------------------------------
 
-def _start_stop(item):
-    """Find the start and stop indices of a __getitem__ item.
-
-    This is used only by ConcatenatedArrays.
-
-    Only two cases are supported currently:
-
-    * Single integer.
-    * Contiguous slice in the first dimension only.
-
-    """
-    if isinstance(item, tuple):
-        item = item[0]
-    if isinstance(item, slice):
-        # Slice.
-        if item.step not in (None, 1):
-            raise NotImplementedError()
-        return item.start, item.stop
-    elif isinstance(item, (list, np.ndarray)):
-        # List or array of indices.
-        return np.min(item), np.max(item)
-    else:
-        # Integer.
-        return item, item + 1
-
-
 def _fill_index(arr, item):
     if isinstance(item, tuple):
         item = (slice(None, None, None),) + item[1:]
@@ -274,7 +286,14 @@ def _fill_index(arr, item):
 
 class ConcatenatedArrays(object):
     """This object represents a concatenation of several memory-mapped
-    arrays."""
+    arrays.
+
+    The rows of the virtual array are found in the underlying arrays with a
+    binary search on the offsets. Slices within a single array are
+    returned without copy, other requests are gathered in a single
+    preallocated buffer directly from the underlying arrays.
+
+    """
     def __init__(self, arrs, cols=None, scaling=None):
         assert isinstance(arrs, list)
         self.arrs = arrs
@@ -296,54 +315,85 @@ class ConcatenatedArrays(object):
 
     def _get_recording(self, index):
         """Return the recording that contains a given index."""
-        assert index >= 0
-        recs = np.nonzero((index - self.offsets[:-1]) >= 0)[0]
-        if len(recs) == 0:  # pragma: no cover
-            # If the index is greater than the total size,
-            # return the last recording.
-            return len(self.arrs) - 1
-        # Return the last recording such that the index is greater than
-        # its offset.
-        return recs[-1]
-
-    def _get(self, item):
-        cols = self.cols if self.cols is not None else slice(None, None, None)
-        # Get the start and stop indices of the requested item.
-        start, stop = _start_stop(item)
-        # Return the concatenation of all arrays.
-        if start is None and stop is None:
-            return np.concatenate(self.arrs, axis=0)[..., cols]
-        if start is None:
-            start = 0
-        if stop is None:
-            stop = self.offsets[-1]
-        if stop < 0:
-            stop = self.offsets[-1] + stop
-        # Get the recording indices of the first and last item.
+        assert np.all(index >= 0)
+        # Last recording such that the index is greater than its offset.
+        # If the index is greater than the total size, return the last
+        # recording.
+        recs = np.searchsorted(self.offsets, index, side='right') - 1
+        return np.minimum(recs, len(self.arrs) - 1)
+
+    def _empty(self, n, item, cols):
+        """Allocate the output buffer for `n` rows."""
+        # Apply the rest of the index to an empty array to find out
+        # the shape of the output.
+        probe = _fill_index(self.arrs[0][:0], item)[..., cols]
+        return np.empty((n,) + probe.shape[1:], dtype=probe.dtype)
+
+    def _get_slice(self, start, stop, step, item, cols):
+        """Return the rows `start:stop:step` where `step` is positive."""
+        n = len(range(start, stop, step))
+        if n == 0:
+            return self._empty(0, item, cols)
         rec_start = self._get_recording(start)
-        rec_stop = self._get_recording(stop)
+        rec_stop = self._get_recording(start + (n - 1) * step)
         assert 0 <= rec_start <= rec_stop < len(self.arrs)
-        # Find the start and stop relative to the arrays.
-        start_rel = start - self.offsets[rec_start]
-        stop_rel = stop - self.offsets[rec_stop]
-        # Single array case.
+        # Single array case: no copy.
         if rec_start == rec_stop:
-            # Apply the rest of the index.
-            out = _fill_index(self.arrs[rec_start][start_rel:stop_rel], item)
-            out = out[..., cols]
+            offset = self.offsets[rec_start]
+            out = self.arrs[rec_start][start - offset:stop - offset:step]
+            return _fill_index(out, item)[..., cols]
+        # Fill the output buffer with the chunks of every array.
+        out = self._empty(n, item, cols)
+        for rec in range(rec_start, rec_stop + 1):
+            offset, offset_next = self.offsets[rec], self.offsets[rec + 1]
+            # First index of the slice in the current recording.
+            i = start + max(0, -((start - offset) // step)) * step
+            j = min(stop, offset_next)
+            if i >= j:
+                continue
+            k = (i - start) // step
+            chunk = self.arrs[rec][i - offset:j - offset:step]
+            out[k:k + len(chunk)] = _fill_index(chunk, item)[..., cols]
+        return out
+
+    def _get_indices(self, indices, item, cols):
+        """Return arbitrary rows of the virtual array."""
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + self.offsets[-1], indices)
+        out = self._empty(len(indices), item, cols)
+        if not len(indices):
             return out
-        chunk_start = self.arrs[rec_start][start_rel:]
-        chunk_stop = self.arrs[rec_stop][:stop_rel]
-        # Concatenate all chunks.
-        l = [chunk_start]
-        if rec_stop - rec_start >= 2:
-            logger.warn("Loading a full virtual array: this might be slow "
-                        "and something might be wrong.")
-            l += [self.arrs[r][...] for r in range(rec_start + 1,
-                                                   rec_stop)]
-        l += [chunk_stop]
-        # Apply the rest of the index.
-        return _fill_index(np.concatenate(l, axis=0), item)[..., cols]
+        if indices.min() < 0 or indices.max() >= self.offsets[-1]:
+            raise IndexError("Index out of bounds.")
+        recs = self._get_recording(indices)
+        # Group the requested rows per recording.
+        order = np.argsort(recs, kind='mergesort')
+        recs_sorted = recs[order]
+        bounds = np.flatnonzero(np.diff(recs_sorted)) + 1
+        bounds = np.concatenate([[0], bounds, [len(order)]])
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            rec = recs_sorted[a]
+            idx = order[a:b]
+            chunk = self.arrs[rec][indices[idx] - self.offsets[rec]]
+            out[idx] = _fill_index(chunk, item)[..., cols]
+        return out
+
+    def _get(self, item):
+        cols = self.cols if self.cols is not None else slice(None, None, None)
+        n = self.offsets[-1]
+        rows = item[0] if isinstance(item, tuple) else item
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(n)
+            if step > 0:
+                return self._get_slice(start, stop, step, item, cols)
+            return self._get_indices(np.arange(start, stop, step), item, cols)
+        elif isinstance(rows, (list, np.ndarray)):
+            return self._get_indices(rows, item, cols)
+        # Integer: return a single row, keeping the first dimension.
+        rows = int(rows)
+        if rows < 0:
+            rows += n
+        return self._get_slice(rows, rows + 1, 1, item, cols)
 
     def __getitem__(self, item):
         out = self._get(item)
@@ -462,10 +512,18 @@ def get_excerpts(data, n_excerpts=None, excerpt_size=None):
 # Spike clusters utility functions
 # -----------------------------------------------------------------------------
 
-def _spikes_in_clusters(spike_clusters, clusters):
-    """Return the ids of all spikes belonging to the specified clusters."""
+def _spikes_in_clusters(spike_clusters, clusters, spikes_per_cluster=None):
+    """Return the ids of all spikes belonging to the specified clusters.
+
+    If `spikes_per_cluster` is specified, it is used instead of a full scan
+    of `spike_clusters`.
+
+    """
     if len(spike_clusters) == 0 or len(clusters) == 0:
         return np.array([], dtype=np.int)
+    if spikes_per_cluster is not None:
+        return np.sort(np.concatenate([spikes_per_cluster[c]
+                                       for c in clusters])).astype(np.int64)
     return np.nonzero(np.in1d(spike_clusters, clusters))[0]
 
 
@@ -503,27 +561,430 @@ def _flatten_per_cluster(per_cluster):
     return np.sort(np.concatenate(list(per_cluster.values()))).astype(np.int64)
 
 
+def _spikes_per_cluster_csr(spikes_per_cluster):
+    """Convert a dictionary `{cluster: spike_ids}` to a CSR layout
+    `(cluster_ids, offsets, spike_ids)`."""
+    cluster_ids = np.array(sorted(spikes_per_cluster), dtype=np.int64)
+    counts = [len(spikes_per_cluster[c]) for c in cluster_ids]
+    offsets = np.zeros(len(cluster_ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    spike_ids = np.empty(offsets[-1], dtype=np.int64)
+    for i, c in enumerate(cluster_ids):
+        spike_ids[offsets[i]:offsets[i + 1]] = spikes_per_cluster[c]
+    return cluster_ids, offsets, spike_ids
+
+
+class SpikesPerCluster(object):
+    """Dictionary `{cluster: spike_ids}` stored on disk in a CSR layout.
+
+    Every save writes a new layer with the clusters that were added since
+    the last save, and the list of deleted clusters. A layer contains the
+    sorted cluster ids, the cluster offsets, and the concatenated spike ids
+    of all clusters. The layers are memory-mapped with `read_array()` and
+    the spike ids of a cluster are only read when it is accessed.
+
+    Parameters
+    ----------
+
+    path : str
+        Path to the directory of the store.
+    max_layers : int
+        Maximum number of layers: beyond, all clusters are rewritten in a
+        single layer at the next save.
+
+    """
+    def __init__(self, path=None, max_layers=20):
+        self.path = path
+        self.max_layers = max_layers
+        # Clusters added since the last save.
+        self._added = {}
+        # Clusters deleted from the layers.
+        self._deleted = set()
+        # List of (layer_id, cluster_ids, offsets, spike_ids), in order.
+        self._layers = []
+        if path and op.exists(self._index_path):
+            self._load()
+
+    # Disk layout
+    # -------------------------------------------------------------------------
+
+    @property
+    def _index_path(self):
+        return op.join(self.path, 'index.json')
+
+    def _layer_path(self, layer_id, name):
+        return op.join(self.path, 'layer_{}.{}.npy'.format(layer_id, name))
+
+    def _read_layer(self, layer_id):
+        return (layer_id,) + tuple(read_array(self._layer_path(layer_id, n),
+                                              mmap_mode='r')
+                                   for n in ('cluster_ids', 'offsets',
+                                             'spike_ids'))
+
+    def _load(self):
+        index = _load_json(self._index_path)
+        self._layers = [self._read_layer(layer_id)
+                        for layer_id in index.get('layers', [])]
+        self._deleted = set(index.get('deleted', []))
+        logger.debug("Open spikes_per_cluster store with %d layer(s).",
+                     len(self._layers))
+
+    def _write_layer(self, spikes_per_cluster):
+        layer_id = self._layers[-1][0] + 1 if self._layers else 0
+        arrs = _spikes_per_cluster_csr(spikes_per_cluster)
+        for name, arr in zip(('cluster_ids', 'offsets', 'spike_ids'), arrs):
+            write_array(self._layer_path(layer_id, name), arr)
+        self._layers.append(self._read_layer(layer_id))
+
+    def _remove_layer(self, layer_id):
+        for name in ('cluster_ids', 'offsets', 'spike_ids'):
+            try:
+                os.remove(self._layer_path(layer_id, name))
+            except OSError:  # pragma: no cover
+                # The file may still be in use on some platforms.
+                logger.debug("Unable to remove layer %d.", layer_id)
+
+    def save(self):
+        """Write the changes since the last save to disk.
+
+        Only the added clusters are written in a new layer, unless there
+        are too many layers, in which case all clusters are rewritten.
+
+        """
+        assert self.path
+        if not op.exists(self.path):
+            os.makedirs(self.path)
+        old_layers = []
+        if len(self._layers) >= self.max_layers:
+            # Compact all layers into a single one. The files are never
+            # overwritten, since they may still be memory-mapped.
+            self._added = {c: self[c] for c in self}
+            self._deleted = set()
+            old_layers = [layer[0] for layer in self._layers]
+        if self._added or not self._layers:
+            self._write_layer(self._added)
+            self._added = {}
+        self._layers = [layer for layer in self._layers
+                        if layer[0] not in old_layers]
+        _save_json(self._index_path,
+                   {'layers': [int(layer[0]) for layer in self._layers],
+                    'deleted': sorted(int(c) for c in self._deleted),
+                    })
+        for layer_id in old_layers:
+            self._remove_layer(layer_id)
+
+    # Dictionary interface
+    # -------------------------------------------------------------------------
+
+    def _find_in_layers(self, cluster_id):
+        # A cluster may be deleted and added again, in which case the most
+        # recent layer is used.
+        for _, cluster_ids, offsets, spike_ids in self._layers[::-1]:
+            i = np.searchsorted(cluster_ids, cluster_id)
+            if i < len(cluster_ids) and cluster_ids[i] == cluster_id:
+                return spike_ids[offsets[i]:offsets[i + 1]]
+
+    def _find(self, cluster_id):
+        if cluster_id in self._added:
+            return self._added[cluster_id]
+        if cluster_id in self._deleted:
+            return
+        return self._find_in_layers(cluster_id)
+
+    def __getitem__(self, cluster_id):
+        out = self._find(cluster_id)
+        if out is None:
+            raise KeyError(cluster_id)
+        return out
+
+    def get(self, cluster_id, default=None):
+        out = self._find(cluster_id)
+        return default if out is None else out
+
+    def __contains__(self, cluster_id):
+        return self._find(cluster_id) is not None
+
+    def __setitem__(self, cluster_id, spike_ids):
+        self._added[cluster_id] = spike_ids
+        self._deleted.discard(cluster_id)
+
+    def pop(self, cluster_id, *args):
+        out = self._find(cluster_id)
+        if out is None:
+            if args:
+                return args[0]
+            raise KeyError(cluster_id)
+        self._added.pop(cluster_id, None)
+        if self._find_in_layers(cluster_id) is not None:
+            self._deleted.add(cluster_id)
+        return out
+
+    def __delitem__(self, cluster_id):
+        self.pop(cluster_id)
+
+    def keys(self):
+        keys = set(self._added)
+        for _, cluster_ids, _, _ in self._layers:
+            keys.update(int(c) for c in cluster_ids)
+        keys -= self._deleted
+        keys.update(self._added)
+        return sorted(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[c] for c in self]
+
+    def items(self):
+        return [(c, self[c]) for c in self]
+
+    def update(self, spikes_per_cluster):
+        for c, spike_ids in spikes_per_cluster.items():
+            self[c] = spike_ids
+
+    def clear(self):
+        """Delete all clusters."""
+        self._added = {}
+        for _, cluster_ids, _, _ in self._layers:
+            self._deleted.update(int(c) for c in cluster_ids)
+
+
+def _sorted_segments(spike_clusters):
+    """Return the permutation sorting the spikes by cluster, the sorted
+    cluster ids, the start of every cluster in the sorted spikes, and the
+    number of spikes in every cluster."""
+    cluster_ids = _unique(spike_clusters)
+    spike_clusters_rel = _index_of(spike_clusters, cluster_ids)
+    # NOTE: the stable sort is a fast radix sort on small integers.
+    if len(cluster_ids) <= 65536:
+        spike_clusters_rel = spike_clusters_rel.astype(np.uint16)
+    order = np.argsort(spike_clusters_rel, kind='mergesort')
+    counts = np.bincount(spike_clusters_rel, minlength=len(cluster_ids))
+    starts = np.zeros(len(cluster_ids), dtype=np.int64)
+    starts[1:] = np.cumsum(counts)[:-1]
+    return order, cluster_ids, starts, counts
+
+
+def _grouped_moments(arr, spike_clusters):
+    """Return the cluster ids, and the count, mean, sum of squared
+    deviations, min, and max of every cluster.
+
+    The reductions are computed with `reduceat()` on the spikes sorted by
+    cluster.
+
+    """
+    n = len(spike_clusters)
+    if n == 0:
+        shape = (0,) + arr.shape[1:]
+        return (np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+                np.zeros(shape), np.zeros(shape),
+                np.zeros(shape), np.zeros(shape))
+    order, cluster_ids, starts, count = _sorted_segments(spike_clusters)
+    x = np.asarray(arr)[order].astype(np.float64)
+    shape = (-1,) + (1,) * (x.ndim - 1)
+    mean = np.add.reduceat(x, starts, axis=0) / count.reshape(shape)
+    # Two-pass sum of squared deviations, for numerical stability.
+    d = x - np.repeat(mean, count, axis=0)
+    m2 = np.add.reduceat(d * d, starts, axis=0)
+    return (cluster_ids, count, mean, m2,
+            np.minimum.reduceat(x, starts, axis=0),
+            np.maximum.reduceat(x, starts, axis=0))
+
+
+def _combine_moments(a, b):
+    """Combine the count, mean, sum of squared deviations, min, and max of
+    two sets of spikes."""
+    na, ma, m2a, mina, maxa = a
+    nb, mb, m2b, minb, maxb = b
+    n = na + nb
+    shape = (-1,) + (1,) * (ma.ndim - 1)
+    wb = (nb / n.astype(np.float64)).reshape(shape)
+    delta = mb - ma
+    return (n,
+            ma + delta * wb,
+            m2a + m2b + delta * delta * (na.reshape(shape) * wb),
+            np.minimum(mina, minb),
+            np.maximum(maxa, maxb))
+
+
+def _grouped_stats(cluster_ids, count, mean, m2, mn, mx):
+    shape = (-1,) + (1,) * (mean.ndim - 1)
+    return Bunch(cluster_ids=cluster_ids,
+                 count=count,
+                 sum=mean * count.reshape(shape),
+                 mean=mean,
+                 var=m2 / count.reshape(shape),
+                 min=mn,
+                 max=mx,
+                 )
+
+
+def _grouped_moments_chunked(arr, spike_clusters, chunk_size=None,
+                             spike_ids=None):
+    """Like `_grouped_moments()`, but process the spikes by chunks.
+
+    If `spike_ids` is set, only these rows of `arr` are used, and
+    `spike_clusters` contains their clusters.
+
+    """
+    n = len(spike_clusters)
+
+    def _rows(i, j):
+        if spike_ids is None:
+            return arr[i:j]
+        return arr[spike_ids[i:j]]
+
+    if chunk_size is None or chunk_size >= n:
+        return _grouped_moments(_rows(0, n), spike_clusters)
+    cluster_ids = _unique(spike_clusters)
+    n_clusters = len(cluster_ids)
+    shape = (n_clusters,) + arr.shape[1:]
+    total = (np.zeros(n_clusters, dtype=np.int64),
+             np.zeros(shape), np.zeros(shape),
+             np.full(shape, np.inf), np.full(shape, -np.inf))
+    for i in range(0, n, chunk_size):
+        j = min(n, i + chunk_size)
+        moments = _grouped_moments(_rows(i, j), spike_clusters[i:j])
+        idx = _index_of(moments[0], cluster_ids)
+        combined = _combine_moments([t[idx] for t in total], moments[1:])
+        for t, c in zip(total, combined):
+            t[idx] = c
+    return (cluster_ids,) + total
+
+
+def grouped_stats(arr, spike_clusters, chunk_size=None):
+    """Compute the count, sum, mean, variance, min, and max of a
+    spike-dependent quantity for every cluster.
+
+    Parameters
+    ----------
+
+    arr : array
+        An array with `n_spikes` rows, and any number of dimensions. It may
+        be memory-mapped.
+    spike_clusters : array
+        The cluster of every spike.
+    chunk_size : int
+        If set, the spikes are processed by chunks of `chunk_size` spikes
+        and the statistics of the chunks are combined. This bounds the
+        memory usage with memory-mapped arrays.
+
+    Returns
+    -------
+
+    stats : Bunch
+        With the keys `cluster_ids` (sorted in increasing order), `count`,
+        `sum`, `mean`, `var`, `min`, and `max`. The variance is the
+        population variance.
+
+    """
+    spike_clusters = np.asarray(spike_clusters)
+    assert arr.shape[0] == len(spike_clusters)
+    return _grouped_stats(*_grouped_moments_chunked(arr, spike_clusters,
+                                                    chunk_size))
+
+
 def grouped_mean(arr, spike_clusters):
     """Compute the mean of a spike-dependent quantity for every cluster.
 
-    The two arguments should be 1D array with `n_spikes` elements.
+    The first dimension of `arr` should have `n_spikes` elements.
 
-    The output is a 1D array with `n_clusters` elements. The clusters are
+    The output is an array with `n_clusters` rows. The clusters are
     sorted in increasing order.
 
     """
     arr = np.asarray(arr)
     spike_clusters = np.asarray(spike_clusters)
-    assert arr.ndim == 1
     assert arr.shape[0] == len(spike_clusters)
-    cluster_ids = _unique(spike_clusters)
-    spike_clusters_rel = _index_of(spike_clusters, cluster_ids)
-    spike_counts = np.bincount(spike_clusters_rel)
-    assert len(spike_counts) == len(cluster_ids)
-    t = np.zeros(len(cluster_ids))
-    # Compute the sum with possible repetitions.
-    np.add.at(t, spike_clusters_rel, arr)
-    return t / spike_counts
+    if not len(spike_clusters):
+        return np.zeros((0,) + arr.shape[1:])
+    if arr.ndim == 1:
+        # A weighted bincount is the fastest grouped sum in 1D.
+        cluster_ids = _unique(spike_clusters)
+        spike_clusters_rel = _index_of(spike_clusters, cluster_ids)
+        return (np.bincount(spike_clusters_rel, weights=arr) /
+                np.bincount(spike_clusters_rel))
+    order, _, starts, counts = _sorted_segments(spike_clusters)
+    shape = (-1,) + (1,) * (arr.ndim - 1)
+    return (np.add.reduceat(arr[order], starts, axis=0) /
+            counts.reshape(shape))
+
+
+class GroupedStats(object):
+    """Per-cluster statistics of a spike-dependent quantity, updated
+    incrementally after clustering changes.
+
+    The statistics of every cluster are computed once. Cluster ids are
+    never reused, so the statistics of the deleted clusters are kept for
+    undo. The statistics of a merged cluster are obtained by combining
+    the statistics of the merged clusters, without reading the data.
+
+    Parameters
+    ----------
+
+    arr : array
+        An array with `n_spikes` rows, possibly memory-mapped.
+    spike_clusters : array
+        The cluster of every spike.
+    chunk_size : int
+        Number of spikes processed at once.
+
+    """
+    def __init__(self, arr, spike_clusters, chunk_size=None):
+        self.arr = arr
+        self.chunk_size = chunk_size
+        # Dictionary `{cluster: (count, mean, m2, min, max)}`.
+        self._moments = {}
+        self._add(spike_clusters)
+
+    def _add(self, spike_clusters, spike_ids=None):
+        moments = _grouped_moments_chunked(self.arr,
+                                           np.asarray(spike_clusters),
+                                           self.chunk_size,
+                                           spike_ids=spike_ids)
+        for i, cluster in enumerate(moments[0]):
+            self._moments[int(cluster)] = tuple(m[i:i + 1]
+                                                for m in moments[1:])
+
+    def update(self, up, spike_clusters):
+        """Update the statistics after a clustering change.
+
+        Parameters
+        ----------
+
+        up : UpdateInfo
+            The clustering change.
+        spike_clusters : array
+            The cluster of every spike after the change.
+
+        """
+        added = [int(c) for c in up.added if int(c) not in self._moments]
+        if not added:
+            return
+        if (up.description == 'merge' and len(added) == 1 and
+                all(int(c) in self._moments for c in up.deleted)):
+            # Combine the statistics of the merged clusters.
+            moments = [self._moments[int(c)] for c in up.deleted]
+            combined = moments[0]
+            for m in moments[1:]:
+                combined = _combine_moments(combined, m)
+            self._moments[added[0]] = combined
+            return
+        # Compute the statistics of the new clusters from their spikes.
+        spike_ids = np.asarray(up.spike_ids, dtype=np.int64)
+        spike_ids = spike_ids[np.in1d(spike_clusters[spike_ids], added)]
+        self._add(spike_clusters[spike_ids], spike_ids=spike_ids)
+
+    def get(self, cluster_ids):
+        """Return the statistics of some clusters, as returned by
+        `grouped_stats()`."""
+        moments = [self._moments[int(c)] for c in cluster_ids]
+        return _grouped_stats(np.asarray(cluster_ids),
+                              *(np.concatenate(m) for m in zip(*moments)))
 
 
 def regular_subset(spikes, n_spikes_max=None, offset=0):
@@ -9,6 +9,7 @@
 import os.path as op
 
 import numpy as np
+from numpy.testing import assert_allclose as ac
 from pytest import raises
 
 from ..array import (_unique,
@@ -17,11 +18,11 @@ from ..array import (_unique,
                      _in_polygon,
                      _spikes_in_clusters,
                      _spikes_per_cluster,
+                     SpikesPerCluster,
                      _flatten_per_cluster,
                      get_closest_clusters,
                      _get_data_lim,
                      _flatten,
-                     _start_stop,
                      select_spikes,
                      Selector,
                      chunk_bounds,
@@ -29,6 +30,8 @@ from ..array import (_unique,
                      excerpts,
                      data_chunk,
                      grouped_mean,
+                     grouped_stats,
+                     GroupedStats,
                      get_excerpts,
                      _concatenate_virtual_arrays,
                      _range_from_slice,
@@ -39,6 +42,7 @@ from ..array import (_unique,
                      Accumulator,
                      _accumulate,
                      )
+from phy.utils import Bunch
 from phy.utils._types import _as_array
 from phy.utils.testing import _assert_equal as ae
 from ..mock import artificial_spike_clusters
@@ -207,15 +211,34 @@ def test_in_polygon():
     ae(idx, idx_expected)
 
 
-def test_flatten():
-    assert _flatten([[0, 1], [2]]) == [0, 1, 2]
+def _star_polygon(n_vertices):
+    t = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    r = np.where(np.arange(n_vertices) % 2, .3, .9)
+    return np.c_[r * np.cos(t), r * np.sin(t)]
+
+
+def test_in_polygon_matplotlib(tempdir):
+    from matplotlib.path import Path
+
+    polygon = _star_polygon(20)
+    points = np.random.uniform(size=(10000, 2), low=-1, high=1)
+    expected = Path(np.vstack((polygon, polygon[0])),
+                    closed=True).contains_points(points)
+    ae(_in_polygon(points, polygon), expected)
 
+    # Chunked evaluation of a memory-mapped array.
+    path = op.join(tempdir, 'points.npy')
+    write_array(path, points)
+    points_m = read_array(path, mmap_mode='r')
+    ae(_in_polygon(points_m, polygon, chunk_size=999), expected)
 
-def test_start_stop():
-    assert _start_stop(slice(0, 3, None)) == (0, 3)
-    with raises(NotImplementedError):
-        _start_stop(slice(0, 3, 2))
-    assert _start_stop([0, 1, 2]) == (0, 2)
+    # Degenerate polygons.
+    assert not _in_polygon(points, polygon[:2]).any()
+    assert not _in_polygon(points, np.zeros((0, 2))).any()
+
+
+def test_flatten():
+    assert _flatten([[0, 1], [2]]) == [0, 1, 2]
 
 
 def test_get_closest_clusters():
@@ -276,6 +299,33 @@ def test_concatenate_virtual_arrays_3():
     ae(c[3], 2 * np.ones((1, 2)))
 
 
+def test_concatenate_virtual_arrays_fancy():
+    arrs = [np.arange(5), np.arange(10, 12), np.array([0]), np.arange(3)]
+    c = _concatenate_virtual_arrays(arrs)
+    full = np.concatenate(arrs)
+
+    ae(c[-1], [2])
+    ae(c[::2], full[::2])
+    ae(c[1:10:3], full[1:10:3])
+    ae(c[::-1], full[::-1])
+    ae(c[[7, 0, 5, 5, -1]], full[[7, 0, 5, 5, -1]])
+    ae(c[np.array([], dtype=np.int64)], [])
+    with raises(IndexError):
+        c[[20]]
+
+
+def test_concatenate_virtual_arrays_cols():
+    arrs = [np.random.rand(3, 4), np.random.rand(0, 4), np.random.rand(5, 4)]
+    c = _concatenate_virtual_arrays(arrs, cols=[2, 0])
+    full = np.concatenate(arrs)[:, [2, 0]]
+    assert c.shape == (8, 2)
+
+    ae(c[:], full)
+    ae(c[1:7], full[1:7])
+    ae(c[[6, 1, 3]], full[[6, 1, 3]])
+    ae(c[2:8:2], full[2:8:2])
+
+
 #------------------------------------------------------------------------------
 # Test chunking
 #------------------------------------------------------------------------------
@@ -395,6 +445,62 @@ def test_spikes_per_cluster():
         assert np.all(spike_clusters[spikes_per_cluster[i]] == i)
 
 
+def test_spikes_per_cluster_store(tempdir):
+    path = op.join(tempdir, 'spc')
+    spike_clusters = artificial_spike_clusters(1000, 10)
+    spc = _spikes_per_cluster(spike_clusters)
+
+    def _check(store, expected):
+        assert store.keys() == sorted(expected)
+        assert len(store) == len(expected)
+        for c in expected:
+            ae(store[c], expected[c])
+
+    store = SpikesPerCluster(path)
+    assert not len(store)
+    store.update(spc)
+    store.save()
+    _check(store, spc)
+
+    # The layers are memory-mapped.
+    store = SpikesPerCluster(path)
+    _check(store, spc)
+    assert isinstance(store[0], np.memmap)
+
+    # Merge two clusters, and save again: only the new cluster is written.
+    spc[10] = np.sort(np.r_[spc.pop(2), spc.pop(3)])
+    store.pop(2)
+    del store[3]
+    store[10] = spc[10]
+    assert 2 not in store
+    assert store.pop(2, None) is None
+    with raises(KeyError):
+        store[3]
+    store.save()
+    assert len(store._layers) == 2
+    assert len(store._layers[1][3]) == len(spc[10])
+    _check(SpikesPerCluster(path), spc)
+
+    # Undo: cluster 2 is added again.
+    store = SpikesPerCluster(path)
+    store[2] = spc[2] = np.nonzero(spike_clusters == 2)[0]
+    store.save()
+    _check(SpikesPerCluster(path), spc)
+
+    # Compaction.
+    store = SpikesPerCluster(path, max_layers=3)
+    store.save()
+    assert len(store._layers) == 1
+    _check(store, spc)
+    _check(SpikesPerCluster(path), spc)
+
+    # Clear.
+    store.clear()
+    assert not len(store)
+    store.update(spc)
+    _check(store, spc)
+
+
 def test_flatten_per_cluster():
     spc = {2: [2, 7, 11], 3: [3, 5], 5: []}
     arr = _flatten_per_cluster(spc)
@@ -405,6 +511,81 @@ def test_grouped_mean():
     spike_clusters = np.array([2, 3, 2, 2, 5])
     arr = spike_clusters * 10
     ae(grouped_mean(arr, spike_clusters), [20, 30, 50])
+    ae(grouped_mean(np.c_[arr, -arr], spike_clusters),
+       [[20, -20], [30, -30], [50, -50]])
+
+
+def _check_grouped_stats(stats, arr, spike_clusters):
+    for i, c in enumerate(stats.cluster_ids):
+        x = arr[spike_clusters == c]
+        assert stats.count[i] == len(x)
+        ac(stats.sum[i], x.sum(axis=0))
+        ac(stats.mean[i], x.mean(axis=0))
+        ac(stats.var[i], x.var(axis=0), atol=1e-10)
+        ac(stats.min[i], x.min(axis=0))
+        ac(stats.max[i], x.max(axis=0))
+
+
+def test_grouped_stats(tempdir):
+    n_spikes, n_clusters = 1000, 10
+    spike_clusters = artificial_spike_clusters(n_spikes, n_clusters)
+    arr = np.random.randn(n_spikes, 3, 2)
+
+    # 3D array.
+    stats = grouped_stats(arr, spike_clusters)
+    ae(stats.cluster_ids, np.unique(spike_clusters))
+    assert stats.mean.shape == (len(stats.cluster_ids), 3, 2)
+    _check_grouped_stats(stats, arr, spike_clusters)
+
+    # 2D memory-mapped array, by chunks.
+    path = op.join(tempdir, 'arr.npy')
+    write_array(path, arr[..., 0])
+    arr_m = read_array(path, mmap_mode='r')
+    stats = grouped_stats(arr_m, spike_clusters, chunk_size=99)
+    _check_grouped_stats(stats, arr[..., 0], spike_clusters)
+
+    # Empty array.
+    assert len(grouped_stats(arr[:0], spike_clusters[:0]).cluster_ids) == 0
+
+
+def test_grouped_stats_update():
+    n_spikes, n_clusters = 1000, 10
+    spike_clusters = artificial_spike_clusters(n_spikes, n_clusters)
+    arr = np.random.randn(n_spikes, 4)
+    gs = GroupedStats(arr, spike_clusters, chunk_size=300)
+    _check_grouped_stats(gs.get([0, 3]), arr, spike_clusters)
+
+    # Merge.
+    sc = spike_clusters.copy()
+    spike_ids = np.nonzero(np.in1d(sc, [1, 2]))[0]
+    sc[spike_ids] = 10
+    gs.update(Bunch(description='merge', spike_ids=spike_ids,
+                    added=[10], deleted=[1, 2]), sc)
+    _check_grouped_stats(gs.get([10, 0]), arr, sc)
+
+    # Split: the spikes are read by chunks.
+    reads = []
+
+    class _Array(object):
+        shape = arr.shape
+
+        def __getitem__(self, item):
+            reads.append(len(arr[item]))
+            return arr[item]
+
+    gs.arr = _Array()
+    gs.chunk_size = 50
+    spike_ids = np.nonzero(sc == 10)[0]
+    sc[spike_ids[::2]] = 11
+    sc[spike_ids[1::2]] = 12
+    gs.update(Bunch(description='assign', spike_ids=spike_ids,
+                    added=[11, 12], deleted=[10]), sc)
+    _check_grouped_stats(gs.get([11, 12]), arr, sc)
+    assert sum(reads) == len(spike_ids)
+    assert max(reads) <= 50
+
+    # The deleted clusters are kept for undo.
+    _check_grouped_stats(gs.get([1, 2]), arr, spike_clusters)
 
 
 def test_select_spikes_1():
@@ -8,9 +8,11 @@
 #------------------------------------------------------------------------------
 
 from collections import defaultdict
+import hashlib
 import logging
 import re
 
+import numpy as np
 from vispy import gloo
 from vispy.app import Canvas
 from vispy.util.event import Event
@@ -29,6 +31,131 @@ def indent(text):
     return '\n'.join('    ' + l.strip() for l in text.splitlines())
 
 
+def _buffer_capacity(n, min_capacity=1024):
+    """Return the capacity of a vertex buffer that needs to hold `n`
+    vertices: the smallest power of two greater than `n`."""
+    return max(min_capacity, 1 << int(n - 1).bit_length())
+
+
+#------------------------------------------------------------------------------
+# Program with persistent vertex buffers
+#------------------------------------------------------------------------------
+
+class Program(gloo.Program):
+    """A gloo program that keeps its vertex buffers between data updates.
+
+    Every attribute is stored in a vertex buffer with a larger capacity than
+    the data. When new data is set, the buffer is updated in place as long
+    as the data fits in it, and only the first vertices are drawn.
+    Otherwise, a new buffer with a larger capacity is created.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(Program, self).__init__(*args, **kwargs)
+        # Dictionary `{name: (buffer, dtype, shape)}`.
+        self._buffers = {}
+
+    def _is_attribute(self, name):
+        var = self._code_variables.get(name, None)
+        return var is not None and var[0] == 'attribute'
+
+    def __setitem__(self, name, data):
+        if (isinstance(data, np.ndarray) and data.ndim >= 1 and
+                len(data) and self._is_attribute(name)):
+            data = self._update_buffer(name, data)
+        super(Program, self).__setitem__(name, data)
+
+    def _update_buffer(self, name, data):
+        """Upload an attribute into its persistent buffer, and return a view
+        on the vertices to draw."""
+        data = np.ascontiguousarray(data)
+        n = data.shape[0]
+        vbo, dtype, shape = self._buffers.get(name, (None, None, None))
+        if (vbo is not None and dtype == data.dtype and
+                shape[1:] == data.shape[1:] and n <= shape[0]):
+            vbo.set_subdata(data)
+        else:
+            capacity = _buffer_capacity(n)
+            logger.log(5, "Allocate a buffer of %d vertices for `%s`.",
+                       capacity, name)
+            arr = np.zeros((capacity,) + data.shape[1:], dtype=data.dtype)
+            arr[:n] = data
+            vbo = gloo.VertexBuffer(arr)
+            self._buffers[name] = (vbo, data.dtype, arr.shape)
+        return vbo[:n]
+
+
+def _hash_source(*sources):
+    """Return a hash of some GLSL source code."""
+    h = hashlib.sha1()
+    for s in sources:
+        h.update(s.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class ProgramCache(object):
+    """Cache of programs, keyed by a hash of their vertex and fragment
+    shaders.
+
+    Building a visual's shaders requires a GLSL assembly, which is
+    memoized, and a new program, which needs to be compiled. When a visual
+    is added to a canvas, the program of a visual that is no longer shown,
+    and that has the same shaders, is given to the new visual instead of
+    creating a new program.
+
+    The numbers of cache hits and misses are kept for programs
+    (`n_hits`, `n_misses`) and GLSL assembly (`n_glsl_hits`,
+    `n_glsl_misses`).
+
+    """
+    def __init__(self):
+        # Dictionary `{hash of the inputs: (vertex, fragment)}`.
+        self._glsl = {}
+        # Dictionary `{hash of the shaders: [program, ...]}`.
+        self._programs = {}
+        # Dictionary `{program: visual}` with the visual using every program.
+        self._owners = {}
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_glsl_hits = 0
+        self.n_glsl_misses = 0
+
+    def insert_glsl(self, inserter, vertex, fragment):
+        """Apply the insertions of a GLSL inserter to some shaders."""
+        key = _hash_source(vertex, fragment, repr(inserter))
+        if key in self._glsl:
+            self.n_glsl_hits += 1
+        else:
+            self.n_glsl_misses += 1
+            self._glsl[key] = inserter.insert_into_shaders(vertex, fragment)
+        return self._glsl[key]
+
+    def get(self, vertex, fragment, visual, visible=()):
+        """Return a program for a visual.
+
+        A cached program with the same shaders is reused if its current
+        visual is not in `visible`. That visual loses its program.
+
+        """
+        key = _hash_source(vertex, fragment)
+        programs = self._programs.setdefault(key, [])
+        for program in programs:
+            owner = self._owners.get(program, None)
+            if owner is None or owner is visual or owner not in visible:
+                if owner is not None and owner is not visual:
+                    owner.program = None
+                self._owners[program] = visual
+                self.n_hits += 1
+                logger.log(5, "Reuse program for visual `%s`.", visual)
+                return program
+        program = Program(vertex, fragment)
+        programs.append(program)
+        self._owners[program] = visual
+        self.n_misses += 1
+        return program
+
+
 #------------------------------------------------------------------------------
 # Base spike visual
 #------------------------------------------------------------------------------
@@ -49,8 +176,9 @@ class BaseVisual(object):
         self.transforms = TransformChain()
         self.inserter = GLSLInserter()
         self.inserter.insert_vert('uniform vec2 u_window_size;', 'header')
-        # The program will be set by the canvas when the visual is
-        # added to the canvas.
+        # The shaders and the program will be set by the canvas when the
+        # visual is added to the canvas.
+        self.shaders = None
         self.program = None
         self.set_canvas_transforms_filter(lambda t: t)
 
@@ -225,6 +353,9 @@ class GLSLInserter(object):
                           for key in self._to_insert})
         return _insert_glsl(vertex, fragment, to_insert)
 
+    def __repr__(self):
+        return repr(sorted(self._to_insert.items()))
+
     def __add__(self, inserter):
         """Concatenate two inserters."""
         for key, values in self._to_insert.items():
@@ -250,6 +381,7 @@ class BaseCanvas(Canvas):
         self.transforms = TransformChain()
         self.inserter = GLSLInserter()
         self.visuals = []
+        self.program_cache = ProgramCache()
         self.events.add(visual_added=VisualEvent)
 
         # Enable transparency.
@@ -274,11 +406,23 @@ class BaseCanvas(Canvas):
         inserter += self.inserter
         # Now, we insert the transforms GLSL into the shaders.
         vs, fs = visual.vertex_shader, visual.fragment_shader
-        vs, fs = inserter.insert_into_shaders(vs, fs)
-        # Finally, we create the visual's program.
-        visual.program = gloo.Program(vs, fs)
+        vs, fs = self.program_cache.insert_glsl(inserter, vs, fs)
+        visual.shaders = vs, fs
         logger.log(5, "Vertex shader: %s", vs)
         logger.log(5, "Fragment shader: %s", fs)
+        self.show_visual(visual)
+
+    def show_visual(self, visual):
+        """Show a visual that has already been added to the canvas.
+
+        The visual's program is taken from the program cache if the visual
+        doesn't have one.
+
+        """
+        if visual.program is None:
+            visual.program = self.program_cache.get(*visual.shaders,
+                                                    visual=visual,
+                                                    visible=self.visuals)
         # Initialize the size.
         visual.on_resize(self.size)
         # Register the visual in the list of visuals in the canvas.
@@ -0,0 +1,29 @@
+#include "utils.glsl"
+
+attribute vec2 a_position;
+attribute float a_mask;
+attribute float a_cluster;  // 0..n_clusters-1
+
+uniform sampler2D u_color;
+uniform sampler2D u_size;
+uniform float u_size_max;
+uniform float u_mask_max;
+uniform float n_clusters;
+
+varying vec4 v_color;
+varying float v_size;
+varying float v_mask;
+
+void main() {
+    gl_Position = transform(a_position);
+    gl_Position.z = get_depth(a_mask, u_mask_max);
+
+    // Fetch the color and the marker size of the point's cluster.
+    v_color = fetch_texture(a_cluster, u_color, n_clusters);
+    v_size = fetch_texture(a_cluster, u_size, n_clusters).r * u_size_max;
+
+    // Point size as a function of the marker size and antialiasing.
+    gl_PointSize = v_size + 5.0;
+
+    v_mask = a_mask;
+}
@@ -0,0 +1,11 @@
+uniform sampler2D u_density;
+uniform vec4 u_color;
+
+varying vec2 v_tex_coords;
+
+void main() {
+    float density = texture2D(u_density, v_tex_coords).r;
+    if (density <= 0.)
+        discard;
+    gl_FragColor = vec4(u_color.rgb, u_color.a * density);
+}
@@ -0,0 +1,12 @@
+attribute vec2 a_position;
+attribute vec2 a_tex_coords;
+
+varying vec2 v_tex_coords;
+
+void main() {
+    gl_Position = transform(a_position);
+    // The density images are behind the points.
+    gl_Position.z = 0.5;
+
+    v_tex_coords = a_tex_coords;
+}
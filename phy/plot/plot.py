@@ -24,6 +24,7 @@ from .utils import _get_array
 from .visuals import (ScatterVisual, PlotVisual, HistogramVisual,
                       LineVisual, TextVisual, PolygonVisual,
                       UniformScatterVisual, UniformPlotVisual,
+                      BatchScatterVisual, DensityVisual,
                       )
 
 logger = logging.getLogger(__name__)
@@ -107,6 +108,9 @@ class View(BaseCanvas):
         else:
             self.lasso = None
 
+        # Visuals are kept between successive builds, so that their programs
+        # and vertex buffers are reused.
+        self._visuals_cache = {}
         self.clear()
 
     def clear(self):
@@ -115,6 +119,18 @@ class View(BaseCanvas):
         self.visuals = []
         self.update()
 
+    def _get_visual(self, cls):
+        """Return the visual of a given class, reusing the visual created
+        in a previous build if possible."""
+        visual = self._visuals_cache.get(cls, None)
+        if visual is None:
+            visual = cls()
+            self.add_visual(visual)
+            self._visuals_cache[cls] = visual
+        else:
+            self.show_visual(visual)
+        return visual
+
     def _add_item(self, cls, *args, **kwargs):
         """Add a plot item."""
         box_index = kwargs.pop('box_index', self._default_box_index)
@@ -157,10 +173,30 @@ class View(BaseCanvas):
                           )
         return self._add_item(cls, *args, **kwargs)
 
+    def batch_scatter(self, *args, **kwargs):
+        """Add a scatter plot where the color and size of every point
+        depend on its group index `cluster`.
+
+        All items are drawn by a single visual: the `colors` and `sizes`
+        tables need to be specified only once.
+
+        """
+        cls = _make_class(BatchScatterVisual,
+                          _default_marker=kwargs.pop('marker', None),
+                          )
+        return self._add_item(cls, *args, **kwargs)
+
     def hist(self, *args, **kwargs):
         """Add some histograms."""
         return self._add_item(HistogramVisual, *args, **kwargs)
 
+    def density(self, *args, **kwargs):
+        """Add some density images."""
+        cls = _make_class(DensityVisual,
+                          _default_color=kwargs.pop('color', None),
+                          )
+        return self._add_item(cls, *args, **kwargs)
+
     def text(self, *args, **kwargs):
         """Add text."""
         return self._add_item(TextVisual, *args, **kwargs)
@@ -176,8 +212,9 @@ class View(BaseCanvas):
     def build(self):
         """Build all added items.
 
-        Visuals are created, added, and built. The `set_data()` methods can
-        be called afterwards.
+        Visuals are created and added the first time, and reused in the
+        following builds: their data is updated in place. The `set_data()`
+        methods can be called afterwards.
 
         """
         for cls, data_list in self._items.items():
@@ -185,18 +222,19 @@ class View(BaseCanvas):
             # in `allow_list`.
             data = _accumulate(data_list, cls.allow_list)
             box_index = data.pop('box_index')
-            visual = cls()
-            self.add_visual(visual)
+            visual = self._get_visual(cls)
             visual.set_data(**data)
             # NOTE: visual.program.__contains__ is implemented in vispy master
             # so we can replace this with `if 'a_box_index' in visual.program`
             # after the next VisPy release.
             if 'a_box_index' in visual.program._code_variables:
                 visual.program['a_box_index'] = box_index.astype(np.float32)
-        # TODO: refactor this when there is the possibility to update existing
-        # visuals without recreating the whole scene.
         if self.lasso:
-            self.lasso.create_visual()
+            if self.lasso.visual is None:
+                self.lasso.create_visual()
+            else:
+                self.show_visual(self.lasso.visual)
+                self.lasso.update_visual()
         self.update()
 
     def get_pos_from_mouse(self, pos, box):
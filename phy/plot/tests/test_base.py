@@ -10,7 +10,8 @@
 import numpy as np
 from pytest import yield_fixture
 
-from ..base import BaseVisual, BaseInteract, GLSLInserter
+from ..base import (BaseVisual, BaseInteract, GLSLInserter, Program,
+                    ProgramCache, _buffer_capacity)
 from ..transform import (subplot_bounds, Translate, Scale, Range,
                          Clip, Subplot, TransformChain)
 
@@ -76,6 +77,73 @@ def test_glsl_inserter_hook(vertex_shader, fragment_shader):
     assert '// In fragment shader.' in fs
 
 
+def test_buffer_capacity():
+    assert _buffer_capacity(0) == 1024
+    assert _buffer_capacity(1024) == 1024
+    assert _buffer_capacity(1025) == 2048
+
+
+def test_program_buffers(vertex_shader_nohook, fragment_shader):
+    program = Program(vertex_shader_nohook, fragment_shader)
+
+    def _buffer():
+        return program._buffers['a_position'][0]
+
+    program['a_position'] = np.random.rand(10, 2).astype(np.float32)
+    vbo = _buffer()
+    assert program._user_variables['a_position'].size == 10
+
+    # The buffer is updated in place when the data fits in it.
+    program['a_position'] = np.random.rand(1000, 2).astype(np.float32)
+    assert _buffer() is vbo
+    assert program._user_variables['a_position'].size == 1000
+
+    # Otherwise, a larger buffer is created.
+    program['a_position'] = np.random.rand(2000, 2).astype(np.float32)
+    assert _buffer() is not vbo
+    assert program._buffers['a_position'][2] == (2048, 2)
+    assert program._user_variables['a_position'].size == 2000
+
+
+def test_program_cache(vertex_shader, fragment_shader):
+    cache = ProgramCache()
+
+    inserter = GLSLInserter()
+    inserter.insert_vert('uniform float boo;', 'header')
+    vs, fs = cache.insert_glsl(inserter, vertex_shader, fragment_shader)
+    assert 'boo' in vs
+    assert cache.insert_glsl(inserter, vertex_shader,
+                             fragment_shader) == (vs, fs)
+    assert (cache.n_glsl_hits, cache.n_glsl_misses) == (1, 1)
+
+    # A different inserter leads to a different GLSL assembly.
+    inserter.add_transform_chain(TransformChain().add_on_gpu(Scale(.5)))
+    vs2, fs2 = cache.insert_glsl(inserter, vertex_shader, fragment_shader)
+    assert vs2 != vs
+    assert cache.n_glsl_misses == 2
+
+    class _Visual(object):
+        program = None
+
+    v0, v1, v2 = _Visual(), _Visual(), _Visual()
+
+    # Two visible visuals can't share a program.
+    v0.program = cache.get(vs, fs, visual=v0)
+    v1.program = cache.get(vs, fs, visual=v1, visible=[v0])
+    assert v1.program is not v0.program
+    assert (cache.n_hits, cache.n_misses) == (0, 2)
+
+    # Different shaders.
+    v2.program = cache.get(vs2, fs2, visual=v2, visible=[v0, v1])
+    assert cache.n_misses == 3
+
+    # The program of a visual that is no longer visible is reused.
+    program = v0.program
+    assert cache.get(vs, fs, visual=v2, visible=[v1]) is program
+    assert v0.program is None
+    assert cache.n_hits == 1
+
+
 def test_visual_1(qtbot, canvas):
     class TestVisual(BaseVisual):
         def __init__(self):
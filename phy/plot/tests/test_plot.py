@@ -60,6 +60,49 @@ def test_simple_view(qtbot):
     _show(qtbot, view)
 
 
+def test_building_reuse(qtbot):
+    view = View(layout='grid', shape=(2, 2), enable_lasso=True)
+    view.show()
+    qtbot.waitForWindowShown(view.native)
+
+    def _build(n):
+        with view.building():
+            for i in range(2):
+                for j in range(2):
+                    view[i, j].scatter(pos=np.random.randn(n, 2))
+                    view[i, j].plot(y=np.random.randn(5, n))
+
+    _build(1000)
+    programs = [visual.program for visual in view.visuals]
+
+    # The visuals and their programs are reused between builds.
+    for n in (100, 2000, 10):
+        _build(n)
+        assert [visual.program for visual in view.visuals] == programs
+
+    # The visuals that are not used in a build are not shown.
+    with view.building():
+        view[0, 0].scatter(pos=np.random.randn(10, 2))
+    assert len(view.visuals) == 2
+    view.close()
+
+
+def test_building_program_cache(qtbot):
+    view = View(layout='grid', shape=(2, 2))
+    view.show()
+    qtbot.waitForWindowShown(view.native)
+
+    # Different colors lead to different visual classes with the same
+    # shaders.
+    for color in [(1., 0., 0., 1.), (0., 1., 0., 1.), (1., 0., 0., 1.)]:
+        with view.building():
+            view[0, 1].uscatter(pos=np.random.randn(100, 2), color=color)
+    cache = view.program_cache
+    assert cache.n_misses == 1
+    assert cache.n_hits == 2
+    view.close()
+
+
 def test_uniform_scatter(qtbot):
     view = View()
     n = 1000
@@ -74,6 +117,45 @@ def test_uniform_scatter(qtbot):
     _show(qtbot, view)
 
 
+def test_batch_scatter(qtbot):
+    view = View(layout='grid', shape=(2, 2))
+    n = 100
+    colors = [(.5, .5, .5, .5), (1., 0., 0., .5), (0., 1., 0., .5)]
+
+    # All groups and subplots are drawn by a single visual, and a new
+    # selection of colors does not create a new visual class.
+    for _ in range(2):
+        with view.building():
+            for i, j in ((0, 0), (0, 1), (1, 1)):
+                for k in range(len(colors)):
+                    view[i, j].batch_scatter(pos=np.random.randn(n, 2),
+                                             cluster=k,
+                                             colors=colors,
+                                             sizes=(1., 5., 5.),
+                                             masks=np.random.rand(n) + k,
+                                             data_bounds=(-3, -3, 3, 3),
+                                             )
+        colors = colors[::-1]
+    assert len(view._items) == 1
+    assert len(view._visuals_cache) == 1
+    _show(qtbot, view)
+
+
+def test_density(qtbot):
+    view = View(layout='grid', shape=(2, 2))
+    for i, j in ((0, 0), (0, 1), (1, 1)):
+        x, y = np.random.randn(2, 1000)
+        image, _, _ = np.histogram2d(y, x, bins=50,
+                                     range=[[-3, 3], [-3, 3]])
+        view[i, j].density(image=image / image.max(),
+                           pos=(-3, -3, 3, 3),
+                           data_bounds=(-2, -2, 2, 2),
+                           color=(1., 0., 0., 1.),
+                           )
+        view[i, j].scatter(x[:100], y[:100], data_bounds=(-2, -2, 2, 2))
+    _show(qtbot, view)
+
+
 #------------------------------------------------------------------------------
 # Test visuals in grid
 #------------------------------------------------------------------------------
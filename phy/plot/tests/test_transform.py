@@ -256,3 +256,39 @@ def test_transform_chain_inverse():
     tci = tc.inverse()
     ae(tc.apply([[1., 0.]]), [[3., 0.]])
     ae(tci.apply([[3., 0.]]), [[1., 0.]])
+
+
+def test_transform_chain_fused():
+    tc = TransformChain()
+    tc.add_on_cpu([Translate((1, 0)), Scale(2.), Range([0, 0, 4, 4]),
+                   Clip([-1, -1, 0, 1]), Scale(.5)])
+    arr = np.array([[0., 0.], [1., 2.], [-1., -1.]])
+    # Before the clipping: [[0, -1], [1, 1], [-1, -2]].
+    ac(tc.apply(arr), [[0., -.5]])
+    assert tc.apply(arr).dtype == np.float64
+    assert tc.apply(arr, dtype=np.float32).dtype == np.float32
+
+
+def test_transform_chain_per_signal():
+    n_signals, n_samples = 4, 1000
+    # Large time offsets.
+    t = 3600. + np.arange(n_samples) / 25000.
+    pos = np.empty((n_signals, n_samples, 2))
+    pos[..., 0] = t
+    pos[..., 1] = np.random.randn(n_signals, n_samples)
+    data_bounds = np.c_[np.tile([t[0], -3, t[-1], 3], (n_signals, 1))]
+    data_bounds[:, 1] = -np.arange(1, n_signals + 1)
+
+    r = Range()
+    tc = TransformChain().add_on_cpu(r)
+
+    # Per-vertex bounds.
+    r.from_bounds = np.repeat(data_bounds, n_samples, axis=0)
+    expected = r.apply(pos.reshape((-1, 2)))
+
+    # Per-signal bounds, with a float32 output.
+    r.from_bounds = data_bounds[:, np.newaxis, :]
+    out = np.zeros((n_signals, n_samples, 3), dtype=np.float32)
+    tc.apply(pos, out=out[..., :2])
+    ac(out[..., :2].reshape((-1, 2)), expected, atol=1e-6)
+    ae(out[..., 2], 0)
@@ -48,6 +48,13 @@ def test_tesselate_histogram():
     ac(thist[-3], [n, n - 1])
     ac(thist[-1], [n, 0])
 
+    # Several histograms at once.
+    hist = np.random.rand(5, n)
+    thist = _tesselate_histogram(hist)
+    assert thist.shape == (5 * 6 * n, 2)
+    ac(thist, np.vstack([_tesselate_histogram(row) for row in hist]))
+    assert _tesselate_histogram(np.zeros((3, 0))).shape == (0, 2)
+
 
 def test_enable_depth_mask(qtbot, canvas):
 
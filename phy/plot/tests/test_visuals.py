@@ -12,6 +12,7 @@ import numpy as np
 from ..visuals import (ScatterVisual, PlotVisual, HistogramVisual,
                        LineVisual, PolygonVisual, TextVisual,
                        UniformPlotVisual, UniformScatterVisual,
+                       BatchScatterVisual, DensityVisual,
                        )
 from ..transform import NDC
 from phy.utils._color import _random_color
@@ -107,6 +108,36 @@ def test_uniform_scatter_custom(qtbot, canvas_pz):
                  )
 
 
+#------------------------------------------------------------------------------
+# Test batch scatter visual
+#------------------------------------------------------------------------------
+
+def test_batch_scatter_empty(qtbot, canvas):
+    _test_visual(qtbot, canvas, BatchScatterVisual(),
+                 x=np.zeros(0), y=np.zeros(0))
+
+
+def test_batch_scatter_custom(qtbot, canvas_pz):
+
+    n = 100
+    n_clusters = 4
+
+    # Random position.
+    pos = .2 * np.random.randn(n, 2)
+    cluster = np.random.randint(0, n_clusters, n)
+    colors = [_random_color() + (.5,) for _ in range(n_clusters)]
+
+    _test_visual(qtbot, canvas_pz,
+                 BatchScatterVisual(marker='vbar'),
+                 pos=pos,
+                 cluster=cluster,
+                 colors=colors,
+                 sizes=np.linspace(5., 20., n_clusters),
+                 masks=np.linspace(0., 1., n) * .99999 + cluster,
+                 data_bounds=None,
+                 )
+
+
 #------------------------------------------------------------------------------
 # Test plot visual
 #------------------------------------------------------------------------------
@@ -239,6 +270,18 @@ def test_histogram_2(qtbot, canvas_pz):
                  hist=hist, color=c, ylim=2 * np.ones(n_hists))
 
 
+def test_density_empty(qtbot, canvas):
+    _test_visual(qtbot, canvas, DensityVisual())
+
+
+def test_density(qtbot, canvas_pz):
+    n = 3
+    image = [np.random.rand(20, 30) for _ in range(n)]
+    pos = [[-1., -1., 0., 0.], [0., 0., 1., 1.], [-.5, 0., 0., .5]]
+    _test_visual(qtbot, canvas_pz, DensityVisual(color=(1., 1., 0., 1.)),
+                 image=image, pos=pos, data_bounds=[-1, -1, 1, 1])
+
+
 #------------------------------------------------------------------------------
 # Test line visual
 #------------------------------------------------------------------------------
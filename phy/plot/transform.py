@@ -83,6 +83,39 @@ def _normalize(arr, m, M):
     return arr
 
 
+def _is_numeric(value):
+    return value is not None and not isinstance(value, string_types)
+
+
+def _compose_affine(first, second):
+    """Compose two affine transforms `(scale, offset)`, the first one being
+    applied first."""
+    s0, o0 = first
+    s1, o1 = second
+    return s0 * s1, o0 * s1 + o1
+
+
+def _apply_affine(arr, scale, offset, out):
+    """Compute `arr * scale + offset` into the `out` array.
+
+    This is computed as `(arr - origin) * scale`: the subtraction is done
+    in the precision of the input and directly cast into the output, so
+    that large offsets (e.g. times in a long recording) don't lose precision
+    with a float32 output, and there is no temporary array.
+
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        origin = -offset / scale
+    if np.all(np.isfinite(origin)):
+        np.subtract(arr, origin, out=out, casting='unsafe')
+        np.multiply(out, scale, out=out, casting='unsafe')
+    else:
+        # Degenerate scaling.
+        np.multiply(arr, scale, out=out, casting='unsafe')
+        np.add(out, offset, out=out, casting='unsafe')
+    return out
+
+
 def subplot_bounds(shape=None, index=None):
     i, j = index
     n_rows, n_cols = shape
@@ -142,6 +175,11 @@ class BaseTransform(object):
     def inverse(self):
         raise NotImplementedError()
 
+    def affine(self):
+        """Return the `(scale, offset)` of the transform if it is an affine
+        transform with numerical parameters, None otherwise."""
+        return None
+
 
 class Translate(BaseTransform):
     def apply(self, arr, value=None):
@@ -160,6 +198,11 @@ class Translate(BaseTransform):
         else:
             return Translate(_minus(self.value))
 
+    def affine(self):
+        if not _is_numeric(self.value):
+            return None
+        return 1., np.asarray(self.value, dtype=np.float64)
+
 
 class Scale(BaseTransform):
     def apply(self, arr, value=None):
@@ -176,6 +219,11 @@ class Scale(BaseTransform):
         else:
             return Scale(_inverse(self.value))
 
+    def affine(self):
+        if not _is_numeric(self.value):
+            return None
+        return np.asarray(self.value, dtype=np.float64), 0.
+
 
 class Range(BaseTransform):
     def __init__(self, from_bounds=None, to_bounds=None):
@@ -216,6 +264,19 @@ class Range(BaseTransform):
         return Range(from_bounds=self.to_bounds,
                      to_bounds=self.from_bounds)
 
+    def affine(self):
+        if not (_is_numeric(self.from_bounds) and
+                _is_numeric(self.to_bounds)):
+            return None
+        from_bounds = np.asarray(self.from_bounds, dtype=np.float64)
+        to_bounds = np.asarray(self.to_bounds, dtype=np.float64)
+        f0 = from_bounds[..., :2]
+        t0 = to_bounds[..., :2]
+        d = from_bounds[..., 2:] - f0
+        d[d == 0] = 1
+        scale = (to_bounds[..., 2:] - t0) / d
+        return scale, t0 - f0 * scale
+
 
 class Clip(BaseTransform):
     def __init__(self, bounds=None):
@@ -304,11 +365,66 @@ class TransformChain(object):
         return (TransformChain().add_on_cpu(cpu_transforms).
                 add_on_gpu(gpu_transforms))
 
-    def apply(self, arr):
-        """Apply all CPU transforms on an array."""
+    def _fused_transforms(self):
+        """Return the CPU transforms, where consecutive affine transforms
+        are fused into a single `(scale, offset)` tuple."""
+        fused = []
         for t in self.cpu_transforms:
-            arr = t.apply(arr)
-        return arr
+            affine = t.affine()
+            if affine is None:
+                fused.append(t)
+            elif fused and isinstance(fused[-1], tuple):
+                fused[-1] = _compose_affine(fused[-1], affine)
+            else:
+                fused.append(affine)
+        return fused
+
+    def apply(self, arr, dtype=None, out=None):
+        """Apply all CPU transforms on an array.
+
+        Consecutive `Translate`, `Scale`, and `Range` transforms are fused
+        into a single affine operation. The result has the dtype of the input,
+        unless `dtype` or an `out` array is specified.
+
+        The coordinates are in the last axis. When all transforms are affine,
+        the array may have more than two dimensions: the parameters of the
+        transforms (for example per-signal bounds of shape
+        `(n_signals, 1, 4)`) are then broadcast against the leading axes.
+
+        """
+        if arr is None or not len(arr):
+            return arr
+        arr = np.asarray(arr)
+        if arr.dtype not in (np.float32, np.float64):
+            arr = arr.astype(np.float64)
+        if arr.ndim == 1:
+            arr = np.atleast_2d(arr)
+        if dtype is None:
+            dtype = out.dtype if out is not None else arr.dtype
+        fused = self._fused_transforms()
+        if not fused:
+            if out is None:
+                return arr if arr.dtype == dtype else arr.astype(dtype)
+            out[...] = arr
+            return out
+        for i, t in enumerate(fused):
+            last = i == len(fused) - 1
+            if isinstance(t, tuple):
+                if not last:
+                    # Keep the precision of the input for the next transforms.
+                    res = np.empty(arr.shape, dtype=arr.dtype)
+                elif out is None:
+                    res = np.empty(arr.shape, dtype=dtype)
+                else:
+                    res = out
+                arr = _apply_affine(arr, t[0], t[1], res)
+            else:
+                assert arr.ndim == 2
+                arr = t.apply(arr)
+                if last and out is not None:
+                    out[...] = arr
+                    arr = out
+        return arr if arr.dtype == dtype else arr.astype(dtype)
 
     def inverse(self):
         """Return the inverse chain of transforms."""
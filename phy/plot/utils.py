@@ -249,7 +249,7 @@ def _load_shader(filename):
 
 
 def _tesselate_histogram(hist):
-    """
+    """Return the vertices of the triangles of one or several histograms.
 
     2/4  3
      ____
@@ -260,21 +260,21 @@ def _tesselate_histogram(hist):
 
     0   1/5
 
-    """
-    assert hist.ndim == 1
-    nsamples = len(hist)
-
-    x0 = np.arange(nsamples)
+    For an `(n_hists, n_bins)` array, the vertices of all histograms are
+    concatenated and computed in a single vectorized pass.
 
-    x = np.zeros(6 * nsamples)
-    y = np.zeros(6 * nsamples)
-
-    x[0::2] = np.repeat(x0, 3)
-    x[1::2] = x[0::2] + 1
+    """
+    hist = np.asarray(hist)
+    assert 1 <= hist.ndim <= 2
+    if hist.ndim == 1:
+        hist = hist[np.newaxis, :]
+    n_hists, n_bins = hist.shape
 
-    y[2::6] = y[3::6] = y[4::6] = hist
+    pos = np.zeros((n_hists, n_bins, 6, 2))
+    pos[..., 0] = np.arange(n_bins)[:, np.newaxis] + [0, 1, 0, 1, 0, 1]
+    pos[..., 2:5, 1] = hist[..., np.newaxis]
 
-    return np.c_[x, y]
+    return pos.reshape((6 * n_hists * n_bins, 2))
 
 
 def _enable_depth_mask():
@@ -218,6 +218,133 @@ class UniformScatterVisual(BaseVisual):
         self.program['u_mask_max'] = _max(masks)
 
 
+def _first_table(table):
+    """Return the first specified table among the accumulated items."""
+    if (isinstance(table, list) and
+            all(t is None or isinstance(t, np.ndarray) for t in table)):
+        return next((t for t in table if t is not None), None)
+    return table
+
+
+class BatchScatterVisual(BaseVisual):
+    """Scatter plot of several groups of points in a single draw call.
+
+    Every point has a group index (typically the relative index of its
+    cluster). The color and the marker size of every group are looked up
+    on the GPU in small textures, so that changing the groups does not
+    require a new visual class.
+
+    """
+    _default_marker_size = 10.
+    _default_marker = 'disc'
+    _default_color = DEFAULT_COLOR
+    # The group tables are shared by all items: the first specified ones
+    # are used.
+    allow_list = ('colors', 'sizes')
+
+    def __init__(self, marker=None):
+        super(BatchScatterVisual, self).__init__()
+
+        # Set the marker type.
+        self.marker = marker or self._default_marker
+        assert self.marker in UniformScatterVisual._supported_markers
+
+        self.set_shader('batch_scatter')
+        self.fragment_shader = self.fragment_shader.replace('%MARKER',
+                                                            self.marker)
+        self.set_primitive_type('points')
+        self.data_range = Range(NDC)
+        self.transforms.add_on_cpu(self.data_range)
+
+    @staticmethod
+    def vertex_count(x=None, y=None, pos=None, **kwargs):
+        return y.size if y is not None else len(pos)
+
+    @staticmethod
+    def validate(x=None,
+                 y=None,
+                 pos=None,
+                 masks=None,
+                 cluster=None,
+                 colors=None,
+                 sizes=None,
+                 data_bounds=None,
+                 ):
+        if pos is None:
+            x, y = _get_pos(x, y)
+            pos = np.c_[x, y]
+        pos = np.asarray(pos)
+        assert pos.ndim == 2
+        assert pos.shape[1] == 2
+        n = pos.shape[0]
+
+        masks = _get_array(masks, (n, 1), 1., np.float32)
+        assert masks.shape == (n, 1)
+        cluster = _get_array(cluster, (n, 1), 0, np.float32)
+        assert cluster.shape == (n, 1)
+
+        # Validate the group tables.
+        colors, sizes = _first_table(colors), _first_table(sizes)
+        if colors is not None:
+            colors = np.atleast_2d(np.asarray(colors, dtype=np.float64))
+            assert colors.shape[1] == 4
+        if sizes is not None:
+            sizes = np.asarray(sizes, dtype=np.float64).ravel()
+
+        # Validate the data.
+        if data_bounds is not None:
+            data_bounds = _get_data_bounds(data_bounds, pos)
+            assert data_bounds.shape[0] == n
+
+        # NOTE: the tables are wrapped in lists, as the lists of the
+        # successive items are flattened when the items are accumulated.
+        return Bunch(pos=pos,
+                     masks=masks,
+                     cluster=cluster,
+                     colors=[colors],
+                     sizes=[sizes],
+                     data_bounds=data_bounds,
+                     )
+
+    def set_data(self, *args, **kwargs):
+        data = self.validate(*args, **kwargs)
+        if data.data_bounds is not None:
+            self.data_range.from_bounds = data.data_bounds
+            pos_tr = self.transforms.apply(data.pos)
+        else:
+            pos_tr = data.pos
+
+        # Number of groups in the tables. There are at least two rows
+        # so that the texture coordinates are well-defined.
+        colors_, sizes_ = data.colors[0], data.sizes[0]
+        n = 1 + int(_max(data.cluster))
+        for table in (colors_, sizes_):
+            if table is not None:
+                n = max(n, len(table))
+        n_clusters = max(n, 2)
+
+        colors = np.tile(self._default_color, (n_clusters, 1))
+        if colors_ is not None:
+            colors[:len(colors_)] = colors_
+        sizes = np.tile(self._default_marker_size, (n_clusters, 1))
+        if sizes_ is not None:
+            sizes[:len(sizes_), 0] = sizes_
+        size_max = float(sizes.max()) or 1.
+
+        self.program['a_position'] = pos_tr.astype(np.float32)
+        self.program['a_mask'] = data.masks.astype(np.float32)
+        self.program['a_cluster'] = data.cluster.astype(np.float32)
+
+        tex = _get_texture(colors, self._default_color, n_clusters, [0, 1])
+        self.program['u_color'] = tex.astype(np.float32)
+        tex = _get_texture(sizes, [self._default_marker_size], n_clusters,
+                           [0, size_max])
+        self.program['u_size'] = tex.astype(np.float32)
+        self.program['u_size_max'] = size_max
+        self.program['u_mask_max'] = _max(data.masks)
+        self.program['n_clusters'] = n_clusters
+
+
 #------------------------------------------------------------------------------
 # Plot visuals
 #------------------------------------------------------------------------------
@@ -240,6 +367,48 @@ def _max(arr):
     return arr.max() if len(arr) else 1
 
 
+def _signals_position(visual, x, y, data_bounds=None, depth=None):
+    """Return the transformed positions of a list of signals, as a float32
+    `(n, 2)` array, or `(n, 3)` with the depth of every signal.
+
+    When all signals have the same number of samples, the positions are
+    handled as a `(n_signals, n_samples, 2)` array, so that the per-signal
+    data bounds are broadcast instead of being repeated for every vertex.
+
+    """
+    n_signals = len(y)
+    n_samples = [len(_) for _ in y]
+    n = sum(n_samples)
+    regular = n_signals > 0 and len(set(n_samples)) == 1
+    shape = (n_signals, n_samples[0]) if regular else (n,)
+    n_cols = 2 if depth is None else 3
+
+    pos = np.empty(shape + (2,), dtype=np.float64)
+    if n:
+        pos[..., 0] = np.concatenate(x).reshape(shape)
+        pos[..., 1] = np.concatenate(y).reshape(shape)
+    out = np.empty(shape + (n_cols,), dtype=np.float32)
+
+    # Transform the positions.
+    if data_bounds is not None and n:
+        if regular:
+            data_bounds = data_bounds[:, np.newaxis, :]
+        else:
+            data_bounds = np.repeat(data_bounds, n_samples, axis=0)
+        visual.data_range.from_bounds = data_bounds
+        visual.transforms.apply(pos, out=out[..., :2])
+    else:
+        out[..., :2] = pos
+
+    # Depth of every signal.
+    if depth is not None:
+        if regular:
+            out[..., 2] = depth
+        else:
+            out[..., 2] = np.repeat(depth[:, 0], n_samples)
+    return out.reshape((n, n_cols))
+
+
 class PlotVisual(BaseVisual):
     _default_color = DEFAULT_COLOR
     allow_list = ('x', 'y')
@@ -312,37 +481,26 @@ class PlotVisual(BaseVisual):
         n_signals = len(data.y)
         n_samples = [len(_) for _ in data.y]
         n = sum(n_samples)
-        x = np.concatenate(data.x) if len(data.x) else np.array([])
-        y = np.concatenate(data.y) if len(data.y) else np.array([])
 
-        # Generate the position array.
-        pos = np.empty((n, 2), dtype=np.float64)
-        pos[:, 0] = x.ravel()
-        pos[:, 1] = y.ravel()
-        assert pos.shape == (n, 2)
+        # Transformed position and depth.
+        pos = _signals_position(self, data.x, data.y,
+                                data_bounds=data.data_bounds,
+                                depth=data.depth)
+        assert pos.shape == (n, 3)
 
         # Generate the color attribute.
-        color = data.color
+        color = data.color.astype(np.float32)
         assert color.shape == (n_signals, 4)
         color = np.repeat(color, n_samples, axis=0)
         assert color.shape == (n, 4)
 
         # Generate signal index.
-        signal_index = np.repeat(np.arange(n_signals), n_samples)
-        signal_index = _get_array(signal_index, (n, 1))
-        assert signal_index.shape == (n, 1)
+        signal_index = np.repeat(np.arange(n_signals, dtype=np.float32),
+                                 n_samples)
 
-        # Transform the positions.
-        if data.data_bounds is not None:
-            data_bounds = np.repeat(data.data_bounds, n_samples, axis=0)
-            self.data_range.from_bounds = data_bounds
-            pos = self.transforms.apply(pos)
-
-        # Position and depth.
-        depth = np.repeat(data.depth, n_samples, axis=0)
-        self.program['a_position'] = np.c_[pos, depth].astype(np.float32)
-        self.program['a_color'] = color.astype(np.float32)
-        self.program['a_signal_index'] = signal_index.astype(np.float32)
+        self.program['a_position'] = pos
+        self.program['a_color'] = color
+        self.program['a_signal_index'] = signal_index.reshape((n, 1))
 
 
 class UniformPlotVisual(BaseVisual):
@@ -411,37 +569,23 @@ class UniformPlotVisual(BaseVisual):
         n_signals = len(data.y)
         n_samples = [len(_) for _ in data.y]
         n = sum(n_samples)
-        x = np.concatenate(data.x) if len(data.x) else np.array([])
-        y = np.concatenate(data.y) if len(data.y) else np.array([])
 
-        # Generate the position array.
-        pos = np.empty((n, 2), dtype=np.float64)
-        pos[:, 0] = x.ravel()
-        pos[:, 1] = y.ravel()
+        # Transformed position.
+        pos = _signals_position(self, data.x, data.y,
+                                data_bounds=data.data_bounds)
         assert pos.shape == (n, 2)
 
         # Generate signal index.
-        signal_index = np.repeat(np.arange(n_signals), n_samples)
-        signal_index = _get_array(signal_index, (n, 1))
-        assert signal_index.shape == (n, 1)
+        signal_index = np.repeat(np.arange(n_signals, dtype=np.float32),
+                                 n_samples).reshape((n, 1))
 
         # Masks.
-        masks = np.repeat(data.masks, n_samples, axis=0)
-
-        # Transform the positions.
-        if data.data_bounds is not None:
-            data_bounds = np.repeat(data.data_bounds, n_samples, axis=0)
-            self.data_range.from_bounds = data_bounds
-            pos = self.transforms.apply(pos)
-
-        assert pos.shape == (n, 2)
-        assert signal_index.shape == (n, 1)
+        masks = np.repeat(data.masks.astype(np.float32), n_samples, axis=0)
         assert masks.shape == (n, 1)
 
-        # Position and depth.
-        self.program['a_position'] = pos.astype(np.float32)
-        self.program['a_signal_index'] = signal_index.astype(np.float32)
-        self.program['a_mask'] = masks.astype(np.float32)
+        self.program['a_position'] = pos
+        self.program['a_signal_index'] = signal_index
+        self.program['a_mask'] = masks
 
         self.program['u_color'] = self.color
         self.program['u_mask_max'] = _max(masks)
@@ -517,7 +661,7 @@ class HistogramVisual(BaseVisual):
         self.data_range.from_bounds = data_bounds
 
         # Set the transformed position.
-        pos = np.vstack(_tesselate_histogram(row) for row in hist)
+        pos = _tesselate_histogram(hist)
         pos_tr = self.transforms.apply(pos)
         assert pos_tr.shape == (n, 2)
         self.program['a_position'] = pos_tr.astype(np.float32)
@@ -532,6 +676,95 @@ class HistogramVisual(BaseVisual):
         self.program['n_hists'] = n_hists
 
 
+def _density_atlas(images):
+    """Concatenate images with the same shape horizontally."""
+    if not images:
+        return np.zeros((1, 1))
+    shape = images[0].shape
+    assert all(image.shape == shape for image in images)
+    return np.hstack(images)
+
+
+class DensityVisual(BaseVisual):
+    """Density images, typically 2D histograms, displayed as textured
+    rectangles.
+
+    The values of the images, between 0 and 1, are the opacity of the
+    uniform color. All images of a visual must have the same shape: they
+    are uploaded in a single texture.
+
+    """
+    _default_color = (.5, .5, .5, 1.)
+    # The images are not concatenated.
+    allow_list = ('image',)
+
+    def __init__(self, color=None):
+        super(DensityVisual, self).__init__()
+        self.set_shader('density')
+        self.set_primitive_type('triangles')
+        self.data_range = Range(NDC)
+        self.transforms.add_on_cpu(self.data_range)
+        self.color = color or self._default_color
+
+    @staticmethod
+    def validate(image=None,
+                 pos=None,
+                 data_bounds=None,
+                 ):
+        # NOTE: the images are wrapped in lists, as the lists of the
+        # successive items are flattened when the items are accumulated.
+        if isinstance(image, np.ndarray):
+            image = [image]
+        images = [np.asarray(im, dtype=np.float64) for im in (image or [])]
+        for im in images:
+            assert im.ndim == 2
+            assert np.all(im >= 0) and np.all(im <= 1)
+        n = len(images)
+
+        # Rectangles `(xmin, ymin, xmax, ymax)` of the images.
+        if pos is None:
+            pos = np.tile(NDC, (n, 1))
+        pos = np.atleast_2d(np.asarray(pos, dtype=np.float64))
+        if n == 0:
+            pos = pos.reshape((0, 4))
+        assert pos.shape == (n, 4)
+
+        if data_bounds is None:
+            data_bounds = NDC
+        data_bounds = _get_data_bounds(data_bounds, length=n)
+        data_bounds = data_bounds.astype(np.float64)
+        assert data_bounds.shape == (n, 4)
+
+        return Bunch(image=images, pos=pos, data_bounds=data_bounds)
+
+    @staticmethod
+    def vertex_count(pos=None, **kwargs):
+        """Take the output of validate() as input."""
+        return 6 * pos.shape[0]
+
+    def set_data(self, *args, **kwargs):
+        data = self.validate(*args, **kwargs)
+        n = len(data.image)
+        x0, y0, x1, y1 = data.pos.T
+
+        # Two triangles per image.
+        pos = np.c_[x0, y0, x1, y0, x0, y1, x0, y1, x1, y0, x1, y1]
+        pos = pos.reshape((6 * n, 2))
+        self.data_range.from_bounds = np.repeat(data.data_bounds, 6, axis=0)
+        pos_tr = self.transforms.apply(pos) if n else pos
+
+        # Texture coordinates in the image atlas.
+        u = np.tile([0., 1., 0., 0., 1., 1.], n)
+        u = (u + np.repeat(np.arange(n), 6)) / max(n, 1)
+        v = np.tile([0., 0., 1., 1., 0., 1.], n)
+
+        self.program['a_position'] = pos_tr.astype(np.float32)
+        self.program['a_tex_coords'] = np.c_[u, v].astype(np.float32)
+        atlas = _density_atlas(data.image)
+        self.program['u_density'] = atlas[..., np.newaxis].astype(np.float32)
+        self.program['u_color'] = self.color
+
+
 class TextVisual(BaseVisual):
     """Display strings at multiple locations.
 
@@ -3,4 +3,4 @@
 
 """Statistics functions."""
 
-from .ccg import correlograms
+from .ccg import correlograms, correlograms_per_cluster
@@ -6,16 +6,30 @@
 # Imports
 #------------------------------------------------------------------------------
 
+from collections import OrderedDict
+import logging
+from threading import Lock
+
 import numpy as np
 
 from phy.utils._types import _as_array
 from phy.io.array import _index_of, _unique
 
+logger = logging.getLogger(__name__)
+
 
 #------------------------------------------------------------------------------
 # Cross-correlograms
 #------------------------------------------------------------------------------
 
+# The sorted engine is used when the maximum number of spikes in a window is
+# larger than this ratio times the average number of spikes in a window.
+_SORTED_ENGINE_RATIO = 3
+
+# Maximum number of pairs of spikes processed at once by the sorted engine.
+_N_PAIRS_MAX = 2 ** 22
+
+
 def _increment(arr, indices):
     """Increment some indices in a 1D vector of non-negative integers.
     Repeated indices are taken into account."""
@@ -54,6 +68,136 @@ def _symmetrize_correlograms(correlograms):
     return np.dstack((sym, correlograms))
 
 
+def _correlograms_shift(correlograms, spike_samples, spike_clusters_i,
+                        binsize, winsize_bins):
+    """Accumulate the CCGs by comparing the spike train with shifted copies
+    of itself.
+
+    The cost scales with the number of spikes times the maximum number of
+    spikes in a window.
+
+    """
+    # Shift between the two copies of the spike trains.
+    shift = 1
+
+    # At a given shift, the mask precises which spikes have matching spikes
+    # within the correlogram time window.
+    mask = np.ones_like(spike_samples, dtype=np.bool)
+
+    # The loop continues as long as there is at least one spike with
+    # a matching spike.
+    while mask[:-shift].any():
+        # Number of time samples between spike i and spike i+shift.
+        spike_diff = _diff_shifted(spike_samples, shift)
+
+        # Binarize the delays between spike i and spike i+shift.
+        spike_diff_b = spike_diff // binsize
+
+        # Spikes with no matching spikes are masked.
+        mask[:-shift][spike_diff_b > (winsize_bins // 2)] = False
+
+        # Cache the masked spike delays.
+        m = mask[:-shift].copy()
+        d = spike_diff_b[m]
+
+        # Find the indices in the raveled correlograms array that need
+        # to be incremented, taking into account the spike clusters.
+        indices = np.ravel_multi_index((spike_clusters_i[:-shift][m],
+                                        spike_clusters_i[+shift:][m],
+                                        d),
+                                       correlograms.shape)
+
+        # Increment the matching spikes in the correlograms array.
+        _increment(correlograms.ravel(), indices)
+
+        shift += 1
+
+    return correlograms
+
+
+def _correlograms_sorted(correlograms, spike_samples, spike_clusters_i,
+                         binsize, winsize_bins, n_pairs_max=None):
+    """Accumulate the CCGs by finding, for every spike, the last spike in its
+    window with a binary search.
+
+    All pairs of spikes within the window are processed in a single pass,
+    by chunks of at most `n_pairs_max` pairs. The cost scales with the total
+    number of pairs.
+
+    """
+    n_pairs_max = n_pairs_max or _N_PAIRS_MAX
+    n_spikes = len(spike_samples)
+    # Spike j > i matches spike i if `(t_j - t_i) // binsize <= n_bins`.
+    n_bins = winsize_bins // 2
+    ends = np.searchsorted(spike_samples,
+                           spike_samples + (n_bins + 1) * binsize,
+                           side='left')
+    # Number of matching spikes after every spike.
+    counts = ends - np.arange(n_spikes) - 1
+    cum_counts = np.concatenate([[0], np.cumsum(counts)])
+    # Spike bounds of the chunks, each chunk having about n_pairs_max pairs.
+    bounds = np.searchsorted(cum_counts,
+                             np.arange(0, cum_counts[-1], n_pairs_max),
+                             side='right') - 1
+    bounds = np.unique(np.concatenate([[0], bounds, [n_spikes]]))
+    flat = correlograms.ravel()
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        c = counts[start:end]
+        n_pairs = cum_counts[end] - cum_counts[start]
+        if n_pairs == 0:
+            continue
+        # First and second spike of every pair in the chunk.
+        i = np.repeat(np.arange(start, end), c)
+        j = (i + 1 + np.arange(n_pairs) -
+             np.repeat(cum_counts[start:end] - cum_counts[start], c))
+        d = (spike_samples[j] - spike_samples[i]) // binsize
+        indices = np.ravel_multi_index((spike_clusters_i[i],
+                                        spike_clusters_i[j],
+                                        d),
+                                       correlograms.shape)
+        _increment(flat, indices)
+    return correlograms
+
+
+def _use_sorted_engine(spike_samples, binsize, winsize_bins):
+    """Return whether the sorted engine should be used rather than the
+    shift engine.
+
+    The shift engine does as many passes on all spikes as the maximum number
+    of spikes in a window, whereas the sorted engine only processes the
+    actual pairs of spikes, but with a higher cost per pair. The sorted engine
+    is faster when the spike density is irregular, for example with bursting
+    units or long windows.
+
+    """
+    n_spikes = len(spike_samples)
+    if n_spikes <= 1:
+        return False
+    n_bins = winsize_bins // 2
+    ends = np.searchsorted(spike_samples,
+                           spike_samples + (n_bins + 1) * binsize,
+                           side='left')
+    # Number of spikes in the window following every spike.
+    counts = ends - np.arange(n_spikes)
+    return counts.max() > _SORTED_ENGINE_RATIO * counts.mean()
+
+
+def _bin_window_sizes(sample_rate, bin_size, window_size):
+    """Return the bin size in samples and the window size in bins."""
+    # Find `binsize`.
+    bin_size = np.clip(bin_size, 1e-5, 1e5)  # in seconds
+    binsize = int(sample_rate * bin_size)  # in samples
+    assert binsize >= 1
+
+    # Find `winsize_bins`.
+    window_size = np.clip(window_size, 1e-5, 1e5)  # in seconds
+    winsize_bins = 2 * int(.5 * window_size / bin_size) + 1
+
+    assert winsize_bins >= 1
+    assert winsize_bins % 2 == 1
+    return binsize, winsize_bins
+
+
 def correlograms(spike_times,
                  spike_clusters,
                  cluster_ids=None,
@@ -101,17 +245,8 @@ def correlograms(spike_times,
     assert spike_samples.ndim == 1
     assert spike_samples.shape == spike_clusters.shape
 
-    # Find `binsize`.
-    bin_size = np.clip(bin_size, 1e-5, 1e5)  # in seconds
-    binsize = int(sample_rate * bin_size)  # in samples
-    assert binsize >= 1
-
-    # Find `winsize_bins`.
-    window_size = np.clip(window_size, 1e-5, 1e5)  # in seconds
-    winsize_bins = 2 * int(.5 * window_size / bin_size) + 1
-
-    assert winsize_bins >= 1
-    assert winsize_bins % 2 == 1
+    binsize, winsize_bins = _bin_window_sizes(sample_rate, bin_size,
+                                              window_size)
 
     # Take the cluster oder into account.
     if cluster_ids is None:
@@ -123,48 +258,124 @@ def correlograms(spike_times,
     # Like spike_clusters, but with 0..n_clusters-1 indices.
     spike_clusters_i = _index_of(spike_clusters, clusters)
 
-    # Shift between the two copies of the spike trains.
-    shift = 1
+    correlograms = _create_correlograms_array(n_clusters, winsize_bins)
 
-    # At a given shift, the mask precises which spikes have matching spikes
-    # within the correlogram time window.
-    mask = np.ones_like(spike_samples, dtype=np.bool)
+    # Choose the engine as a function of the density of the spikes.
+    if _use_sorted_engine(spike_samples, binsize, winsize_bins):
+        _correlograms_sorted(correlograms, spike_samples, spike_clusters_i,
+                             binsize, winsize_bins)
+    else:
+        _correlograms_shift(correlograms, spike_samples, spike_clusters_i,
+                            binsize, winsize_bins)
 
-    correlograms = _create_correlograms_array(n_clusters, winsize_bins)
+    # Remove ACG peaks.
+    correlograms[np.arange(n_clusters),
+                 np.arange(n_clusters),
+                 0] = 0
 
-    # The loop continues as long as there is at least one spike with
-    # a matching spike.
-    while mask[:-shift].any():
-        # Number of time samples between spike i and spike i+shift.
-        spike_diff = _diff_shifted(spike_samples, shift)
+    if symmetrize:
+        return _symmetrize_correlograms(correlograms)
+    else:
+        return correlograms
 
-        # Binarize the delays between spike i and spike i+shift.
-        spike_diff_b = spike_diff // binsize
 
-        # Spikes with no matching spikes are masked.
-        mask[:-shift][spike_diff_b > (winsize_bins // 2)] = False
+def _pair_histogram(spike_ids_0, spike_samples_0,
+                    spike_ids_1, spike_samples_1,
+                    binsize, winsize_bins, n_pairs_max=None):
+    """Histogram of the delays between the spikes of a first cluster and the
+    following spikes of a second cluster, within the window.
 
-        # Cache the masked spike delays.
-        m = mask[:-shift].copy()
-        d = spike_diff_b[m]
+    The spikes of each cluster must be sorted. For every spike of the first
+    cluster, the matching spikes of the second cluster are found with a
+    binary search on the two sorted arrays.
 
-        # # Update the masks given the clusters to update.
-        # m0 = np.in1d(spike_clusters[:-shift], clusters)
-        # m = m & m0
-        # d = spike_diff_b[m]
-        d = spike_diff_b[m]
+    """
+    n_pairs_max = n_pairs_max or _N_PAIRS_MAX
+    n_bins = winsize_bins // 2
+    hist = np.zeros(n_bins + 1, dtype=np.int32)
+    # The following spikes are the ones with a larger spike id: this
+    # is consistent with correlograms() for identical spike times.
+    starts = np.searchsorted(spike_ids_1, spike_ids_0, side='right')
+    ends = np.searchsorted(spike_samples_1,
+                           spike_samples_0 + (n_bins + 1) * binsize,
+                           side='left')
+    counts = np.maximum(ends - starts, 0)
+    cum_counts = np.concatenate([[0], np.cumsum(counts)])
+    bounds = np.searchsorted(cum_counts,
+                             np.arange(0, cum_counts[-1], n_pairs_max),
+                             side='right') - 1
+    bounds = np.unique(np.concatenate([[0], bounds, [len(counts)]]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        c = counts[start:end]
+        n_pairs = cum_counts[end] - cum_counts[start]
+        if n_pairs == 0:
+            continue
+        i = np.repeat(np.arange(start, end), c)
+        j = (np.repeat(starts[start:end], c) + np.arange(n_pairs) -
+             np.repeat(cum_counts[start:end] - cum_counts[start], c))
+        d = (spike_samples_1[j] - spike_samples_0[i]) // binsize
+        _increment(hist, d)
+    return hist
+
+
+def correlograms_per_cluster(cluster_ids,
+                             spikes_per_cluster=None,
+                             spike_times_per_cluster=None,
+                             sample_rate=1.,
+                             bin_size=None,
+                             window_size=None,
+                             symmetrize=True,
+                             ):
+    """Compute all pairwise cross-correlograms among some clusters, from the
+    sorted spikes of every cluster.
+
+    Unlike `correlograms()`, this function only touches the spikes of the
+    specified clusters, and does not need to concatenate and sort them. The
+    output is identical.
 
-        # Find the indices in the raveled correlograms array that need
-        # to be incremented, taking into account the spike clusters.
-        indices = np.ravel_multi_index((spike_clusters_i[:-shift][m],
-                                        spike_clusters_i[+shift:][m],
-                                        d),
-                                       correlograms.shape)
+    Parameters
+    ----------
 
-        # Increment the matching spikes in the correlograms array.
-        _increment(correlograms.ravel(), indices)
+    cluster_ids : array-like
+        The list of clusters. That order will be used in the output array.
+    spikes_per_cluster : function
+        A function `cluster_id => spike_ids` returning the sorted spike ids of
+        a cluster.
+    spike_times_per_cluster : function
+        A function `cluster_id => spike_times` returning the spike times of
+        a cluster, in seconds.
+    bin_size : float
+        Size of the bin, in seconds.
+    window_size : float
+        Size of the window, in seconds.
 
-        shift += 1
+    Returns
+    -------
+
+    correlograms : array
+        A `(n_clusters, n_clusters, winsize_samples)` array with all pairwise
+        CCGs.
+
+    """
+    assert sample_rate > 0.
+    binsize, winsize_bins = _bin_window_sizes(sample_rate, bin_size,
+                                              window_size)
+    clusters = _as_array(cluster_ids)
+    n_clusters = len(clusters)
+
+    spike_ids = [_as_array(spikes_per_cluster(c)) for c in clusters]
+    spike_samples = [(np.asarray(spike_times_per_cluster(c),
+                                 dtype=np.float64) *
+                      sample_rate).astype(np.int64) for c in clusters]
+
+    correlograms = _create_correlograms_array(n_clusters, winsize_bins)
+    for i in range(n_clusters):
+        for j in range(n_clusters):
+            correlograms[i, j] = _pair_histogram(spike_ids[i],
+                                                 spike_samples[i],
+                                                 spike_ids[j],
+                                                 spike_samples[j],
+                                                 binsize, winsize_bins)
 
     # Remove ACG peaks.
     correlograms[np.arange(n_clusters),
@@ -175,3 +386,119 @@ def correlograms(spike_times,
         return _symmetrize_correlograms(correlograms)
     else:
         return correlograms
+
+
+#------------------------------------------------------------------------------
+# Correlogram cache
+#------------------------------------------------------------------------------
+
+class CorrelogramCache(object):
+    """Cache of pairwise cross-correlograms.
+
+    The cache wraps a function `(cluster_ids, bin_size, window_size) => ccg`
+    returning a symmetrized `(n_clusters, n_clusters, n_bins)` array, and
+    stores every pairwise CCG separately with a `(cluster_0, cluster_1,
+    bin_size, window_size)` key. The least recently used CCGs are
+    discarded when there are more than `max_size` of them.
+
+    The cache must be notified of the clustering changes with `on_cluster()`.
+    Since the CCGs are histograms, the CCGs of a merged cluster are obtained
+    by summing the cached CCGs of the merged clusters.
+
+    The cache is thread-safe. The CCGs are computed outside the lock, and
+    those computed during a clustering change are not cached.
+
+    """
+    def __init__(self, correlograms, max_size=None):
+        self._correlograms = correlograms
+        self.max_size = max_size or 100000
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        # Incremented at every clustering change.
+        self._generation = 0
+        self.n_hits = self.n_misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _get(self, key):
+        # Move the item to the end of the LRU list.
+        value = self._cache.pop(key)
+        self._cache[key] = value
+        return value
+
+    def _set(self, key, value):
+        self._cache.pop(key, None)
+        self._cache[key] = value
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _has(self, clusters_0, clusters_1, bin_size, window_size):
+        return all((c0, c1, bin_size, window_size) in self._cache
+                   for c0 in clusters_0 for c1 in clusters_1)
+
+    def get(self, cluster_ids, bin_size, window_size):
+        """Return the CCGs of the specified clusters, computing only the
+        ones that are not in the cache."""
+        cluster_ids = [int(c) for c in cluster_ids]
+        n = len(cluster_ids)
+        with self._lock:
+            if self._has(cluster_ids, cluster_ids, bin_size, window_size):
+                self.n_hits += 1
+                ccgs = [self._get((c0, c1, bin_size, window_size))
+                        for c0 in cluster_ids for c1 in cluster_ids]
+                return np.array(ccgs).reshape((n, n, -1))
+            self.n_misses += 1
+            generation = self._generation
+        ccg = self._correlograms(cluster_ids, bin_size, window_size)
+        with self._lock:
+            if generation != self._generation:
+                return ccg
+            for i, c0 in enumerate(cluster_ids):
+                for j, c1 in enumerate(cluster_ids):
+                    self._set((c0, c1, bin_size, window_size),
+                              ccg[i, j].copy())
+        return ccg
+
+    def _merge(self, parents, to):
+        """Compute the CCGs of a merged cluster from the CCGs of its
+        parents."""
+        params = set(key[2:] for key in self._cache)
+        others = set(key[0] for key in self._cache) - set(parents)
+        for bin_size, window_size in params:
+            args = (bin_size, window_size)
+            if not self._has(parents, parents, *args):
+                continue
+            # ACG of the merged cluster.
+            acg = sum(self._cache[(c0, c1) + args]
+                      for c0 in parents for c1 in parents)
+            # Remove the ACG peak.
+            acg[len(acg) // 2] = 0
+            self._set((to, to) + args, acg)
+            # CCGs between the merged cluster and the other clusters.
+            for other in others:
+                if not self._has(parents, [other], *args):
+                    continue
+                self._set((to, other) + args,
+                          sum(self._cache[(c, other) + args]
+                              for c in parents))
+                self._set((other, to) + args,
+                          sum(self._cache[(other, c) + args]
+                              for c in parents))
+
+    def on_cluster(self, up):
+        """Update the cache after a clustering change."""
+        with self._lock:
+            if up.added or up.deleted:
+                self._generation += 1
+            if up.description == 'merge' and len(up.added) == 1:
+                parents = [old for (old, new) in up.descendants]
+                self._merge(parents, up.added[0])
+            # Remove all CCGs involving deleted clusters.
+            deleted = set(up.deleted)
+            if deleted:
+                for key in list(self._cache):
+                    if key[0] in deleted or key[1] in deleted:
+                        del self._cache[key]
+        logger.log(5, "CCG cache: %d items, %d hits, %d misses.",
+                   len(self._cache), self.n_hits, self.n_misses)
@@ -78,3 +78,191 @@ def get_mean_masked_features_distance(mean_features_0,
     d_1 = mu_1 * omeg_1
 
     return np.linalg.norm(d_0 - d_1)
+
+
+#------------------------------------------------------------------------------
+# Batched wizard measures
+#------------------------------------------------------------------------------
+
+def _masked_features_vectors(mean_features, mean_masks,
+                             n_features_per_channel=None):
+    """Return the `(n_clusters, n_channels * n_features_per_channel)` array
+    of the mean features multiplied by the mean masks of all clusters."""
+    assert n_features_per_channel > 0
+    n_clusters, n_channels = mean_masks.shape
+    mu = np.asarray(mean_features, dtype=np.float64)
+    mu = mu.reshape((n_clusters, n_channels * n_features_per_channel))
+    omeg = np.repeat(mean_masks, n_features_per_channel, axis=1)
+    return mu * omeg
+
+
+def _blocks(n, block_size):
+    for i in range(0, n, block_size):
+        yield slice(i, min(n, i + block_size))
+
+
+def _distances_block(x, sq_norms, rows):
+    """Euclidean distances between some rows and all vectors, computed
+    with `|a - b|^2 = |a|^2 + |b|^2 - 2 a.b`."""
+    d = sq_norms[rows][:, np.newaxis] + sq_norms[np.newaxis, :]
+    d -= 2 * np.dot(x[rows], x.T)
+    np.maximum(d, 0, out=d)
+    return np.sqrt(d, out=d)
+
+
+def get_mean_masked_features_distances(mean_features,
+                                       mean_masks,
+                                       n_features_per_channel=None,
+                                       rows=None,
+                                       block_size=None,
+                                       ):
+    """Compute the distances between the mean masked features of all pairs
+    of clusters.
+
+    Parameters
+    ----------
+
+    mean_features : array
+        The `(n_clusters, n_channels, n_features_per_channel)` array of the
+        mean features of all clusters.
+    mean_masks : array
+        The `(n_clusters, n_channels)` array of the mean masks.
+    n_features_per_channel : int
+    rows : array-like
+        The clusters (indices) of the rows of the matrix. By default, all
+        clusters.
+    block_size : int
+        Number of rows computed at once, to bound the memory usage.
+
+    Returns
+    -------
+
+    distances : array
+        A `(n_rows, n_clusters)` array.
+
+    """
+    x = _masked_features_vectors(mean_features, mean_masks,
+                                 n_features_per_channel)
+    n = x.shape[0]
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    block_size = block_size or 256
+    sq_norms = (x * x).sum(axis=1)
+    out = np.empty((len(rows), n), dtype=np.float64)
+    for s in _blocks(len(rows), block_size):
+        out[s] = _distances_block(x, sq_norms, rows[s])
+    # The distance of a cluster with itself is zero.
+    out[np.arange(len(rows)), rows] = 0
+    return out
+
+
+def get_mean_masked_features_top_k(mean_features,
+                                   mean_masks,
+                                   n_features_per_channel=None,
+                                   k=10,
+                                   rows=None,
+                                   block_size=None,
+                                   ):
+    """Return the `k` closest clusters of every cluster, with respect to the
+    distance between the mean masked features.
+
+    The distance matrix is computed by blocks of rows and never stored
+    entirely. A cluster is not included in its own closest clusters.
+
+    Returns
+    -------
+
+    indices : array
+        A `(n_rows, k)` array with the indices of the closest clusters, in
+        increasing order of distance.
+    distances : array
+        A `(n_rows, k)` array with the corresponding distances.
+
+    """
+    x = _masked_features_vectors(mean_features, mean_masks,
+                                 n_features_per_channel)
+    n = x.shape[0]
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    k = min(k, n - 1)
+    block_size = block_size or 256
+    sq_norms = (x * x).sum(axis=1)
+    indices = np.empty((len(rows), k), dtype=np.int64)
+    distances = np.empty((len(rows), k), dtype=np.float64)
+    if k <= 0:
+        return indices, distances
+    for s in _blocks(len(rows), block_size):
+        d = _distances_block(x, sq_norms, rows[s])
+        i = np.arange(d.shape[0])[:, np.newaxis]
+        # Exclude the clusters themselves.
+        d[i[:, 0], rows[s]] = np.inf
+        # Find the k smallest distances, and sort them.
+        idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+        idx = idx[i, np.argsort(d[i, idx], axis=1, kind='mergesort')]
+        indices[s] = idx
+        distances[s] = d[i, idx]
+    return indices, distances
+
+
+def update_mean_masked_features_distances(distances,
+                                          mean_features,
+                                          mean_masks,
+                                          n_features_per_channel=None,
+                                          old_index=None,
+                                          changed=None,
+                                          block_size=None,
+                                          ):
+    """Update a distance matrix after a merge or a split, by recomputing
+    only the rows and columns of the changed clusters.
+
+    Parameters
+    ----------
+
+    distances : array
+        The `(n_old, n_old)` distance matrix before the clustering change.
+    mean_features : array
+        The mean features of the clusters after the change.
+    mean_masks : array
+        The mean masks of the clusters after the change.
+    n_features_per_channel : int
+    old_index : array-like
+        For every cluster after the change, its index in the old distance
+        matrix, or -1 for new clusters. By default, the clusters are
+        unchanged.
+    changed : array-like
+        The indices of other clusters to recompute.
+    block_size : int
+
+    Returns
+    -------
+
+    distances : array
+        The new `(n_new, n_new)` distance matrix. The input matrix is not
+        modified.
+
+    """
+    n = mean_masks.shape[0]
+    if old_index is None:
+        assert distances.shape == (n, n)
+        old_index = np.arange(n)
+        out = np.array(distances, dtype=np.float64)
+    else:
+        old_index = np.asarray(old_index, dtype=np.int64)
+        assert old_index.shape == (n,)
+        # Copy the distances between the clusters that were kept.
+        kept = np.nonzero(old_index >= 0)[0]
+        out = np.empty((n, n), dtype=np.float64)
+        out[np.ix_(kept, kept)] = distances[np.ix_(old_index[kept],
+                                                   old_index[kept])]
+    rows = np.nonzero(old_index < 0)[0]
+    if changed is not None:
+        rows = np.union1d(rows, np.asarray(changed, dtype=np.int64))
+    if not len(rows):
+        return out
+    # The matrix is symmetric.
+    d = get_mean_masked_features_distances(mean_features, mean_masks,
+                                           n_features_per_channel,
+                                           rows=rows,
+                                           block_size=block_size,
+                                           )
+    out[rows, :] = d
+    out[:, rows] = d.T
+    return out
@@ -6,13 +6,22 @@
 # Imports
 #------------------------------------------------------------------------------
 
+from threading import Thread
+
 import numpy as np
 from numpy.testing import assert_array_equal as ae
 
 from ..ccg import (_increment,
                    _diff_shifted,
+                   _create_correlograms_array,
+                   _correlograms_shift,
+                   _correlograms_sorted,
+                   _use_sorted_engine,
                    correlograms,
+                   correlograms_per_cluster,
+                   CorrelogramCache,
                    )
+from phy.utils import Bunch
 
 
 #------------------------------------------------------------------------------
@@ -172,3 +181,165 @@ def test_symmetrize_correlograms():
     assert np.all(sym[np.arange(3), np.arange(3), 25] == 0)
 
     ae(sym[0, 1, :], sym[1, 0, ::-1])
+
+
+def _bursting_data(n_clusters):
+    # Bursts of 20 spikes separated by 1 ms, every ~100 ms.
+    n_bursts = 500
+    burst_times = np.cumsum(np.random.exponential(scale=.1, size=n_bursts))
+    spike_times = (burst_times[:, np.newaxis] +
+                   .001 * np.arange(20)).ravel()
+    spike_samples = np.sort((spike_times * 20000).astype(np.int64))
+    spike_clusters = np.random.randint(0, n_clusters, len(spike_samples))
+    return spike_samples, spike_clusters
+
+
+def test_ccg_engines():
+    for data in (_random_data(4), _bursting_data(4)):
+        spike_samples = data[0].astype(np.int64)
+        spike_clusters = data[1]
+        for binsize, winsize_bins in ((20, 51), (1, 7), (100, 201)):
+            c0 = _create_correlograms_array(4, winsize_bins)
+            c1 = _create_correlograms_array(4, winsize_bins)
+            _correlograms_shift(c0, spike_samples, spike_clusters,
+                                binsize, winsize_bins)
+            _correlograms_sorted(c1, spike_samples, spike_clusters,
+                                 binsize, winsize_bins, n_pairs_max=1000)
+            ae(c0, c1)
+
+
+def test_ccg_engine_choice():
+    # Regular spike train.
+    spike_samples = 10 * np.arange(10000)
+    assert not _use_sorted_engine(spike_samples, 20, 51)
+    spike_samples, _ = _bursting_data(2)
+    assert _use_sorted_engine(spike_samples, 20, 51)
+
+
+def test_ccg_cache():
+    spike_samples, spike_clusters = _random_data(4)
+    spike_clusters = spike_clusters.copy()
+    binsize, winsize_bins = _ccg_params()
+    _calls = []
+
+    def get_correlograms(cluster_ids, bin_size, window_size):
+        _calls.append(cluster_ids)
+        m = np.in1d(spike_clusters, cluster_ids)
+        return correlograms(spike_samples[m], spike_clusters[m],
+                            cluster_ids=cluster_ids,
+                            bin_size=bin_size, window_size=window_size,
+                            sample_rate=20000)
+
+    cache = CorrelogramCache(get_correlograms, max_size=40)
+    c = cache.get([0, 1, 2, 3], binsize, winsize_bins)
+    assert c.shape == (4, 4, 51)
+    assert len(cache) == 16
+
+    # Cached CCGs.
+    ae(cache.get([2, 1], binsize, winsize_bins), c[2:0:-1, 2:0:-1])
+    assert len(_calls) == 1
+    assert (cache.n_hits, cache.n_misses) == (1, 1)
+
+    # Merge: the CCGs of the merged cluster come from the cache.
+    spike_clusters[np.in1d(spike_clusters, [1, 2])] = 4
+    up = Bunch(description='merge', added=[4], deleted=[1, 2],
+               descendants=[(1, 4), (2, 4)])
+    cache.on_cluster(up)
+    assert len(cache) == 9
+    ae(cache.get([0, 4, 3], binsize, winsize_bins),
+       get_correlograms([0, 4, 3], binsize, winsize_bins))
+    assert len(_calls) == 2
+
+    # Split: CCGs are recomputed.
+    spike_clusters[spike_clusters == 4] = 5
+    spike_clusters[:10] = 6
+    up = Bunch(description='assign', added=[5, 6], deleted=[0, 3, 4],
+               descendants=[])
+    cache.on_cluster(up)
+    assert len(cache) == 0
+    cache.get([5, 6], binsize, winsize_bins)
+    assert len(_calls) == 3
+
+    # LRU.
+    cache.get([0, 1, 2, 3, 5, 6], 2 * binsize, winsize_bins)
+    assert len(cache) == 40
+    assert cache.get([0, 1, 2, 3, 5, 6, 7], binsize,
+                     winsize_bins).shape == (7, 7, 51)
+    assert len(cache) == 40
+
+
+def test_ccg_cache_threads():
+    def get_correlograms(cluster_ids, bin_size, window_size):
+        n = len(cluster_ids)
+        return np.ones((n, n, 11), dtype=np.int32)
+
+    cache = CorrelogramCache(get_correlograms, max_size=20)
+    errors = []
+
+    def worker(i):
+        try:
+            for j in range(200):
+                cluster_ids = [(i + j + k) % 10 for k in range(3)]
+                assert cache.get(cluster_ids, 1, 11).shape == (3, 3, 11)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for j in range(200):
+        cache.on_cluster(Bunch(description='assign', added=[],
+                               deleted=[j % 10], descendants=[]))
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(cache) <= 20
+
+
+def test_ccg_cache_cluster_change():
+    def get_correlograms(cluster_ids, bin_size, window_size):
+        # The clustering changes while the CCGs are computed.
+        cache.on_cluster(Bunch(description='assign', added=[4],
+                               deleted=[3], descendants=[]))
+        n = len(cluster_ids)
+        return np.ones((n, n, 11), dtype=np.int32)
+
+    cache = CorrelogramCache(get_correlograms)
+    assert cache.get([0, 1], 1, 11).shape == (2, 2, 11)
+    assert len(cache) == 0
+
+
+def test_ccg_per_cluster():
+    sr = 20000
+    nspikes = 10000
+    spike_samples = np.cumsum(np.random.exponential(scale=.002, size=nspikes))
+    spike_samples = (spike_samples * sr).astype(np.uint64)
+    # Add a few ties.
+    spike_samples[1::50] = spike_samples[:-1:50]
+    spike_clusters = np.random.randint(0, 10, nspikes)
+    spike_times = spike_samples / float(sr)
+
+    spc = {c: np.nonzero(spike_clusters == c)[0] for c in range(10)}
+
+    def spikes_per_cluster(c):
+        return spc[c]
+
+    def spike_times_per_cluster(c):
+        return spike_times[spc[c]]
+
+    cluster_ids = [2, 5, 7]
+    kwargs = dict(sample_rate=sr, bin_size=1e-3, window_size=50e-3)
+    ccg = correlograms_per_cluster(
+        cluster_ids,
+        spikes_per_cluster=spikes_per_cluster,
+        spike_times_per_cluster=spike_times_per_cluster,
+        **kwargs)
+
+    # Reference: compute the CCGs on the selected spikes only.
+    spikes = np.sort(np.concatenate([spc[c] for c in cluster_ids]))
+    sc = spike_clusters[spikes].copy()
+    for i, c in enumerate(cluster_ids):
+        sc[sc == c] = i
+    expected = correlograms(spike_times[spikes], sc,
+                            cluster_ids=np.arange(3), **kwargs)
+    ae(ccg, expected)
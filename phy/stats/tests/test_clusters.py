@@ -16,6 +16,9 @@ from ..clusters import (mean,
                         get_mean_probe_position,
                         get_sorted_main_channels,
                         get_mean_masked_features_distance,
+                        get_mean_masked_features_distances,
+                        get_mean_masked_features_top_k,
+                        update_mean_masked_features_distances,
                         get_waveform_amplitude,
                         )
 from phy.electrode.mea import staggered_positions
@@ -143,3 +146,67 @@ def test_mean_masked_features_distance(features,
     d_computed = get_mean_masked_features_distance(f0, f1, m0, m1,
                                                    n_features_per_channel)
     ac(d_expected, d_computed)
+
+
+def _mean_features_masks(n_clusters, n_channels, n_features_per_channel):
+    mean_features = artificial_features(n_clusters, n_channels,
+                                        n_features_per_channel)
+    mean_masks = artificial_masks(n_clusters, n_channels)
+    return mean_features, mean_masks
+
+
+def test_mean_masked_features_distances(n_channels, n_features_per_channel):
+    n_clusters = 20
+    nfpc = n_features_per_channel
+    mf, mm = _mean_features_masks(n_clusters, n_channels, nfpc)
+
+    # Compare with the pairwise distances.
+    expected = np.array([[get_mean_masked_features_distance(
+                          mf[i], mf[j], mm[i], mm[j], nfpc)
+                          for j in range(n_clusters)]
+                         for i in range(n_clusters)])
+    d = get_mean_masked_features_distances(mf, mm, nfpc, block_size=7)
+    ac(d, expected, atol=1e-9)
+    ae(np.diag(d), 0)
+
+    # Some rows only.
+    d = get_mean_masked_features_distances(mf, mm, nfpc, rows=[3, 5])
+    ac(d, expected[[3, 5]], atol=1e-9)
+
+    # Top-k.
+    k = 4
+    indices, distances = get_mean_masked_features_top_k(mf, mm, nfpc, k=k,
+                                                        block_size=7)
+    assert indices.shape == distances.shape == (n_clusters, k)
+    for i in range(n_clusters):
+        assert i not in indices[i]
+        assert np.all(np.diff(distances[i]) >= 0)
+        ac(distances[i], np.sort(np.delete(expected[i], i))[:k], atol=1e-9)
+        ac(distances[i], expected[i, indices[i]], atol=1e-9)
+
+
+def test_mean_masked_features_distances_update(n_channels,
+                                               n_features_per_channel):
+    n_clusters = 10
+    nfpc = n_features_per_channel
+    mf, mm = _mean_features_masks(n_clusters, n_channels, nfpc)
+    d = get_mean_masked_features_distances(mf, mm, nfpc)
+
+    # Merge clusters 2 and 7 into a new cluster at the end.
+    kept = [i for i in range(n_clusters) if i not in (2, 7)]
+    mf_new = np.concatenate((mf[kept], mf[[2, 7]].mean(axis=0)[None]))
+    mm_new = np.concatenate((mm[kept], mm[[2, 7]].mean(axis=0)[None]))
+    old_index = kept + [-1]
+    d_new = update_mean_masked_features_distances(d, mf_new, mm_new, nfpc,
+                                                  old_index=old_index)
+    ac(d_new, get_mean_masked_features_distances(mf_new, mm_new, nfpc),
+       atol=1e-9)
+
+    # Change a cluster in place: the input matrix is not modified.
+    mf_new[3] += 1
+    d_old = d_new.copy()
+    d_new = update_mean_masked_features_distances(d_old, mf_new, mm_new,
+                                                  nfpc, changed=[3])
+    ac(d_new, get_mean_masked_features_distances(mf_new, mm_new, nfpc),
+       atol=1e-9)
+    assert not np.allclose(d_old[3], d_new[3])
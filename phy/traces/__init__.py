@@ -4,4 +4,5 @@
 """Spike detection, waveform extraction."""
 
 from .filter import Filter, Whitening
+from .pyramid import MinMaxPyramid
 from .waveform import WaveformLoader, WaveformExtractor
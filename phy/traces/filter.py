@@ -6,10 +6,14 @@
 # Imports
 #------------------------------------------------------------------------------
 
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 from scipy import signal
+from six import string_types
 
 from ..utils._types import _as_array
+from ..io.array import chunk_bounds, excerpts
 
 
 #------------------------------------------------------------------------------
@@ -34,6 +38,108 @@ def apply_filter(x, filter=None, axis=0):
     return signal.filtfilt(b, a, x, axis=axis)
 
 
+def _filter_margin(filter, eps=1e-9):
+    """Number of samples after which the impulse response of a filter
+    becomes negligible."""
+    b, a = filter
+    r = np.abs(np.roots(a)).max() if len(a) > 1 else 0.
+    n = int(np.ceil(np.log(eps) / np.log(r))) if 0 < r < 1 else 0
+    # The margin also needs to cover the padding used by filtfilt.
+    return max(n, 3 * max(len(a), len(b)))
+
+
+def _output_array(out, shape, dtype=np.float64):
+    """Return an output array: either the specified array, a new
+    memory-mapped `.npy` file if `out` is a path, or a new array."""
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif isinstance(out, string_types):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype,
+                                        shape=shape)
+    assert out.shape == shape
+    return out
+
+
+def _chunks(n_samples, chunk_size, margin=0):
+    """Return the list of `(s_start, s_end, keep_start, keep_end)` chunks
+    covering an array, with a margin on both sides of every chunk."""
+    if n_samples <= chunk_size + 2 * margin:
+        return [(0, n_samples, 0, n_samples)]
+    return list(chunk_bounds(n_samples, chunk_size + 2 * margin,
+                             overlap=2 * margin))
+
+
+def _map_chunks(f, chunks, n_threads=None, pr=None):
+    """Call a function on every chunk in a pool of threads, and return
+    the list of results in the order of the chunks."""
+    if pr is not None:
+        pr.value_max = len(chunks)
+    pool = ThreadPool(n_threads)
+    out = [None] * len(chunks)
+
+    def _f(i):
+        return i, f(chunks[i])
+
+    try:
+        for i, res in pool.imap_unordered(_f, range(len(chunks))):
+            out[i] = res
+            if pr is not None:
+                pr.increment()
+    finally:
+        pool.close()
+        pool.join()
+    return out
+
+
+def apply_filter_chunked(x, filter=None, out=None, chunk_size=None,
+                         margin=None, n_threads=None, pr=None):
+    """Apply a filter to a long `(n_samples, ...)` array, chunk by chunk.
+
+    The chunks are filtered in parallel in a pool of threads. Every chunk
+    is extended with a margin on both sides to absorb the filter
+    transients, so that the output matches `apply_filter()` up to
+    floating-point precision.
+
+    Parameters
+    ----------
+
+    x : array
+        An `(n_samples, ...)` array, typically a memory-mapped array.
+    filter : tuple
+        The `(b, a)` filter coefficients.
+    out : array or str
+        The output array, or the path to a `.npy` file that will be
+        memory-mapped. By default, a new array is created in memory.
+    chunk_size : int
+        Number of samples in every chunk, excluding the margins.
+    margin : int
+        Number of samples added on each side of every chunk. By default,
+        the length of the filter transients.
+    n_threads : int
+        Number of threads. By default, the number of CPUs.
+    pr : ProgressReporter
+        Optional progress reporter, incremented after every chunk.
+
+    """
+    n_samples = x.shape[0]
+    if chunk_size is None:
+        chunk_size = 2 ** 16
+    if margin is None:
+        margin = _filter_margin(filter)
+    out = _output_array(out, x.shape)
+    if n_samples == 0:
+        return out
+
+    def _filter_chunk(chunk):
+        s_start, s_end, keep_start, keep_end = chunk
+        y = apply_filter(x[s_start:s_end], filter=filter)
+        out[keep_start:keep_end] = y[keep_start - s_start:keep_end - s_start]
+
+    _map_chunks(_filter_chunk, _chunks(n_samples, chunk_size, margin),
+                n_threads=n_threads, pr=pr)
+    return out
+
+
 class Filter(object):
     """Multichannel bandpass filter.
 
@@ -58,30 +164,96 @@ class Filter(object):
     def __call__(self, data):
         return apply_filter(data, filter=self._filter)
 
+    def apply_chunked(self, data, out=None, **kwargs):
+        """Filter a long array chunk by chunk, possibly into a memory-mapped
+        output. See `apply_filter_chunked()` for the keyword arguments."""
+        return apply_filter_chunked(data, filter=self._filter, out=out,
+                                    **kwargs)
+
 
 #------------------------------------------------------------------------------
 # Whitening
 #------------------------------------------------------------------------------
 
+def _covariance_stats(x, dtype=np.float64):
+    """Return the number of samples, the mean, and the centered sum of
+    outer products of a chunk of data."""
+    x = np.asarray(x, dtype=dtype)
+    n = x.shape[0]
+    mean = x.mean(axis=0)
+    xc = x - mean
+    return n, mean.astype(np.float64), np.dot(xc.T, xc).astype(np.float64)
+
+
+def _combine_covariance_stats(stats):
+    """Combine the statistics of several chunks into a covariance matrix.
+
+    The centered sums of outer products are combined with the chunk means,
+    which is more accurate than accumulating the raw outer products.
+
+    """
+    stats = [s for s in stats if s[0] > 0]
+    ns = np.array([s[0] for s in stats], dtype=np.float64)
+    means = np.array([s[1] for s in stats])
+    n = ns.sum()
+    assert n >= 2
+    mean = np.dot(ns, means) / n
+    dm = means - mean
+    m2 = sum(s[2] for s in stats) + np.dot(dm.T * ns, dm)
+    return m2 / (n - 1)
+
+
 class Whitening(object):
     """Compute a whitening matrix and apply it to data.
 
     Contributed by Pierre Yger.
 
     """
-    def fit(self, x, fudge=1e-18):
+    def fit(self, x, fudge=1e-18, chunk_size=None,
+            n_excerpts=None, excerpt_size=None,
+            dtype=np.float64, n_threads=None, pr=None):
         """Compute the whitening matrix.
 
+        The covariance matrix is computed chunk by chunk, in parallel, so
+        that `x` can be a memory-mapped array that does not fit in memory.
+
         Parameters
         ----------
 
         x : array
             An `(n_samples, n_channels)` array.
+        chunk_size : int
+            Number of samples in every chunk. By default, `2 ** 16`.
+        n_excerpts : int
+            If specified, the covariance is only computed on `n_excerpts`
+            regularly-spaced excerpts with `excerpt_size` samples.
+        excerpt_size : int
+            Number of samples in every excerpt.
+        dtype : dtype
+            Data type used to compute the covariance of every chunk. Using
+            `np.float32` is faster but less accurate. The chunks are always
+            combined in double precision.
+        n_threads : int
+            Number of threads. By default, the number of CPUs.
+        pr : ProgressReporter
+            Optional progress reporter, incremented after every chunk.
 
         """
         assert x.ndim == 2
         ns, nc = x.shape
-        x_cov = np.cov(x, rowvar=0)
+        if n_excerpts is not None:
+            assert excerpt_size
+            chunks = list(excerpts(ns, n_excerpts=n_excerpts,
+                                   excerpt_size=excerpt_size))
+        else:
+            chunks = [(s_start, s_end) for s_start, s_end, _, _ in
+                      _chunks(ns, chunk_size or 2 ** 16)]
+
+        def _chunk_stats(chunk):
+            return _covariance_stats(x[chunk[0]:chunk[1]], dtype=dtype)
+
+        stats = _map_chunks(_chunk_stats, chunks, n_threads=n_threads, pr=pr)
+        x_cov = _combine_covariance_stats(stats)
         assert x_cov.shape == (nc, nc)
         d, v = np.linalg.eigh(x_cov)
         d = np.diag(1. / np.sqrt(d + fudge))
@@ -91,7 +263,8 @@ class Whitening(object):
         self._matrix = w
         return w
 
-    def transform(self, x):
+    def transform(self, x, out=None, chunk_size=None, n_threads=None,
+                  pr=None):
         """Whiten some data.
 
         Parameters
@@ -99,6 +272,28 @@ class Whitening(object):
 
         x : array
             An `(n_samples, n_channels)` array.
+        out : array or str
+            If specified, the output array, or the path to a `.npy` file
+            that will be memory-mapped. The data is then whitened chunk by
+            chunk, in parallel.
+        chunk_size : int
+            Number of samples in every chunk. By default, `2 ** 16`.
+        n_threads : int
+            Number of threads. By default, the number of CPUs.
+        pr : ProgressReporter
+            Optional progress reporter, incremented after every chunk.
 
         """
-        return np.dot(x, self._matrix)
+        if out is None and chunk_size is None:
+            return np.dot(x, self._matrix)
+        out = _output_array(out, x.shape)
+        if x.shape[0] == 0:
+            return out
+
+        def _transform_chunk(chunk):
+            s_start, s_end, _, _ = chunk
+            out[s_start:s_end] = np.dot(x[s_start:s_end], self._matrix)
+
+        chunks = _chunks(x.shape[0], chunk_size or 2 ** 16)
+        _map_chunks(_transform_chunk, chunks, n_threads=n_threads, pr=pr)
+        return out
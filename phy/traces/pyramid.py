@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""Multi-resolution min/max decimation of traces."""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+from glob import glob
+import logging
+import os
+import os.path as op
+from threading import Lock
+
+import numpy as np
+
+from phy.io.array import read_array
+from phy.utils import Bunch, _load_json, _save_json
+
+logger = logging.getLogger(__name__)
+
+
+#------------------------------------------------------------------------------
+# Min/max pyramid
+#------------------------------------------------------------------------------
+
+def _minmax(x, bin_size):
+    """Return the min and max of an `(n_samples, n_channels)` array in
+    successive bins of `bin_size` samples, as an `(n_bins, 2, n_channels)`
+    array. The last bin may be incomplete."""
+    n, nc = x.shape
+    n_bins = -(-n // bin_size)
+    if n_bins * bin_size > n:
+        # Pad the last bin with its last sample.
+        pad = np.repeat(x[-1:], n_bins * bin_size - n, axis=0)
+        x = np.concatenate((x, pad), axis=0)
+    x = x.reshape((n_bins, bin_size, nc))
+    out = np.empty((n_bins, 2, nc), dtype=x.dtype)
+    out[:, 0, :] = x.min(axis=1)
+    out[:, 1, :] = x.max(axis=1)
+    return out
+
+
+def _source_id(traces):
+    """Identify the file of a memory-mapped array with its path, size, and
+    modification time."""
+    filename = getattr(traces, 'filename', None)
+    if not filename or not op.exists(filename):
+        return None
+    stat = os.stat(filename)
+    return [op.realpath(filename), stat.st_size, stat.st_mtime]
+
+
+class MinMaxPyramid(object):
+    """Multi-resolution min/max decimation of traces.
+
+    The level `k >= 1` of the pyramid contains the minimum and maximum of
+    the traces in successive bins of `factor ** k` samples. Every level is
+    computed lazily, block by block, from the level below (or from the raw
+    traces for the first level). Levels can be cached in `.npy` files
+    next to the recording.
+
+    The decimated traces must match the traces shown at full resolution.
+    If these are filtered or scaled, the same `transform` must be passed to
+    the pyramid. It is applied to chunks of raw traces extended by `margin`
+    samples on both sides, to absorb the filter transients.
+
+    The cache files are reused only if the metadata saved along with them
+    (dtype, shape, decimation parameters, `key`, and the path, size and
+    modification time of the memory-mapped recording) match. Otherwise,
+    they are recomputed.
+
+    Parameters
+    ----------
+
+    traces : array
+        An `(n_samples, n_channels)` array, typically memory-mapped.
+    path : str
+        Prefix of the cache files, typically the path to the recording. By
+        default, the pyramid is kept in memory.
+    factor : int
+        Ratio between the bin sizes of two successive levels.
+    block_size : int
+        Number of bins computed at once.
+    transform : function
+        Function `raw_traces => traces` applied to chunks of raw traces,
+        for example a filter and a scaling. It must not change the shape.
+    margin : int
+        Number of samples added on each side of the chunks passed to
+        `transform`.
+    dtype : dtype
+        Data type of the pyramid. By default, the data type of the traces,
+        or `float32` if there is a transform.
+    key : str
+        String identifying the traces and the transform, for example the
+        filter parameters. It is saved in the cache metadata. The traces
+        that are not memory-mapped from a file are only identified by
+        this key.
+
+    """
+    def __init__(self, traces, path=None, factor=4, block_size=1024,
+                 transform=None, margin=0, dtype=None, key=None):
+        assert traces.ndim == 2
+        assert factor >= 2
+        assert margin >= 0
+        self.traces = traces
+        self.n_samples, self.n_channels = traces.shape
+        self.path = path
+        self.factor = factor
+        self.block_size = block_size
+        self.transform = transform
+        self.margin = margin if transform is not None else 0
+        if dtype is None:
+            dtype = traces.dtype if transform is None else np.float32
+        self.dtype = np.dtype(dtype)
+        self.key = key
+        # Bin size of the coarsest level: one bin for the whole recording.
+        self.n_levels = 1
+        while factor ** self.n_levels < self.n_samples:
+            self.n_levels += 1
+        # Dictionary `{level: (minmax_array, done_array)}`.
+        self._levels = {}
+        self._lock = Lock()
+        if self.path is not None:
+            self._check_cache()
+
+    def _metadata(self):
+        return {'dtype': self.dtype.str,
+                'shape': [self.n_samples, self.n_channels],
+                'factor': self.factor,
+                'block_size': self.block_size,
+                'margin': self.margin,
+                'key': self.key,
+                'source': _source_id(self.traces),
+                }
+
+    def _check_cache(self):
+        """Delete the cache files if they were computed from other traces
+        or with other parameters."""
+        path = self.path + '.minmax.json'
+        metadata = self._metadata()
+        if op.exists(path) and _load_json(path) == metadata:
+            return
+        for level_path in glob(self.path + '.minmax*.npy'):
+            logger.debug("Delete the outdated min/max cache file `%s`.",
+                         level_path)
+            os.remove(level_path)
+        _save_json(path, metadata)
+
+    def _raw(self, start, end):
+        """Return the raw traces between two samples, after the
+        transform."""
+        if self.transform is None:
+            return self.traces[start:end]
+        s0 = max(0, start - self.margin)
+        s1 = min(self.n_samples, end + self.margin)
+        x = self.transform(np.asarray(self.traces[s0:s1]))
+        return x[start - s0:end - s0]
+
+    def bin_size(self, level):
+        """Number of samples in every bin of a level."""
+        return self.factor ** level
+
+    def _level_path(self, level, suffix=''):
+        return '{}.minmax{}{}.npy'.format(self.path, self.bin_size(level),
+                                          suffix)
+
+    def _open_level(self, level):
+        """Return the min/max array of a level, and the array of flags
+        telling which blocks have been computed."""
+        if level in self._levels:
+            return self._levels[level]
+        n_bins = -(-self.n_samples // self.bin_size(level))
+        n_blocks = -(-n_bins // self.block_size)
+        shape = (n_bins, 2, self.n_channels)
+        dtype = self.dtype
+        if self.path is None:
+            arrs = (np.empty(shape, dtype=dtype),
+                    np.zeros(n_blocks, dtype=np.bool_))
+        elif op.exists(self._level_path(level, '.done')):
+            arrs = (read_array(self._level_path(level), mmap_mode='r+'),
+                    read_array(self._level_path(level, '.done'),
+                               mmap_mode='r+'))
+            assert arrs[0].shape == shape
+            assert arrs[0].dtype == dtype
+        else:
+            logger.debug("Create the min/max cache file `%s`.",
+                         self._level_path(level))
+            open_memmap = np.lib.format.open_memmap
+            arrs = (open_memmap(self._level_path(level), mode='w+',
+                                dtype=dtype, shape=shape),
+                    open_memmap(self._level_path(level, '.done'), mode='w+',
+                                dtype=np.bool_, shape=(n_blocks,)))
+            arrs[1][:] = False
+        self._levels[level] = arrs
+        return arrs
+
+    def _compute_block(self, level, block):
+        """Compute a block of a level."""
+        minmax, _ = self._open_level(level)
+        b0 = block * self.block_size
+        b1 = min(b0 + self.block_size, minmax.shape[0])
+        if level == 1:
+            s = self.bin_size(1)
+            x = self._raw(b0 * s, b1 * s)
+            minmax[b0:b1] = _minmax(np.asarray(x), s)
+            return
+        # Compute the block from the level below.
+        f = self.factor
+        below = self._get_bins(level - 1, b0 * f, b1 * f)
+        n = b1 - b0
+        if below.shape[0] < n * f:
+            # Pad the last bin with its last value.
+            pad = np.repeat(below[-1:], n * f - below.shape[0], axis=0)
+            below = np.concatenate((below, pad), axis=0)
+        below = below.reshape((n, f, 2, self.n_channels))
+        minmax[b0:b1, 0] = below[:, :, 0].min(axis=1)
+        minmax[b0:b1, 1] = below[:, :, 1].max(axis=1)
+
+    def _get_bins(self, level, start, end):
+        """Return the bins `[start, end)` of a level, computing the missing
+        blocks."""
+        minmax, done = self._open_level(level)
+        end = min(end, minmax.shape[0])
+        for block in range(start // self.block_size,
+                           -(-end // self.block_size)):
+            if not done[block]:
+                self._compute_block(level, block)
+                done[block] = True
+        return minmax[start:end]
+
+    def level_for(self, n_samples, n_bins):
+        """Return the finest level with at most `n_bins` bins in an interval
+        with `n_samples` samples. Level 0 means the raw traces."""
+        level = 0
+        while (n_samples > n_bins * self.bin_size(level) and
+               level < self.n_levels):
+            level += 1
+        return level
+
+    def get(self, start, end, n_bins):
+        """Return the min/max decimation of the traces between two samples,
+        with at most about `n_bins` bins.
+
+        Returns
+        -------
+
+        bunch : Bunch
+            With the following keys: `level`, `bin_size`, `samples`, and
+            `data`. `data` is an `(2 * n_bins, n_channels)` array with the
+            interleaved minimum and maximum of every bin. `samples` contains
+            the sample at the center of every bin, repeated twice. At level
+            0, `data` contains the raw traces, after the transform.
+
+        """
+        start, end = int(start), int(end)
+        level = self.level_for(end - start, n_bins)
+        if level == 0:
+            return Bunch(level=0, bin_size=1,
+                         samples=np.arange(start, end),
+                         data=self._raw(start, end))
+        s = self.bin_size(level)
+        b0, b1 = start // s, -(-end // s)
+        with self._lock:
+            minmax = np.array(self._get_bins(level, b0, b1))
+        n = minmax.shape[0]
+        samples = np.repeat(np.arange(b0, b0 + n) * s + s // 2, 2)
+        data = minmax.reshape((2 * n, self.n_channels))
+        return Bunch(level=level, bin_size=s, samples=samples, data=data)
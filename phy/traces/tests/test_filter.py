@@ -7,10 +7,15 @@
 # Imports
 #------------------------------------------------------------------------------
 
+import os.path as op
+
 import numpy as np
 from numpy.testing import assert_array_equal as ae
+from numpy.testing import assert_allclose as ac
 
-from ..filter import bandpass_filter, apply_filter, Filter, Whitening
+from phy.utils import ProgressReporter
+from ..filter import (bandpass_filter, apply_filter, apply_filter_chunked,
+                      Filter, Whitening)
 
 
 #------------------------------------------------------------------------------
@@ -41,6 +46,29 @@ def test_apply_filter():
         assert np.abs(x_filtered[k:-k]).max() <= .1
 
 
+def test_apply_filter_chunked(tempdir):
+    rate = 10000.
+    x = np.random.randn(50000, 3)
+    filter = Filter(rate=rate, low=300., high=3000., order=3)
+    expected = filter(x)
+
+    # In memory.
+    y = apply_filter_chunked(x, filter=filter._filter, chunk_size=7000,
+                             n_threads=2)
+    ac(y, expected, atol=1e-7)
+
+    # Short array: single chunk.
+    ac(filter.apply_chunked(x[:100]), filter(x[:100]))
+
+    # Memory-mapped output, with progress reporting.
+    pr = ProgressReporter()
+    path = op.join(tempdir, 'filtered.npy')
+    y = filter.apply_chunked(x, out=path, chunk_size=10000, pr=pr)
+    assert pr.is_complete()
+    assert pr.value_max >= 5
+    ac(np.load(path), expected, atol=1e-7)
+
+
 def test_whitening():
     x = np.random.uniform(size=(100, 10), low=0., high=1.)
     x[:, 1] += .25 * x[:, 0]
@@ -51,3 +79,34 @@ def test_whitening():
     y = w.transform(x)
 
     assert y.shape == x.shape
+
+
+def test_whitening_chunked(tempdir):
+    x = np.random.randn(10000, 8) + 3.
+    x[:, 1] += .25 * x[:, 0]
+    x[:, 5] += .5 * x[:, 0]
+
+    w = Whitening()
+    expected = w.fit(x)
+    # The default fit is already chunked, and the chunks are combined.
+    ac(expected, Whitening().fit(x, chunk_size=777), rtol=1e-10)
+    ac(expected, Whitening().fit(x, chunk_size=777, dtype=np.float32),
+       rtol=1e-3)
+
+    # Reference with np.cov().
+    d, v = np.linalg.eigh(np.cov(x, rowvar=0))
+    ac(expected, np.dot(np.dot(v, np.diag(1. / np.sqrt(d + 1e-18))), v.T))
+
+    # Excerpts.
+    pr = ProgressReporter()
+    Whitening().fit(x, n_excerpts=5, excerpt_size=500, pr=pr)
+    assert pr.is_complete()
+    assert pr.value_max == 5
+
+    # Chunked transform into a memory-mapped array.
+    path = op.join(tempdir, 'whitened.npy')
+    y = w.transform(x, out=path, chunk_size=1000)
+    ac(np.load(path), w.transform(x))
+    y = w.transform(x, chunk_size=1000)
+    ac(y, w.transform(x))
+    ac(np.cov(y, rowvar=0), np.eye(8), atol=1e-8)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Tests of the min/max decimation pyramid."""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+import os
+import os.path as op
+
+import numpy as np
+from numpy.testing import assert_array_equal as ae
+from numpy.testing import assert_allclose as ac
+
+from phy.io.mock import artificial_traces
+from ..filter import Filter
+from ..pyramid import _minmax, MinMaxPyramid
+
+
+#------------------------------------------------------------------------------
+# Tests
+#------------------------------------------------------------------------------
+
+def test_minmax():
+    x = np.array([[0, 5], [3, 1], [2, 2], [-1, 7], [4, 0]])
+    ae(_minmax(x, 2), [[[0, 1], [3, 5]],
+                       [[-1, 2], [2, 7]],
+                       [[4, 0], [4, 0]]])
+
+
+def _check_minmax(traces, b, start, end, atol=0):
+    s = b.bin_size
+    minmax = b.data.reshape((-1, 2, traces.shape[1]))
+    for i, sample in enumerate(b.samples[::2]):
+        x = traces[sample - s // 2:sample - s // 2 + s]
+        ac(minmax[i, 0], x.min(axis=0), atol=atol)
+        ac(minmax[i, 1], x.max(axis=0), atol=atol)
+    # The bins cover the interval.
+    assert b.samples[0] - s // 2 <= start
+    assert b.samples[-1] - s // 2 + s >= end
+
+
+def test_pyramid(tempdir):
+    n_samples, n_channels = 100003, 7
+    traces = (1000 * artificial_traces(n_samples, n_channels)).astype(np.int16)
+
+    path = op.join(tempdir, 'traces.dat')
+    pyramid = MinMaxPyramid(traces, path=path, block_size=16)
+    assert pyramid.level_for(1000, 1000) == 0
+    assert pyramid.level_for(1001, 1000) == 1
+    assert pyramid.level_for(n_samples, 1) == pyramid.n_levels
+
+    # Raw traces.
+    b = pyramid.get(100, 200, 1000)
+    assert b.level == 0
+    ae(b.data, traces[100:200])
+
+    # Only the required blocks are computed.
+    pyramid.get(1234, 5678, 100)
+    _, done = pyramid._open_level(1)
+    assert 0 < done.sum() < len(done)
+
+    for start, end, n_bins in ((1234, 5678, 100),
+                               (0, n_samples, 500),
+                               (n_samples - 10000, n_samples, 50),
+                               ):
+        b = pyramid.get(start, end, n_bins)
+        assert b.level >= 1
+        assert b.data.shape[0] <= 2 * (n_bins + 2)
+        assert b.data.shape == (len(b.samples), n_channels)
+        _check_minmax(traces, b, start, end)
+
+    # The levels are cached on disk.
+    assert op.exists(path + '.minmax4.npy')
+    cached = MinMaxPyramid(traces, path=path, block_size=16)
+    ae(cached.get(1234, 5678, 100).data, pyramid.get(1234, 5678, 100).data)
+    # The cache is reset when the traces or the transform change.
+    other = traces[::-1].copy()
+    ae(MinMaxPyramid(other, path=path, block_size=16,
+                     key='reversed').get(0, n_samples, 100).data,
+       MinMaxPyramid(other).get(0, n_samples, 100).data)
+    scaled = MinMaxPyramid(traces, path=path, block_size=16,
+                           transform=lambda x: 2 * x, dtype=np.int16,
+                           key='x2')
+    ae(scaled.get(0, n_samples, 100).data,
+       2 * MinMaxPyramid(traces).get(0, n_samples, 100).data)
+
+
+def test_pyramid_source(tempdir):
+    n_samples, n_channels = 10000, 3
+    path = op.join(tempdir, 'traces.npy')
+    traces = np.lib.format.open_memmap(path, mode='w+', dtype=np.int16,
+                                       shape=(n_samples, n_channels))
+    traces[:] = 1
+    traces.flush()
+    pyramid = MinMaxPyramid(traces, path=path)
+    assert pyramid.get(0, n_samples, 10).data.max() == 1
+
+    # Another recording with the same shape and dtype at the same path.
+    traces = np.lib.format.open_memmap(path, mode='w+', dtype=np.int16,
+                                       shape=(n_samples, n_channels))
+    traces[:] = 2
+    traces.flush()
+    os.utime(path, (0, 0))
+    pyramid = MinMaxPyramid(traces, path=path)
+    assert pyramid.get(0, n_samples, 10).data.max() == 2
+
+
+def test_pyramid_transform():
+    sr = 20000.
+    traces = artificial_traces(100000, 4)
+    fil = Filter(rate=sr, low=500., high=.45 * sr, order=3)
+    traces_f = fil(traces)
+
+    pyramid = MinMaxPyramid(traces, transform=fil, margin=2000,
+                            block_size=16)
+    assert pyramid.dtype == np.float32
+    b = pyramid.get(1000, 2000, 10000)
+    assert b.level == 0
+    ac(b.data, traces_f[1000:2000], atol=1e-6)
+
+    b = pyramid.get(0, traces.shape[0], 500)
+    assert b.level >= 1
+    _check_minmax(traces_f.astype(np.float32), b, 0, traces.shape[0],
+                  atol=1e-5)
@@ -8,6 +8,7 @@
 
 import numpy as np
 from numpy.testing import assert_array_equal as ae
+from numpy.testing import assert_allclose as ac
 from pytest import raises
 
 from phy.io.mock import (artificial_traces,
@@ -205,3 +206,31 @@ def test_loader_filter_3():
 
     w = loader.get([0], channels=[0])
     assert w.shape == (1, ns, 1)
+
+
+def test_loader_filter_matrix():
+    loader = waveform_loader(do_filter=True)
+    loader._batch_size = 7
+    channels = [4, 1]
+    spike_ids = [15, 0, 3, 4, 20, 7, 8, 9, 2]
+    mb, ma = loader._filter_margin
+
+    w = loader.get(spike_ids, channels)
+    times = loader.spike_samples[spike_ids]
+    w_f = loader._filter(loader._load_batch(times, channels), axis=1)
+    assert w.dtype == np.float32
+    ac(w, w_f[:, mb:-ma, :], atol=1e-5)
+
+
+def test_loader_batch():
+    loader = waveform_loader()
+    ns = loader.n_samples_trace
+    loader._max_read_size = 64
+
+    # Spikes close to the edges, overlapping, and unsorted.
+    times = [ns - 1, 0, 3, 500, 503, 505, 200, ns - 8]
+    channels = [4, 1]
+    w = loader._load_batch(times, channels)
+    assert w.shape == (len(times), loader.n_samples_waveforms, 2)
+    for i, t in enumerate(times):
+        ae(w[i], loader._load_at(t, channels))
@@ -9,6 +9,7 @@
 import logging
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from scipy.interpolate import interp1d
 
 from ..utils._types import _as_array, Bunch
@@ -227,6 +228,23 @@ class WaveformLoader(object):
         self._n_samples_extract = (self.n_samples_waveforms +
                                    sum(self._filter_margin))
 
+        # The filter is linear and all extracted chunks have the same
+        # length: filtering a chunk and removing the margin is a single
+        # matrix product. The columns of the matrix are the filtered
+        # impulses, without the margin.
+        self._filter_matrix = None
+        if filter_order:
+            eye = np.eye(self._n_samples_extract)
+            margin_before, margin_after = self._filter_margin
+            m = apply_filter(eye, b_filter, axis=0)
+            m = m[margin_before:self._n_samples_extract - margin_after]
+            self._filter_matrix = m.astype(np.float32)
+
+        # Maximum number of samples in a single read of the traces.
+        self._max_read_size = 2 ** 14
+        # Number of spikes loaded and filtered at once.
+        self._batch_size = 1024
+
         self.dtype = np.float32
         self.shape = (self.n_spikes, self._n_samples_extract, self.n_channels)
         self.ndim = 3
@@ -245,6 +263,18 @@ class WaveformLoader(object):
     def spike_samples(self):
         return self._spike_samples
 
+    def _filter_waveforms(self, waveforms, out):
+        """Filter a `(n_spikes, n_samples_extract, n_channels)` array
+        along the time axis, and write it without the filter margin
+        to `out`."""
+        if self._filter_matrix is not None:
+            np.matmul(self._filter_matrix, waveforms, out=out)
+            return
+        waveforms = self._filter(waveforms, axis=1)
+        margin_before, margin_after = self._filter_margin
+        out[...] = waveforms[:, margin_before:waveforms.shape[1] -
+                             margin_after, :]
+
     def _load_at(self, time, channels=None):
         """Load a waveform at a given time."""
         if channels is None:
@@ -268,6 +298,63 @@ class WaveformLoader(object):
         assert extract.shape[0] == self._n_samples_extract
         return extract
 
+    def _load_batch(self, times, channels=None):
+        """Load the waveforms at several times.
+
+        The times are sorted and nearby spikes are grouped so that each group
+        is loaded with a single contiguous read of the traces. The waveforms
+        are then extracted from a strided view on the chunk. The samples
+        outside the traces are set to zero.
+
+        Return a `(n_spikes, n_samples_extract, n_channels)` array.
+
+        """
+        if channels is None:
+            channels = slice(None, None, None)
+        ns = self.n_samples_trace
+        n = self._n_samples_extract
+        before = self.n_samples_before_after[0] + self._filter_margin[0]
+        starts = np.asarray(times, dtype=np.int64) - before
+        nc = len(np.arange(self.n_channels)[channels])
+        out = np.zeros((len(starts), n, nc), dtype=np.float32)
+        if not len(starts):
+            return out
+        order = np.argsort(starts, kind='mergesort')
+        starts_s = starts[order]
+        # Spikes are usually requested in increasing order: in this case
+        # the waveforms are written directly to the output array.
+        is_sorted = np.all(order[1:] > order[:-1])
+        # Start a new read when the gap with the previous spike is larger
+        # than a waveform, or when the read would become too large.
+        cuts = ((np.diff(starts_s) > n) |
+                (np.diff(starts_s // self._max_read_size) != 0))
+        bounds = np.concatenate([[0], np.flatnonzero(cuts) + 1,
+                                 [len(starts_s)]])
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            # Contiguous read covering all waveforms in the group.
+            g_start, g_stop = starts_s[i], starts_s[j - 1] + n
+            read_start, read_stop = max(0, g_start), min(ns, g_stop)
+            if read_start >= read_stop:  # pragma: no cover
+                continue
+            chunk = self._traces[read_start:read_stop][:, channels]
+            chunk = chunk.astype(np.float32)
+            # Zero-pad the chunk when the group is close to the edges.
+            if g_start < read_start or read_stop < g_stop:
+                padded = np.zeros((g_stop - g_start, nc), dtype=np.float32)
+                padded[read_start - g_start:read_stop - g_start] = chunk
+                chunk = padded
+            # View of all windows of n samples in the chunk, without copy.
+            windows = as_strided(chunk,
+                                 shape=(len(chunk) - n + 1, n, nc),
+                                 strides=(chunk.strides[0],) + chunk.strides,
+                                 )
+            idx = starts_s[i:j] - g_start
+            if is_sorted:
+                out[i:j] = windows[idx]
+            else:
+                out[order[i:j]] = windows[idx]
+        return out
+
     def get(self, spike_ids, channels=None):
         """Load the waveforms of the specified spikes."""
         if isinstance(spike_ids, slice):
@@ -289,52 +376,42 @@ class WaveformLoader(object):
         spike_ids = _as_array(spike_ids)
         n_spikes = len(spike_ids)
 
-        # Initialize the array.
-        # NOTE: last dimension is time to simplify things.
-        shape = (n_spikes, nc, self._n_samples_extract)
-        waveforms = np.zeros(shape, dtype=np.float32)
-
         # No traces: return null arrays.
         if self.n_samples_trace == 0:
-            return np.transpose(waveforms, (0, 2, 1))
-
-        # Load all spikes.
-        for i, spike_id in enumerate(spike_ids):
-            assert 0 <= spike_id < self.n_spikes
-            time = self._spike_samples[spike_id]
-
-            # Extract the waveforms on the unmasked channels.
-            try:
-                w = self._load_at(time, channels)
-            except ValueError as e:  # pragma: no cover
-                logger.warn("Error while loading waveform: %s", str(e))
-                continue
-
-            assert w.shape == (self._n_samples_extract, nc)
-
-            waveforms[i, :, :] = w.T
-
-        # Filter the waveforms.
-        waveforms_f = waveforms.reshape((-1, self._n_samples_extract))
-        # Only filter the non-zero waveforms.
-        unmasked = waveforms_f.max(axis=1) != 0
-        waveforms_f[unmasked] = self._filter(waveforms_f[unmasked], axis=1)
-        waveforms_f = waveforms_f.reshape((n_spikes, nc,
-                                           self._n_samples_extract))
-
-        # Remove the margin.
-        margin_before, margin_after = self._filter_margin
-        if margin_after > 0:
-            assert margin_before >= 0
-            waveforms_f = waveforms_f[:, :, margin_before:-margin_after]
-
-        assert waveforms_f.shape == (n_spikes,
-                                     nc,
-                                     self.n_samples_waveforms,
-                                     )
-
-        # NOTE: we transpose before returning the array.
-        return np.transpose(waveforms_f, (0, 2, 1))
+            return np.zeros((n_spikes, self._n_samples_extract, nc),
+                            dtype=np.float32)
+
+        assert np.all((0 <= spike_ids) & (spike_ids < self.n_spikes))
+        times = np.asarray(self._spike_samples)[spike_ids].astype(np.int64)
+
+        # Skip the spikes outside the traces.
+        valid = (0 <= times) & (times < self.n_samples_trace)
+        if not valid.all():  # pragma: no cover
+            logger.warn("Error while loading waveforms: invalid times %s.",
+                        times[~valid])
+
+        # Load and filter the spikes by batches, so that the unfiltered
+        # waveforms of a batch stay in the CPU cache.
+        # shape: (n_spikes, n_samples_waveforms, nc)
+        waveforms = np.zeros((n_spikes, self.n_samples_waveforms, nc),
+                             dtype=np.float32)
+        for i in range(0, n_spikes, self._batch_size):
+            s = slice(i, i + self._batch_size)
+            v = valid[s]
+            w = self._load_batch(times[s][v], channels)
+            if v.all():
+                self._filter_waveforms(w, out=waveforms[s])
+            else:  # pragma: no cover
+                out = np.empty((len(w),) + waveforms.shape[1:],
+                               dtype=np.float32)
+                self._filter_waveforms(w, out=out)
+                waveforms[s][v] = out
+
+        assert waveforms.shape == (n_spikes,
+                                   self.n_samples_waveforms,
+                                   nc,
+                                   )
+        return waveforms
 
     def __getitem__(self, spike_ids):
         return self.get(spike_ids)
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+
+"""Benchmarks of the performance-critical routines.
+
+These benchmarks are not part of the test suite. Run all of them with
+`python tools/bench.py`, or some of them with
+`python tools/bench.py concatenated_arrays ...`.
+
+"""
+
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import gc
+import os.path as op
+import re
+import sys
+
+import numpy as np
+
+import phy
+from phy.cluster.clustering import Clustering
+from phy.io.array import (_concatenate_virtual_arrays,
+                          _in_polygon,
+                          grouped_mean,
+                          read_array,
+                          write_array,
+                          )
+from phy.io.mock import (artificial_features,
+                         artificial_masks,
+                         artificial_spike_clusters,
+                         artificial_traces,
+                         )
+from phy.plot import base
+from phy.plot.base import ProgramCache
+from phy.plot.plot import View
+from phy.stats.clusters import get_mean_masked_features_top_k
+from phy.stats.ccg import (_correlograms_shift,
+                           _correlograms_sorted,
+                           _create_correlograms_array,
+                           )
+from phy.traces import MinMaxPyramid
+from phy.traces.waveform import WaveformLoader
+from phy.utils import Bunch
+from phy.utils.tempdir import TemporaryDirectory
+from phy.utils.testing import benchmark
+
+
+#------------------------------------------------------------------------------
+# Benchmarks
+#------------------------------------------------------------------------------
+
+_BENCHMARKS = OrderedDict()
+
+
+def _register(f):
+    _BENCHMARKS[f.__name__[len('bench_'):]] = f
+    return f
+
+
+@_register
+def bench_concatenated_arrays():
+    n_samples, n_channels = 1000, 32
+    for n_arrs in (2, 50, 500):
+        with TemporaryDirectory() as tempdir:
+            arrs = []
+            for i in range(n_arrs):
+                path = op.join(tempdir, '%d.npy' % i)
+                write_array(path, np.random.rand(n_samples, n_channels))
+                arrs.append(read_array(path, mmap_mode='r'))
+            c = _concatenate_virtual_arrays(arrs)
+            n = len(c)
+
+            with benchmark('Slicing %d arrays' % n_arrs, repeats=100):
+                for i in range(100):
+                    start = (i * 7919) % (n - 1500)
+                    c[start:start + 1500]
+
+            idx = np.random.randint(0, n, size=10000)
+            with benchmark('Gathering from %d arrays' % n_arrs):
+                c[idx]
+            del arrs, c
+
+
+@_register
+def bench_waveform_loader():
+    n_samples_trace, n_channels = 100000, 32
+    n_spikes = 50000
+    traces = artificial_traces(n_samples_trace, n_channels)
+    spike_samples = np.sort(np.random.randint(0, n_samples_trace,
+                                              size=n_spikes))
+    for filter_order in (None, 3):
+        loader = WaveformLoader(traces=traces,
+                                spike_samples=spike_samples,
+                                n_samples_waveforms=40,
+                                filter_order=filter_order,
+                                sample_rate=20000.,
+                                )
+        with benchmark('Loading %d waveforms, filter order %s' %
+                       (n_spikes, filter_order)):
+            loader.get(slice(None, None, None))
+
+
+@_register
+def bench_ccg():
+    # Sparse spikes with a few long bursts.
+    n_spikes, n_clusters = 10000, 10
+    spike_samples = np.cumsum(np.random.exponential(scale=.025,
+                                                    size=n_spikes))
+    spike_samples = (spike_samples * 20000).astype(np.int64)
+    spike_clusters = np.random.randint(0, n_clusters, n_spikes)
+    bursts = np.random.randint(0, spike_samples.max(), 5)
+    bursts = (bursts[:, np.newaxis] + 10 * np.arange(500)).ravel()
+    spike_samples = np.r_[spike_samples, bursts]
+    spike_clusters = np.r_[spike_clusters, np.zeros(len(bursts), np.int64)]
+    # Sort the spikes, keeping the clusters aligned with their spikes.
+    order = np.argsort(spike_samples, kind='mergesort')
+    spike_samples = spike_samples[order]
+    spike_clusters = spike_clusters[order]
+    binsize, winsize_bins = 20, 1001
+    for name, f in (('shift', _correlograms_shift),
+                    ('sorted', _correlograms_sorted)):
+        c = _create_correlograms_array(n_clusters, winsize_bins)
+        with benchmark('CCG with the %s engine' % name):
+            f(c, spike_samples, spike_clusters, binsize, winsize_bins)
+
+
+def _random_actions(clustering, n_actions):
+    """Perform random merges and splits."""
+    n_spikes = clustering.n_spikes
+    for i in range(n_actions):
+        if i % 2 == 0 and clustering.n_clusters >= 2:
+            clusters = np.random.choice(clustering.cluster_ids, 2,
+                                        replace=False)
+            clustering.merge(clusters)
+        else:
+            spikes = np.unique(np.random.randint(0, n_spikes, 20))
+            clustering.split(spikes)
+
+
+@_register
+def bench_clustering_undo():
+    n_spikes = 100000
+    spike_clusters = artificial_spike_clusters(n_spikes, 1000)
+    clustering = Clustering(spike_clusters)
+
+    for n_actions in (10, 100, 400):
+        _random_actions(clustering, n_actions)
+        with benchmark('Undo after %d actions' % n_actions):
+            clustering.undo()
+        clustering.redo()
+
+
+@_register
+def bench_clustering_actions():
+    # The latency of an action should not depend on the number of spikes.
+    for n_spikes in (10000, 100000, 1000000):
+        spike_clusters = artificial_spike_clusters(n_spikes, 1000)
+        clustering = Clustering(spike_clusters)
+        spikes = clustering.spikes_per_cluster[30][:2]
+
+        with benchmark('Merge with %d spikes' % n_spikes):
+            clustering.merge([10, 20])
+        with benchmark('Split with %d spikes' % n_spikes):
+            clustering.split(spikes)
+        with benchmark('Undo with %d spikes' % n_spikes):
+            clustering.undo()
+
+
+@_register
+def bench_pyramid():
+    traces = artificial_traces(2000000, 32).astype(np.float32)
+    pyramid = MinMaxPyramid(traces)
+    with benchmark('Min/max pyramid, first query'):
+        pyramid.get(0, traces.shape[0], 1000)
+    with benchmark('Min/max pyramid, second query'):
+        pyramid.get(0, traces.shape[0], 1000)
+
+
+@_register
+def bench_top_k_distances():
+    n_clusters, n_channels, nfpc = 1000, 28, 4
+    mf = artificial_features(n_clusters, n_channels, nfpc)
+    mm = artificial_masks(n_clusters, n_channels)
+    with benchmark('Top-10 masked features distances of %d clusters' %
+                   n_clusters):
+        get_mean_masked_features_top_k(mf, mm, nfpc, k=10)
+
+
+@_register
+def bench_grouped_mean():
+    n_spikes, n_clusters = 1000000, 100
+    spike_clusters = artificial_spike_clusters(n_spikes, n_clusters)
+    arr = np.random.randn(n_spikes)
+    with benchmark('Grouped mean of %d spikes' % n_spikes):
+        grouped_mean(arr, spike_clusters)
+
+
+@_register
+def bench_lasso():
+    # Star polygon with 50 vertices.
+    n_vertices = 50
+    t = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    r = .2 * np.where(np.arange(n_vertices) % 2, .3, .9)
+    polygon = np.c_[r * np.cos(t), r * np.sin(t)]
+    points = np.random.randn(1000000, 2)
+    with benchmark('Lasso on %d points' % len(points)):
+        _in_polygon(points, polygon)
+
+
+#------------------------------------------------------------------------------
+# View builds with a mocked gloo
+#------------------------------------------------------------------------------
+
+class _MockVertexBuffer(object):
+    """Vertex buffer keeping its data in memory."""
+    n_created = 0
+
+    def __init__(self, data):
+        _MockVertexBuffer.n_created += 1
+        self._data = np.array(data)
+
+    def set_subdata(self, data):
+        self._data[:len(data)] = data
+
+    def __getitem__(self, item):
+        return self
+
+
+class _MockProgram(object):
+    """Program keeping its shaders and variables in memory.
+
+    Attributes are copied into a new vertex buffer every time they are set,
+    like in gloo.
+
+    """
+    n_created = 0
+
+    def __init__(self, vertex, fragment):
+        _MockProgram.n_created += 1
+        self.shaders = [vertex, fragment]
+        decl = r'(attribute|uniform|varying)\s+\w+\s+(\w+)'
+        self._code_variables = {name: (kind,) for kind, name in
+                                re.findall(decl, vertex + fragment)}
+        self._data = {}
+
+    def __setitem__(self, name, data):
+        if (self._code_variables.get(name, ('',))[0] == 'attribute' and
+                isinstance(data, np.ndarray)):
+            data = _MockVertexBuffer(data)
+        self._data[name] = data
+
+    def __getitem__(self, name):
+        return self._data[name]
+
+    def draw(self, *args):
+        pass
+
+
+@contextmanager
+def _mock_gloo():
+    """Replace the gloo programs and vertex buffers used by the views."""
+    program, gloo = base.Program, base.gloo
+    # phy's Program keeps its persistent vertex buffers on top of the
+    # mocked gloo program.
+    base.Program = type('Program', (_MockProgram,),
+                        {k: v for k, v in program.__dict__.items()
+                         if k not in ('__dict__', '__weakref__')})
+    base.gloo = Bunch(VertexBuffer=_MockVertexBuffer, clear=lambda: None)
+    try:
+        yield
+    finally:
+        base.Program, base.gloo = program, gloo
+
+
+class _NoProgramCache(ProgramCache):
+    def insert_glsl(self, inserter, vertex, fragment):
+        return inserter.insert_into_shaders(vertex, fragment)
+
+    def get(self, vertex, fragment, visual, visible=()):
+        return _MockProgram(vertex, fragment)
+
+
+class _RebuildView(View):
+    """View creating new visuals and programs at every build, as it did
+    before the visuals were reused between builds."""
+    def __init__(self, *args, **kwargs):
+        super(_RebuildView, self).__init__(*args, **kwargs)
+        self.program_cache = _NoProgramCache()
+
+    def _get_visual(self, cls):
+        visual = cls()
+        self.add_visual(visual)
+        return visual
+
+
+def _features(n_spikes):
+    return [np.random.randn(n_spikes, 2) for _ in range(16)]
+
+
+def _build_features(view, features):
+    with view.building():
+        for k, pos in enumerate(features):
+            view[k // 4, k % 4].scatter(pos=pos, size=5)
+
+
+def _waveforms(n_spikes, n_channels=32, n_samples=40):
+    return [np.random.randn(n_spikes * n_channels, n_samples)
+            for _ in range(2)]
+
+
+def _build_waveforms(view, waveforms):
+    n_channels = len(view.boxed.box_pos)
+    n, n_samples = waveforms[0].shape
+    t = np.tile(np.linspace(-1., 1., n_samples), (n, 1))
+    box_index = np.tile(np.repeat(np.arange(n_channels), n_samples),
+                        n // n_channels)
+    with view.building():
+        for wave, color in zip(waveforms,
+                               ((1., 0., 0., .5), (0., 1., 0., .5))):
+            view.uplot(x=t, y=wave, color=color, box_index=box_index)
+
+
+@_register
+def bench_view_build():
+    n_channels = 32
+    box_pos = np.c_[np.zeros(n_channels), np.linspace(-1, 1, n_channels)]
+    views = (('feature', _features, _build_features,
+              dict(layout='grid', shape=(4, 4))),
+             ('waveform', _waveforms, _build_waveforms,
+              dict(layout='boxed', box_pos=box_pos)),
+             )
+    # Number of spikes in the successive selections.
+    selections = (1000, 200, 1000, 500, 2000, 100)
+    with _mock_gloo():
+        for name, get_data, build, kwargs in views:
+            data = [get_data(n_spikes) for n_spikes in selections]
+            for cls, how in ((_RebuildView, 'rebuild'), (View, 'reuse')):
+                view = cls(**kwargs)
+                build(view, data[0])
+                n_programs = _MockProgram.n_created
+                n_buffers = _MockVertexBuffer.n_created
+                for n_spikes, d in zip(selections[1:], data[1:]):
+                    # Free the previous visuals outside of the timings.
+                    gc.collect()
+                    with benchmark('%s view, %s, %d spikes' %
+                                   (name.capitalize(), how, n_spikes)):
+                        build(view, d)
+                print("%s view, %s: %d programs and %d vertex buffers "
+                      "created in %d builds." %
+                      (name.capitalize(), how,
+                       _MockProgram.n_created - n_programs,
+                       _MockVertexBuffer.n_created - n_buffers,
+                       len(selections) - 1))
+                view.close()
+
+
+#------------------------------------------------------------------------------
+# Entry point
+#------------------------------------------------------------------------------
+
+def main(names=None):
+    names = names or list(_BENCHMARKS)
+    unknown = set(names) - set(_BENCHMARKS)
+    if unknown:
+        print("Unknown benchmarks: %s." % ', '.join(sorted(unknown)))
+        print("Available benchmarks: %s." % ', '.join(_BENCHMARKS))
+        return 1
+    phy.add_default_handler('INFO')
+    np.random.seed(0)
+    for name in names:
+        _BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))